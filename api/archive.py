@@ -0,0 +1,273 @@
+"""
+Local archive of every CloudWatch series we fetch, as Parquet files
+partitioned by account, IST date and metric:
+
+    <root>/account=<account>/date=<YYYY-MM-DD>/metric=<metric>/part-<ns>-<id>.parquet
+
+Each part records, in its file metadata, which host windows it covers, so a
+later report can tell whether the archive holds a window in full and skip
+CloudWatch for it. A write merges the new batch into what the partition
+already holds and replaces it with a single part, so refetched windows do
+not pile up as duplicate rows. CloudWatch keeps 5-minute data for 63 days;
+the archive keeps it for retention_days.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from urllib.parse import quote
+
+from rollups import split_by_day
+from scheduler import IST
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+COVERAGE_KEY = b"nubinix.coverage"
+
+# How often append() looks for date partitions past the retention bound
+PRUNE_INTERVAL_SECONDS = 3600
+
+
+def _schema():
+    return pa.schema([
+        ("host", pa.string()),
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("value", pa.float64()),
+        ("unit", pa.string()),
+    ])
+
+
+def _merge_windows(windows):
+    merged = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class MetricArchive:
+    """
+    Writes fetched series in batches and answers window queries from disk.
+
+    Disabled (every call a no-op or miss) when pyarrow is not installed.
+    """
+
+    def __init__(self, root, settle_seconds=600, cache_partitions=64, retention_days=None):
+        self.root = root
+        self.settle_seconds = settle_seconds
+        self.enabled = pa is not None
+        self.cache_partitions = cache_partitions
+        self.retention_days = retention_days
+        self._tables = OrderedDict()
+        self._coverage = {}
+        self._lock = threading.Lock()
+        self._partition_locks = {}
+        self._pruned_at = None
+
+    def _partition_lock(self, partition):
+        with self._lock:
+            return self._partition_locks.setdefault(partition, threading.Lock())
+
+    def _partition(self, account, day, metric):
+        # Metric keys include disk paths such as "disk /var"
+        return os.path.join(self.root, f"account={account}", f"date={day.isoformat()}",
+                            f"metric={quote(metric, safe='')}")
+
+    def _parts(self, partition):
+        try:
+            names = os.listdir(partition)
+        except FileNotFoundError:
+            return ()
+        return tuple(sorted(name for name in names if name.endswith(".parquet")))
+
+    def append(self, account, metric, fetched):
+        """
+        Archive one batch for a metric. fetched is a list of
+        (host, start, end, datapoints); each IST day it touches is rewritten
+        as one part holding the old and new rows.
+        """
+        if not self.enabled or not fetched:
+            return
+        # Datapoints newer than this may still be arriving, so are not claimed as covered
+        settled = time.time() - self.settle_seconds
+        days = {}
+        for host, start_time, end_time, datapoints in fetched:
+            for piece_start, piece_end, _ in split_by_day(start_time, end_time):
+                day = days.setdefault(piece_start.astimezone(IST).date(), {"rows": [], "windows": []})
+                covered_end = min(piece_end.timestamp(), settled)
+                if covered_end > piece_start.timestamp():
+                    day["windows"].append([host, piece_start.timestamp(), covered_end])
+                day["rows"].extend(
+                    (host, point['Timestamp'], point['Average'], point.get('Unit', 'Percent'))
+                    for point in datapoints
+                    if piece_start <= point['Timestamp'] < piece_end
+                )
+        for day, batch in days.items():
+            self._merge(self._partition(account, day, metric), batch["rows"], batch["windows"])
+        self._prune_if_due()
+
+    def _merge(self, partition, rows, windows):
+        with self._partition_lock(partition):
+            parts = self._parts(partition)
+            if parts:
+                # Rows fetched now replace archived ones for the same host and timestamp
+                merged = {(row["host"], row["timestamp"]): (row["host"], row["timestamp"], row["value"], row["unit"])
+                          for host_rows in self._partition_table(partition, parts).values() for row in host_rows}
+                merged.update(((row[0], row[1]), row) for row in rows)
+                rows = list(merged.values())
+                windows = windows + [[host, start, end]
+                                     for host, host_windows in self._partition_coverage(partition, parts).items()
+                                     for start, end in host_windows]
+            by_host = {}
+            for host, start, end in windows:
+                by_host.setdefault(host, []).append((start, end))
+            windows = [[host, start, end] for host, host_windows in by_host.items()
+                       for start, end in _merge_windows(host_windows)]
+            self._write(partition, rows, windows)
+            for name in parts:
+                try:
+                    os.remove(os.path.join(partition, name))
+                except FileNotFoundError:
+                    pass
+
+    def _write(self, partition, rows, windows):
+        os.makedirs(partition, exist_ok=True)
+        columns = list(zip(*rows)) if rows else [[], [], [], []]
+        table = pa.Table.from_arrays([pa.array(column, type=field.type)
+                                      for column, field in zip(columns, _schema())], schema=_schema())
+        table = table.replace_schema_metadata({COVERAGE_KEY: json.dumps(windows).encode()})
+        name = f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+        tmp_path = os.path.join(partition, f".{name}.tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, os.path.join(partition, name))
+
+    def _prune_if_due(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._pruned_at is not None and now - self._pruned_at < PRUNE_INTERVAL_SECONDS:
+                return
+            self._pruned_at = now
+        try:
+            self.prune()
+        except OSError as e:
+            print(f"Error pruning metric archive: {str(e)}")
+
+    def prune(self, today=None):
+        """Delete date partitions older than retention_days; returns how many went."""
+        if not self.retention_days:
+            return 0
+        cutoff = (today or datetime.now(IST).date()) - timedelta(days=self.retention_days)
+        removed = []
+        try:
+            accounts = os.listdir(self.root)
+        except FileNotFoundError:
+            return 0
+        for account in accounts:
+            if not account.startswith("account="):
+                continue
+            for name in os.listdir(os.path.join(self.root, account)):
+                try:
+                    day = date.fromisoformat(name.removeprefix("date="))
+                except ValueError:
+                    continue
+                if day < cutoff:
+                    path = os.path.join(self.root, account, name)
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed.append(path + os.sep)
+        if removed:
+            with self._lock:
+                for partition in [p for p in self._coverage if p.startswith(tuple(removed))]:
+                    del self._coverage[partition]
+                    self._partition_locks.pop(partition, None)
+        return len(removed)
+
+    def _partition_coverage(self, partition, parts):
+        with self._lock:
+            cached = self._coverage.get(partition)
+            if cached is not None and cached[0] == parts:
+                return cached[1]
+        coverage = {}
+        for name in parts:
+            metadata = pq.read_schema(os.path.join(partition, name)).metadata or {}
+            for host, start, end in json.loads(metadata.get(COVERAGE_KEY, b"[]")):
+                coverage.setdefault(host, []).append((start, end))
+        coverage = {host: _merge_windows(windows) for host, windows in coverage.items()}
+        with self._lock:
+            self._coverage[partition] = (parts, coverage)
+        return coverage
+
+    def _partition_table(self, partition, parts):
+        key = (partition, parts)
+        with self._lock:
+            table = self._tables.get(key)
+            if table is not None:
+                self._tables.move_to_end(key)
+                return table
+        # Later parts win when the same host and timestamp were archived twice,
+        # e.g. by two processes before either compacted the partition
+        rows = {}
+        for name in parts:
+            for row in pq.read_table(os.path.join(partition, name)).to_pylist():
+                rows[(row["host"], row["timestamp"])] = row
+        table = {}
+        for row in rows.values():
+            table.setdefault(row["host"], []).append(row)
+        with self._lock:
+            self._tables[key] = table
+            while len(self._tables) > self.cache_partitions:
+                self._tables.popitem(last=False)
+        return table
+
+    def covers(self, account, host, metric, start_time, end_time):
+        if not self.enabled:
+            return False
+        for piece_start, piece_end, _ in split_by_day(start_time, end_time):
+            partition = self._partition(account, piece_start.astimezone(IST).date(), metric)
+            parts = self._parts(partition)
+            if not parts:
+                return False
+            windows = self._partition_coverage(partition, parts).get(host, [])
+            if not any(start <= piece_start.timestamp() and piece_end.timestamp() <= end
+                       for start, end in windows):
+                return False
+        return True
+
+    def query(self, account, metric, start_time, end_time, hosts=None):
+        """Archived datapoints in [start_time, end_time) as {host: [datapoint, ...]}."""
+        result = {}
+        if not self.enabled:
+            return result
+        for piece_start, piece_end, _ in split_by_day(start_time, end_time):
+            partition = self._partition(account, piece_start.astimezone(IST).date(), metric)
+            parts = self._parts(partition)
+            if not parts:
+                continue
+            for host, rows in self._partition_table(partition, parts).items():
+                if hosts is not None and host not in hosts:
+                    continue
+                result.setdefault(host, []).extend(
+                    {"Timestamp": row["timestamp"], "Average": row["value"], "Unit": row["unit"]}
+                    for row in rows
+                    if piece_start <= row["timestamp"] < piece_end
+                )
+        return result
+
+    def read(self, account, host, metric, start_time, end_time):
+        """
+        The archived series for a window, or None when the archive does not
+        hold all of it.
+        """
+        if not self.covers(account, host, metric, start_time, end_time):
+            return None
+        return self.query(account, metric, start_time, end_time, hosts={host}).get(host, [])
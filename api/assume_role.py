@@ -0,0 +1,94 @@
+"""
+Process-wide cache of sts:AssumeRole credentials, shared with other worker
+processes on the host through small JSON files.
+
+Entries are keyed by role ARN and session policy, plus a digest of the
+caller's own keys so that one caller never receives credentials for a role
+it could not assume itself. Credentials are refreshed once they are within
+refresh_ahead seconds of expiring; a file lock makes sure only one process
+performs that refresh.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+def cache_key(source_digest, role_arn, session_policy=None, external_id=None):
+    document = json.dumps([source_digest, role_arn, session_policy or "", external_id or ""])
+    return hashlib.sha256(document.encode()).hexdigest()
+
+
+class AssumedRoleCache:
+    """
+    assume(role_arn, session_policy, external_id, duration) performs the STS
+    call with the caller's keys and returns its Credentials block.
+    """
+
+    def __init__(self, directory, duration=3600, refresh_ahead=600):
+        self.directory = directory
+        self.duration = duration
+        self.refresh_ahead = refresh_ahead
+        self.assumed = 0
+        self._entries = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def _fresh(self, entry):
+        return entry is not None and entry["Expiration"] - time.time() > self.refresh_ahead
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _read(self, key):
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write(self, key, entry):
+        tmp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._path(key))
+
+    @contextmanager
+    def _exclusive(self, key):
+        with self._lock:
+            thread_lock = self._locks.setdefault(key, threading.Lock())
+        with thread_lock:
+            fd = os.open(f"{self._path(key)}.lock", os.O_WRONLY | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def credentials(self, source_digest, role_arn, assume, session_policy=None, external_id=None):
+        """Return {"AccessKeyId", "SecretAccessKey", "SessionToken", "Expiration" (epoch seconds)}."""
+        key = cache_key(source_digest, role_arn, session_policy, external_id)
+        entry = self._entries.get(key)
+        if self._fresh(entry):
+            return entry
+        with self._exclusive(key):
+            # Another thread or process may have refreshed it while we waited
+            entry = self._read(key)
+            if not self._fresh(entry):
+                response = assume(role_arn, session_policy, external_id, self.duration)
+                entry = {
+                    "AccessKeyId": response["AccessKeyId"],
+                    "SecretAccessKey": response["SecretAccessKey"],
+                    "SessionToken": response["SessionToken"],
+                    "Expiration": response["Expiration"].timestamp(),
+                }
+                self._write(key, entry)
+                self.assumed += 1
+            self._entries[key] = entry
+        return entry
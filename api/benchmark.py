@@ -0,0 +1,402 @@
+"""
+Benchmark the report pipeline against a synthetic fleet served by botocore
+Stubber, so no AWS account or network access is needed.
+
+Each (fleet size, frequency) case times discovery, metric fetch, statistics,
+chart rendering and PDF build separately and the results are written as JSON
+for comparison across releases.
+
+Usage (from the api directory):
+    python benchmark.py --hosts 10 100 1000 --frequency daily weekly monthly --output bench.json
+
+With --replay, the same stages are timed against an AWS cassette recorded
+with AWS_CASSETTE_MODE=record, at production data volumes.
+
+--chart-layout picks how charts are laid out, to compare one image per
+metric with one small-multiples image per host:
+    python benchmark.py --hosts 100 --chart-layout metric host
+
+With --payloads, the /instances response for each fleet size is encoded the
+old way (jsonable_encoder plus stdlib json) and the new way, and compressed
+with every available codec:
+    python benchmark.py --payloads --hosts 1000 5000
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import boto3
+import pytz
+from botocore.stub import Stubber
+from fastapi.encoders import jsonable_encoder
+
+import cassette
+import encoding
+import main
+import ratelimit
+from archive import MetricArchive
+from catalog import CATALOG_QUERIES, MetricCatalog
+from chart_cache import ChartCache
+from credentials import CredentialValidator
+from exports import summarize_datapoints
+from inventory import InventoryStore
+from rollups import AggregateStore
+from telemetry import collect_stages
+
+REGIONS = [
+    "us-east-1", "us-east-2", "us-west-1", "us-west-2", "ap-south-1", "ap-southeast-1",
+    "ap-southeast-2", "ap-northeast-1", "ca-central-1", "eu-central-1", "eu-west-1",
+    "eu-west-2", "eu-west-3", "eu-north-1", "sa-east-1", "me-central-1", "ap-northeast-2",
+]
+
+PERIOD = 300
+# get_metric_statistics returns at most 1440 datapoints per call
+MAX_DATAPOINTS = 1440
+
+FREQUENCY_WINDOWS = {
+    "daily": timedelta(days=1),
+    "weekly": timedelta(weeks=1),
+    "monthly": timedelta(days=30),
+}
+
+
+def synthetic_fleet(size, seed=7):
+    rng = random.Random(seed)
+    fleet = []
+    for index in range(size):
+        fleet.append({
+            "id": f"i-{index:017x}",
+            "name": f"host-{index:04d}",
+            "type": rng.choice(["t3.medium", "m5.large", "c5.xlarge", "r5.2xlarge"]),
+            "state": "running",
+            "region": REGIONS[index % len(REGIONS)],
+            "os": "windows" if index % 5 == 0 else "linux",
+        })
+    return fleet
+
+
+def synthetic_catalog(hosts):
+    """(metric name, dimensions) for every series ListMetrics would report for hosts."""
+    series = []
+    for host in hosts:
+        instance = {"Name": "InstanceId", "Value": host["id"]}
+        series.append(("CPUUtilization", [instance]))
+        if host["os"] == "windows":
+            series.append(("Memory % Committed Bytes In Use", [instance, {"Name": "objectname", "Value": "Memory"}]))
+            for drive in ("C:", "D:"):
+                series.append(("LogicalDisk % Free Space", [
+                    instance, {"Name": "instance", "Value": drive}, {"Name": "objectname", "Value": "LogicalDisk"}
+                ]))
+        else:
+            series.append(("mem_used_percent", [instance]))
+            series.append(("disk_used_percent", [
+                instance, {"Name": "path", "Value": "/"}, {"Name": "device", "Value": "nvme0n1p1"},
+                {"Name": "fstype", "Value": "xfs"}
+            ]))
+    return series
+
+
+def synthetic_datapoints(rng, start_time, end_time, unit="Percent"):
+    count = min(int((end_time - start_time).total_seconds() // PERIOD), MAX_DATAPOINTS)
+    step = (end_time - start_time) / count
+    base = rng.uniform(5, 60)
+    datapoints = []
+    for index in range(count):
+        value = base + 20 * math.sin(index / 24) + rng.gauss(0, 3)
+        datapoints.append({
+            "Timestamp": start_time + step * index,
+            "Average": min(max(value, 0.0), 100.0),
+            "Unit": unit,
+        })
+    rng.shuffle(datapoints)  # CloudWatch does not return points in order
+    return datapoints
+
+
+class StubbedSession:
+    """Stands in for main.aws_session(); hands out Stubber-backed clients."""
+
+    def __init__(self, clients):
+        self.clients = clients
+
+    def client(self, service_name, region_name=None, config=None):
+        return self.clients[service_name]
+
+
+class StubbedAws:
+    def __init__(self):
+        self._boto = boto3.Session(aws_access_key_id="bench", aws_secret_access_key="bench",
+                                   region_name="us-east-1")
+        self.sessions = {}
+        self.stubbers = {}
+
+    def session_for(self, region):
+        if region not in self.sessions:
+            clients = {}
+            for service in ("ec2", "rds", "cloudwatch", "sts"):
+                client = self._boto.client(service, region_name=region)
+                stubber = Stubber(client)
+                stubber.activate()
+                self.stubbers[(region, service)] = stubber
+                clients[service] = client
+            self.sessions[region] = StubbedSession(clients)
+        return self.sessions[region]
+
+    def stub(self, region, service):
+        self.session_for(region)
+        return self.stubbers[(region, service)]
+
+    def aws_session(self, credentials, region_name):
+        return self.session_for(region_name)
+
+    def queue_identity(self, account_id):
+        # Every store is keyed by the caller identity, so STS is asked first
+        self.stub("us-east-1", "sts").add_response("get_caller_identity", {
+            "Account": account_id, "Arn": f"arn:aws:iam::{account_id}:user/bench", "UserId": "BENCH",
+        })
+
+    def queue_discovery(self, fleet):
+        self.stub("us-east-1", "ec2").add_response(
+            "describe_regions", {"Regions": [{"RegionName": region} for region in REGIONS]}
+        )
+        for region in REGIONS:
+            hosts = [host for host in fleet if host["region"] == region]
+            self.stub(region, "ec2").add_response("describe_instances", {"Reservations": [{
+                "Instances": [{
+                    "InstanceId": host["id"],
+                    "InstanceType": host["type"],
+                    "State": {"Name": host["state"]},
+                    "Tags": [{"Key": "Name", "Value": host["name"]}],
+                    **({"Platform": "windows"} if host["os"] == "windows" else {}),
+                } for host in hosts]
+            }]})
+            self.stub(region, "rds").add_response("describe_db_instances", {"DBInstances": []})
+
+    def queue_metrics(self, fleet, pieces, seed=11):
+        rng = random.Random(seed)
+        for region in REGIONS:
+            hosts = [host for host in fleet if host["region"] == region]
+            if not hosts:
+                continue
+            stubber = self.stub(region, "cloudwatch")
+            series = synthetic_catalog(hosts)
+            for _, namespace, name, _, _ in CATALOG_QUERIES:
+                stubber.add_response("list_metrics", {"Metrics": [
+                    {"Namespace": namespace, "MetricName": name, "Dimensions": dimensions}
+                    for metric_name, dimensions in series if metric_name == name
+                ]})
+            for metric_name, _ in series:
+                for piece_start, piece_end, _ in pieces:
+                    stubber.add_response("get_metric_statistics", {
+                        "Label": metric_name,
+                        "Datapoints": synthetic_datapoints(rng, piece_start, piece_end),
+                    })
+
+
+def time_pipeline(request, start_time, end_time, result):
+    started = time.perf_counter()
+    report_data = main.fetch_report_data(request, start_time, end_time)
+    result["fetch"] = time.perf_counter() - started
+    result["datapoints"] = sum(len(points) for _, metrics in report_data for points in metrics.values())
+
+    started = time.perf_counter()
+    for _, metrics in report_data:
+        for datapoints in metrics.values():
+            summarize_datapoints(datapoints)
+    result["stats"] = time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory() as temp_dir, tempfile.TemporaryFile() as output:
+        with collect_stages() as stages:
+            pages = main.build_pdf_report(request, report_data, output, temp_dir)
+        result["chart_render"] = stages.get("chart_render", 0.0)
+        result["images"] = sum(1 for name in os.listdir(temp_dir) if name.endswith(".png"))
+        result["pdf_build"] = stages.get("pdf_build", 0.0)
+        result["pages"] = pages
+        result["bytes"] = output.tell()
+    return result
+
+
+def reset_limiters():
+    # Limiters ramp up as calls succeed; each case starts from the initial rate
+    with ratelimit._limiters_lock:
+        ratelimit._limiters.clear()
+
+
+def benchmark_request(instances, frequency):
+    return main.ReportRequest(
+        provider="aws",
+        credentials=main.Credentials(accessKeyId="bench", secretAccessKey="bench",
+                                     accountName="Benchmark", accountId="000000000000"),
+        selected_instances=instances,
+        frequency=frequency,
+    )
+
+
+def run_case(size, frequency):
+    fleet = synthetic_fleet(size)
+    end_time = datetime.now(pytz.UTC)
+    start_time = end_time - FREQUENCY_WINDOWS[frequency]
+    aws = StubbedAws()
+    main.aws_session = aws.aws_session
+    # A cold, zero-byte cache so every chart is actually rendered
+    main.chart_cache = ChartCache(tempfile.mkdtemp(), 0)
+    # and no stored daily aggregates, so weekly and monthly fetch every day
+    main.daily_aggregates = AggregateStore(os.path.join(tempfile.mkdtemp(), "rollups.sqlite3"))
+    main.metric_archive = MetricArchive(tempfile.mkdtemp())
+    main.metric_catalog = MetricCatalog(main.metric_catalog.ttl)
+    main.inventory.store = InventoryStore(os.path.join(tempfile.mkdtemp(), "inventory.sqlite3"))
+    reset_limiters()
+
+    # A cold identity cache, so the STS answer below is the one used
+    main.credential_validator = CredentialValidator(main.probe_identity, ttl=3600, negative_ttl=0)
+
+    request = benchmark_request([main.Instance(**host) for host in fleet], frequency)
+    result = {"hosts": size, "frequency": frequency}
+
+    aws.queue_identity(request.credentials.accountId)
+    aws.queue_discovery(fleet)
+    started = time.perf_counter()
+    discovered, _ = main.discover_instances(request.credentials, refresh=True)
+    result["discovery"] = time.perf_counter() - started
+    assert len(discovered["ec2Instances"]) == size
+
+    aws.queue_metrics(fleet, main.fetch_pieces(frequency, start_time, end_time))
+    time_pipeline(request, start_time, end_time, result)
+
+    for stubber in aws.stubbers.values():
+        stubber.deactivate()
+    return result
+
+
+def run_replay_case(frequency):
+    """Time the pipeline against a recorded cassette, using every discovered host."""
+    main.chart_cache = ChartCache(tempfile.mkdtemp(), 0)
+    # and no stored daily aggregates, so weekly and monthly fetch every day
+    main.daily_aggregates = AggregateStore(os.path.join(tempfile.mkdtemp(), "rollups.sqlite3"))
+    main.metric_archive = MetricArchive(tempfile.mkdtemp())
+    main.metric_catalog = MetricCatalog(main.metric_catalog.ttl)
+    main.inventory.store = InventoryStore(os.path.join(tempfile.mkdtemp(), "inventory.sqlite3"))
+    reset_limiters()
+    end_time = datetime.now(pytz.UTC)
+    start_time = end_time - FREQUENCY_WINDOWS[frequency]
+    credentials = main.AwsCredentials(accessKeyId="replay", secretAccessKey="replay")
+
+    started = time.perf_counter()
+    discovered, _ = main.discover_instances(credentials, refresh=True)
+    discovery = time.perf_counter() - started
+
+    instances = [main.Instance(**instance) for instance in discovered["ec2Instances"]]
+    result = {"hosts": len(instances), "frequency": frequency, "source": "cassette", "discovery": discovery}
+    return time_pipeline(benchmark_request(instances, frequency), start_time, end_time, result)
+
+
+def _best_of(repeat, function):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, value
+
+
+def run_payload_case(size, repeat=5):
+    """Encoding and compression cost of an inventory response for size hosts."""
+    fleet = synthetic_fleet(size)
+    for host in fleet:
+        host["tags"] = {"Name": host["name"], "env": "prod" if host["id"][-1] in "02468" else "dev"}
+        host["selected"] = False
+    body = {"ec2Instances": fleet, "rdsInstances": []}
+
+    result = {"hosts": size, "suite": "payloads"}
+    result["encode_stdlib"], baseline = _best_of(repeat, lambda: json.dumps(jsonable_encoder(body)).encode())
+    result["encode_fast"], encoded = _best_of(repeat, lambda: encoding.dumps(body))
+    result["bytes_stdlib"] = len(baseline)
+    result["bytes"] = len(encoded)
+    for codec in encoding.available_encodings():
+        elapsed, compressed = _best_of(repeat, lambda: encoding.compress(encoded, codec))
+        result[f"compress_{codec}"] = elapsed
+        result[f"bytes_{codec}"] = len(compressed)
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hosts", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--frequency", nargs="+", default=["daily", "weekly", "monthly"],
+                        choices=sorted(FREQUENCY_WINDOWS))
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    parser.add_argument("--replay", metavar="CASSETTE",
+                        help="replay a recorded AWS cassette instead of the synthetic fleet")
+    parser.add_argument("--latency-ms", type=float, default=0.0,
+                        help="latency injected into every replayed AWS call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0,
+                        help="random extra latency, up to this much, per replayed call")
+    parser.add_argument("--chart-layout", nargs="+", default=[main.CHART_LAYOUT], choices=list(main.CHART_LAYOUTS))
+    parser.add_argument("--payloads", action="store_true",
+                        help="benchmark response encoding and compression instead of the pipeline")
+    args = parser.parse_args(argv)
+
+    if args.payloads:
+        results = []
+        for size in args.hosts:
+            result = run_payload_case(size)
+            print(f"{size:>5} hosts stdlib={result['encode_stdlib']:.4f}s fast={result['encode_fast']:.4f}s "
+                  f"bytes={result['bytes']} gzip={result['bytes_gzip']}", file=sys.stderr)
+            results.append(result)
+        write_results("payloads", results, args.output)
+        return
+
+    if args.replay:
+        cassette.configure(args.replay, "replay", args.latency_ms, args.jitter_ms)
+        cases = [(None, frequency) for frequency in args.frequency]
+    else:
+        cases = [(size, frequency) for size in args.hosts for frequency in args.frequency]
+
+    results = []
+    for size, frequency in cases:
+        for layout in args.chart_layout:
+            main.CHART_LAYOUT = layout
+            result = run_replay_case(frequency) if size is None else run_case(size, frequency)
+            result["chart_layout"] = layout
+            print(f"{result['hosts']:>5} hosts {frequency:<8} {layout:<6} "
+                  f"discovery={result['discovery']:.3f}s fetch={result['fetch']:.3f}s "
+                  f"stats={result['stats']:.3f}s charts={result['chart_render']:.3f}s "
+                  f"images={result['images']} pdf={result['pdf_build']:.3f}s", file=sys.stderr)
+            results.append(result)
+    write_results("report-pipeline", results, args.output)
+
+
+def write_results(suite, results, output):
+    document = {
+        "suite": suite,
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.now(pytz.UTC).isoformat(),
+        "results": results,
+    }
+    text = json.dumps(document, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,89 @@
+"""
+Cooperative cancellation and deadlines for report builds.
+
+A build runs under one Cancellation, found through a context variable like
+the telemetry stage totals, so every worker thread started with a copied
+context sees it. Long waits (rate limiter, retry backoff) sleep on the
+token and wake as soon as it is cancelled; the pipeline calls check()
+between units of work.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar("report_cancellation", default=None)
+
+
+class BuildCancelled(Exception):
+    pass
+
+
+class DeadlineExceeded(BuildCancelled):
+    pass
+
+
+class Cancellation:
+    def __init__(self, deadline=None):
+        self.deadline = deadline  # time.monotonic() value, or None for no deadline
+        self.reason = None
+        self.partial = []  # what a partial report is missing, in plain words
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason="cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def extend(self, seconds):
+        """Move the deadline to seconds from now, e.g. to finish a partial report."""
+        self.deadline = time.monotonic() + seconds
+
+    def mark_partial(self, note):
+        self.partial.append(note)
+
+    def check(self):
+        if self._event.is_set():
+            raise BuildCancelled(self.reason)
+        if self.expired():
+            raise DeadlineExceeded("report deadline exceeded")
+
+    def sleep(self, seconds):
+        """Sleep up to seconds, returning early and raising once cancelled."""
+        if self._event.wait(seconds):
+            raise BuildCancelled(self.reason)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def scope(cancellation):
+    token = _current.set(cancellation)
+    try:
+        yield cancellation
+    finally:
+        _current.reset(token)
+
+
+def check():
+    """Raise if the current build was cancelled or ran out of time; a no-op outside of one."""
+    cancellation = _current.get()
+    if cancellation is not None:
+        cancellation.check()
+
+
+def sleep(seconds):
+    cancellation = _current.get()
+    if cancellation is None:
+        time.sleep(seconds)
+    else:
+        cancellation.sleep(seconds)
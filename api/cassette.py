@@ -0,0 +1,192 @@
+import base64
+import contextvars
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# off (default) | record | replay
+AWS_CASSETTE_MODE = os.environ.get("AWS_CASSETTE_MODE", "off").lower()
+AWS_CASSETTE_PATH = os.environ.get("AWS_CASSETTE_PATH", "cassettes/aws.jsonl.gz")
+AWS_REPLAY_LATENCY_MS = float(os.environ.get("AWS_REPLAY_LATENCY_MS", 0))
+AWS_REPLAY_JITTER_MS = float(os.environ.get("AWS_REPLAY_JITTER_MS", 0))
+
+
+# End of the report window the current calls belong to
+_anchor = contextvars.ContextVar("cassette_anchor", default=None)
+
+
+class CassetteMiss(Exception):
+    pass
+
+
+@contextmanager
+def anchored(end_time):
+    """Key the request windows of calls made in this block relative to end_time."""
+    token = _anchor.set(end_time)
+    try:
+        yield
+    finally:
+        _anchor.reset(token)
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode()}
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if "__datetime__" in value and len(value) == 1:
+            return datetime.fromisoformat(value["__datetime__"])
+        if "__bytes__" in value and len(value) == 1:
+            return base64.b64decode(value["__bytes__"])
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+def _normalize_params(params):
+    """
+    Report windows are relative to 'now', so absolute StartTime/EndTime would
+    never match on replay. Inside anchored() they are keyed by their offsets
+    from the end of the report window instead; outside it they stay absolute.
+    """
+    params = dict(params)
+    start, end, anchor = params.get("StartTime"), params.get("EndTime"), _anchor.get()
+    if isinstance(start, datetime) and isinstance(end, datetime) and anchor is not None:
+        params.pop("StartTime")
+        params.pop("EndTime")
+        params["__window_offsets__"] = [int((start - anchor).total_seconds()), int((end - anchor).total_seconds())]
+    return params
+
+
+def interaction_key(service, operation, region, params):
+    canonical = json.dumps(_encode(_normalize_params(params)), sort_keys=True)
+    digest = hashlib.sha256(f"{service}|{operation}|{region}|{canonical}".encode()).hexdigest()
+    return digest
+
+
+class _ReplayedHttpResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+        self.content = b""
+        self.raw = None
+
+
+class Cassette:
+    """
+    Compressed JSON-lines store of AWS responses, keyed by service, operation,
+    client region and normalized request parameters.
+
+    Identical requests recorded several times are replayed in the same order,
+    repeating the last response once the sequence is exhausted.
+    """
+
+    def __init__(self, path, mode, latency_ms=0.0, jitter_ms=0.0):
+        self.path = path
+        self.mode = mode
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._interactions = {}
+        self._positions = {}
+        self._lock = threading.Lock()
+        if mode == "replay":
+            self._load()
+        elif mode == "record":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def _load(self):
+        # Each recorded interaction is its own gzip member
+        with gzip.open(self.path, "rt") as f:
+            for line in f:
+                entry = json.loads(line)
+                self._interactions.setdefault(entry["key"], []).append(entry)
+
+    def _key_request(self, params=None, model=None, context=None, **kwargs):
+        service = model.service_model.service_name
+        context["cassette_key"] = interaction_key(service, model.name, context.get("client_region"), params)
+        context["cassette_operation"] = f"{service}.{model.name}"
+
+    def _replay(self, model=None, context=None, **kwargs):
+        key = context.get("cassette_key")
+        with self._lock:
+            entries = self._interactions.get(key)
+            if not entries:
+                raise CassetteMiss(f"No recorded response for {context.get('cassette_operation')} ({key[:12]})")
+            position = self._positions.get(key, 0)
+            entry = entries[min(position, len(entries) - 1)]
+            self._positions[key] = position + 1
+        delay = self.latency_ms + (random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if delay:
+            time.sleep(delay / 1000)
+        return _ReplayedHttpResponse(entry["status"]), _decode(entry["response"])
+
+    def _record(self, http_response=None, parsed=None, model=None, context=None, **kwargs):
+        key = context.get("cassette_key")
+        if key is None:
+            return
+        parsed = {name: value for name, value in parsed.items() if name != "ResponseMetadata"}
+        entry = {
+            "key": key,
+            "operation": context.get("cassette_operation"),
+            "region": context.get("client_region"),
+            "status": http_response.status_code,
+            "response": _encode(parsed),
+        }
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            with gzip.open(self.path, "at") as f:
+                f.write(line)
+
+    def attach(self, session):
+        events = session.events
+        events.register("before-parameter-build", self._key_request, unique_id="cassette-key")
+        if self.mode == "replay":
+            events.register("before-call", self._replay, unique_id="cassette-replay")
+        elif self.mode == "record":
+            events.register("after-call", self._record, unique_id="cassette-record")
+        return session
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def configure(path, mode, latency_ms=0.0, jitter_ms=0.0):
+    """Switch the process-wide cassette, e.g. from the benchmark CLI."""
+    global _cassette
+    with _cassette_lock:
+        _cassette = Cassette(path, mode, latency_ms, jitter_ms) if mode in ("record", "replay") else None
+    return _cassette
+
+
+def active_cassette():
+    global _cassette
+    with _cassette_lock:
+        if _cassette is None and AWS_CASSETTE_MODE in ("record", "replay"):
+            _cassette = Cassette(AWS_CASSETTE_PATH, AWS_CASSETTE_MODE,
+                                 AWS_REPLAY_LATENCY_MS, AWS_REPLAY_JITTER_MS)
+    return _cassette
+
+
+def attach_cassette(session):
+    """Record or replay AWS calls made through session, per AWS_CASSETTE_MODE."""
+    cassette = active_cassette()
+    if cassette is not None:
+        cassette.attach(session)
+    return session
@@ -0,0 +1,104 @@
+"""
+Index of the CloudWatch metrics that actually exist per account and region,
+built from ListMetrics, so reports only request series that have data and
+pick up whatever disks or drives the CloudWatch agent publishes.
+"""
+import threading
+import time
+from dataclasses import dataclass
+
+from ratelimit import call_with_retries
+
+# (report metric, namespace, CloudWatch metric name, dimension naming the disk, invert)
+# Windows publishes free space rather than used space, hence invert.
+CATALOG_QUERIES = [
+    ("cpu", "AWS/EC2", "CPUUtilization", None, False),
+    ("memory", "CWAgent", "mem_used_percent", None, False),
+    ("memory", "CWAgent", "Memory % Committed Bytes In Use", None, False),
+    ("disk", "CWAgent", "disk_used_percent", "path", False),
+    ("disk", "CWAgent", "LogicalDisk % Free Space", "instance", True),
+]
+
+
+@dataclass(frozen=True)
+class MetricSpec:
+    family: str  # cpu | memory | disk
+    key: str  # report label, e.g. "disk /var" or "disk C:"
+    namespace: str
+    name: str
+    dimensions: tuple  # ((Name, Value), ...)
+    invert: bool = False
+
+    def dimension_list(self):
+        return [{"Name": name, "Value": value} for name, value in self.dimensions]
+
+
+def default_specs(instance_id):
+    """What to ask for when the catalog is unavailable: the metric every instance has."""
+    return [MetricSpec("cpu", "cpu", "AWS/EC2", "CPUUtilization", (("InstanceId", instance_id),))]
+
+
+def _list_metrics(cloudwatch, limiter, deadline, namespace, name):
+    token = None
+    while True:
+        kwargs = {"Namespace": namespace, "MetricName": name}
+        if token:
+            kwargs["NextToken"] = token
+        page = call_with_retries(lambda: cloudwatch.list_metrics(**kwargs), limiter, deadline)
+        yield from page.get("Metrics", [])
+        token = page.get("NextToken")
+        if not token:
+            return
+
+
+def build_index(cloudwatch, limiter, deadline=None):
+    """{instance_id: {key: MetricSpec}} for every instance with at least one metric."""
+    index = {}
+    for family, namespace, name, disk_dimension, invert in CATALOG_QUERIES:
+        for metric in _list_metrics(cloudwatch, limiter, deadline, namespace, name):
+            dimensions = {d["Name"]: d["Value"] for d in metric.get("Dimensions", [])}
+            instance_id = dimensions.get("InstanceId")
+            if instance_id is None:
+                continue
+            key = family
+            if disk_dimension:
+                disk = dimensions.get(disk_dimension)
+                if disk is None or disk == "_Total":
+                    continue
+                key = f"{family} {disk}"
+            spec = MetricSpec(family, key, namespace, name, tuple(sorted(dimensions.items())), invert)
+            specs = index.setdefault(instance_id, {})
+            # The agent can publish one series under several dimension sets; keep the narrowest
+            if key not in specs or len(spec.dimensions) < len(specs[key].dimensions):
+                specs[key] = spec
+    return index
+
+
+class MetricCatalog:
+    """Per (account, region) index with a TTL; concurrent lookups share one build."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._indexes = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def index(self, account, region, cloudwatch, limiter, deadline=None):
+        key = (account, region)
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            cached = self._indexes.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                return cached[1]
+            index = build_index(cloudwatch, limiter, deadline)
+            self._indexes[key] = (time.monotonic() + self.ttl, index)
+            return index
+
+    def specs_for(self, index, instance_id, families):
+        """The specs to fetch for one instance, in family order then by disk."""
+        specs = index.get(instance_id)
+        if not specs:
+            return default_specs(instance_id) if "cpu" in families else []
+        return sorted((spec for spec in specs.values() if spec.family in families),
+                      key=lambda spec: (families.index(spec.family), spec.key))
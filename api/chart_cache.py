@@ -0,0 +1,140 @@
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+
+def series_digest(timestamps, values, unit):
+    digest = hashlib.sha256()
+    digest.update(str(unit).encode())
+    for timestamp, value in zip(timestamps, values):
+        digest.update(f"{timestamp.isoformat()}={value!r};".encode())
+    return digest.hexdigest()
+
+
+def chart_key(series_hash, metric_name, title, start_time, end_time, dpi, style_version):
+    """style_version comes from the renderer (charts.TEMPLATE_STYLE), so a restyle never serves old images."""
+    parts = [
+        series_hash,
+        metric_name,
+        title,
+        start_time.isoformat(),
+        end_time.isoformat(),
+        str(dpi),
+        style_version,
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+
+class ChartCache:
+    """
+    Size-bounded on-disk store of rendered chart PNGs with LRU eviction.
+
+    Entries are files named after their key; recency is tracked in memory and
+    rebuilt from file mtimes when the process starts.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        existing = []
+        for name in os.listdir(directory):
+            if not name.endswith(".png"):
+                continue
+            stat = os.stat(os.path.join(directory, name))
+            existing.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(existing):
+            self._entries[key] = size
+            self._total_bytes += size
+        with self._lock:
+            self._evict()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.png")
+
+    def get(self, key, destination):
+        """
+        Copy a cached chart to destination.
+
+        Returns destination on a hit and None on a miss. The copy is a hard
+        link where possible so an eviction during PDF layout cannot pull the
+        file out from under reportlab.
+        """
+        with self._lock:
+            size = self._entries.get(key)
+            if size is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.bytes_saved += size
+            source = self._path(key)
+            try:
+                _link_or_copy(source, destination)
+                os.utime(source)
+            except FileNotFoundError:
+                # Removed behind our back; treat as a miss.
+                self._total_bytes -= self._entries.pop(key)
+                self.hits -= 1
+                self.bytes_saved -= size
+                self.misses += 1
+                return None
+        return destination
+
+    def put(self, key, source):
+        size = os.path.getsize(source)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+            shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, self._path(key))
+            self._entries[key] = size
+            self._total_bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / lookups if lookups else 0.0,
+                "bytesSaved": self.bytes_saved,
+                "evictions": self.evictions,
+            }
+
+
+def _link_or_copy(source, destination):
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
@@ -0,0 +1,113 @@
+"""
+Chart rendering from reusable figure templates.
+
+Creating a matplotlib figure, laying it out and tearing it down costs far
+more than drawing one line, so each worker thread keeps one figure per
+chart shape and only swaps in the new data, labels and limits. Margins are
+fixed when a template is built, which replaces tight_layout and
+autofmt_xdate on every chart. Figures are used through the object API
+rather than pyplot, whose global state is not safe across report threads.
+
+HostChart puts all of a host's metrics into one figure of small multiples
+sharing the time axis, so a host needs one image instead of one per metric.
+"""
+import threading
+
+import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+
+LINE_COLOR = '#FF0066'
+
+# Part of the chart cache key; bump with any change to how these charts look
+TEMPLATE_STYLE = "template-1"
+
+METRIC_FIGSIZE = (10, 4)
+HOST_WIDTH = 10
+HOST_PANEL_HEIGHT = 2.2
+# Suptitle above the panels and the shared time axis below them
+HOST_MARGINS = 1.3
+
+_templates = threading.local()
+
+
+def host_figure_size(rows):
+    return HOST_WIDTH, HOST_MARGINS + HOST_PANEL_HEIGHT * rows
+
+
+def _prepare_axes(axes, linewidth, markers):
+    line, = axes.plot([], [], color=LINE_COLOR, linewidth=linewidth, alpha=0.9, label='Average',
+                      marker='o' if markers else None, markersize=3, markerfacecolor=LINE_COLOR)
+    axes.grid(True, linestyle='--', alpha=0.7)
+    # Concise labels fit without rotating them, so the layout never changes
+    locator = mdates.AutoDateLocator()
+    axes.xaxis.set_major_locator(locator)
+    axes.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+    return line
+
+
+def _plot(axes, line, timestamps, values, start_time, end_time):
+    line.set_data(mdates.date2num(timestamps), values)
+    axes.set_xlim(mdates.date2num(start_time), mdates.date2num(end_time))
+    axes.relim()
+    axes.autoscale_view(scalex=False)
+
+
+class MetricChart:
+    """One metric for one host, in the layout of the original per-metric charts."""
+
+    def __init__(self):
+        self.figure = Figure(figsize=METRIC_FIGSIZE)
+        self.figure.subplots_adjust(left=0.08, right=0.98, top=0.84, bottom=0.2)
+        self.axes = self.figure.add_subplot()
+        self.axes.set_xlabel('Time', fontweight='bold')
+        self.line = _prepare_axes(self.axes, linewidth=2.5, markers=True)
+        self.stats = self.figure.text(0.5, 0.01, "", ha='center', fontsize=10, fontweight='bold')
+
+    def render(self, filename, timestamps, values, ylabel, title, stats_text, start_time, end_time, dpi):
+        _plot(self.axes, self.line, timestamps, values, start_time, end_time)
+        self.axes.set_ylabel(ylabel, fontweight='bold')
+        self.axes.set_title(title, fontweight='bold')
+        self.stats.set_text(stats_text)
+        self.figure.savefig(filename, dpi=dpi)
+
+
+class HostChart:
+    """Small multiples: one panel per metric, stacked over a shared time axis."""
+
+    def __init__(self, rows):
+        width, height = host_figure_size(rows)
+        self.figure = Figure(figsize=(width, height))
+        axes = self.figure.subplots(rows, 1, sharex=True, squeeze=False)[:, 0]
+        self.figure.subplots_adjust(left=0.08, right=0.98, top=1 - 0.8 / height, bottom=0.5 / height,
+                                    hspace=0.45)
+        axes[-1].set_xlabel('Time', fontweight='bold')
+        self.panels = [(panel, _prepare_axes(panel, linewidth=1.5, markers=False)) for panel in axes]
+        self.title = self.figure.suptitle("", fontweight='bold')
+
+    def render(self, filename, title, series, start_time, end_time, dpi):
+        """series: [(timestamps, values, ylabel, panel_title)], one per panel."""
+        self.title.set_text(title)
+        for (panel, line), (timestamps, values, ylabel, panel_title) in zip(self.panels, series):
+            _plot(panel, line, timestamps, values, start_time, end_time)
+            panel.set_ylabel(ylabel, fontsize=9)
+            panel.set_title(panel_title, fontsize=9, loc='left')
+        self.figure.savefig(filename, dpi=dpi)
+
+
+def metric_chart():
+    """This thread's per-metric template."""
+    chart = getattr(_templates, "metric", None)
+    if chart is None:
+        chart = _templates.metric = MetricChart()
+    return chart
+
+
+def host_chart(rows):
+    """This thread's small-multiples template with rows panels."""
+    charts = getattr(_templates, "hosts", None)
+    if charts is None:
+        charts = _templates.hosts = {}
+    chart = charts.get(rows)
+    if chart is None:
+        chart = charts[rows] = HostChart(rows)
+    return chart
@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import json
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+
+from cancellation import Cancellation, scope
+
+
+@dataclass
+class BuiltReport:
+    body: object  # streaming.ReportBody
+    media_type: str
+    headers: dict = field(default_factory=dict)
+    # Cut short by its deadline; served to its callers but never cached
+    partial: bool = False
+
+
+def request_fingerprint(request):
+    """
+    Stable key for everything that shapes a report's bytes.
+
+    The credentials are folded in as a digest so that only callers holding
+    the same keys can ever share a report.
+    """
+    credentials = request.credentials
+    document = {
+        "provider": request.provider.lower(),
+        "credentials": hashlib.sha256(
+            f"{credentials.accessKeyId}:{credentials.secretAccessKey}".encode()
+        ).hexdigest(),
+        "role": [credentials.roleArn or "", credentials.externalId or "", credentials.sessionPolicy or ""],
+        "region": credentials.region or "",
+        "accountId": credentials.accountId or "",
+        "accountName": credentials.accountName,
+        "frequency": request.frequency.lower(),
+        "report_date": request.report_date,
+        "format": request.format,
+        "deliver_exports": sorted(set(request.deliver_exports)),
+        "instances": sorted(
+            [instance.id, instance.name, instance.type, instance.state, instance.region, instance.os]
+            for instance in request.selected_instances
+        ),
+    }
+    # Only when set, so fingerprints of reports in the default layout stay as they were
+    if getattr(request, "chart_layout", None):
+        document["chart_layout"] = request.chart_layout
+    # A strict or shorter-deadline request must never join a build that may
+    # come back partial on someone else's terms; defaults are left out as above
+    if getattr(request, "deadline_seconds", None):
+        document["deadline_seconds"] = request.deadline_seconds
+    if not getattr(request, "allow_partial", True):
+        document["allow_partial"] = False
+    return hashlib.sha256(json.dumps(document, sort_keys=True).encode()).hexdigest()
+
+
+class ReportCoalescer:
+    """
+    Single-flight builds with a short-lived result cache.
+
+    Concurrent calls with the same key share one build; results are kept for
+    ttl seconds so near-immediate repeats are served without rebuilding.
+    Every caller gets its own retained reference to the report body. A
+    build whose callers have all gone away is cancelled.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._inflight = {}
+        self._results = {}
+
+    def _evict_expired(self, now):
+        for key, (expires, built) in list(self._results.items()):
+            if expires <= now:
+                del self._results[key]
+                built.body.release()
+
+    def _store(self, key, built, now):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return False
+        while len(self._results) >= self.max_entries:
+            oldest = min(self._results, key=lambda k: self._results[k][0])
+            _, evicted = self._results.pop(oldest)
+            evicted.body.release()
+        self._results[key] = (now + self.ttl, built)
+        return True
+
+    async def _build(self, key, build, inflight):
+        try:
+            # The build's worker threads inherit the cancellation from this task
+            with scope(inflight["cancellation"]):
+                async with inflight["admit"]():
+                    # Its callers may have given up while it was queued
+                    inflight["cancellation"].check()
+                    built = await asyncio.to_thread(build)
+        finally:
+            if self._inflight.get(key) is inflight:
+                del self._inflight[key]
+        # One reference per caller still waiting; the original goes to the cache
+        for _ in range(inflight["waiters"]):
+            built.body.retain()
+        if built.partial or not self._store(key, built, time.monotonic()):
+            built.body.release()
+        return built
+
+    async def run(self, key, build, deadline=None, admit=None):
+        """
+        Return (BuiltReport, source) where source is 'cached', 'coalesced' or
+        'built'. build is a blocking callable and runs in a worker thread, as
+        a task of its own so one caller disconnecting does not cancel it for
+        the others; once the last caller is cancelled, so is the build.
+        deadline (a time.monotonic() value) and admit, an async context
+        manager factory that holds a worker slot, apply to a new build only.
+        """
+        self._evict_expired(time.monotonic())
+        cached = self._results.get(key)
+        if cached is not None:
+            built = cached[1]
+            built.body.retain()
+            return built, "cached"
+
+        inflight = self._inflight.get(key)
+        source = "coalesced"
+        if inflight is None:
+            source = "built"
+            inflight = self._inflight[key] = {
+                "waiters": 0, "cancellation": Cancellation(deadline), "admit": admit or nullcontext,
+            }
+            task = asyncio.ensure_future(self._build(key, build, inflight))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            inflight["task"] = task
+
+        inflight["waiters"] += 1
+        try:
+            built = await asyncio.shield(inflight["task"])
+        except asyncio.CancelledError:
+            task = inflight["task"]
+            if task.done():
+                # Finished just before this caller resumed; drop the reference kept for it
+                if not task.cancelled() and task.exception() is None:
+                    task.result().body.release()
+            else:
+                inflight["waiters"] -= 1
+                if inflight["waiters"] == 0:
+                    # Nobody is left to receive it; later callers start afresh
+                    inflight["cancellation"].cancel("abandoned by every caller")
+                    if self._inflight.get(key) is inflight:
+                        del self._inflight[key]
+            raise
+        return built, source
@@ -0,0 +1,83 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from botocore.exceptions import ClientError, NoCredentialsError
+
+# STS answers that mean the key itself is bad, as opposed to a network or service problem
+INVALID_CREDENTIAL_CODES = {
+    "InvalidClientTokenId", "SignatureDoesNotMatch", "AccessDenied", "ExpiredToken",
+    "UnrecognizedClientException", "AuthFailure",
+}
+
+
+class InvalidCredentials(Exception):
+    pass
+
+
+def credential_digest(credentials):
+    """
+    Cache key for a key pair and the role it assumes, if any; the secret
+    never leaves this process in clear.
+    """
+    parts = [credentials.accessKeyId, credentials.secretAccessKey,
+             credentials.roleArn or "", credentials.externalId or "", credentials.sessionPolicy or ""]
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+class CredentialValidator:
+    """
+    Validates keys with sts:GetCallerIdentity, which needs no IAM permission
+    and uses no EC2 quota, and caches both outcomes for a short while.
+    probe(credentials) returns the GetCallerIdentity response.
+    """
+
+    def __init__(self, probe, ttl, negative_ttl, max_entries=1024):
+        self.probe = probe
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._results[key]
+                return None
+            self._results.move_to_end(key)
+            return entry
+
+    def _store(self, key, ttl, identity, error):
+        with self._lock:
+            self._results[key] = (time.monotonic() + ttl, identity, error)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    def validate(self, credentials):
+        """Return {"accountId", "arn", "userId"} or raise InvalidCredentials."""
+        key = credential_digest(credentials)
+        cached = self._cached(key)
+        if cached is None:
+            try:
+                response = self.probe(credentials)
+            except NoCredentialsError as e:
+                self._store(key, self.negative_ttl, None, str(e))
+                raise InvalidCredentials(str(e))
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") not in INVALID_CREDENTIAL_CODES:
+                    raise
+                self._store(key, self.negative_ttl, None, str(e))
+                raise InvalidCredentials(str(e))
+            identity = {"accountId": response["Account"], "arn": response["Arn"], "userId": response["UserId"]}
+            self._store(key, self.ttl, identity, None)
+            return identity
+        _, identity, error = cached
+        if error is not None:
+            raise InvalidCredentials(error)
+        return identity
@@ -0,0 +1,174 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+# S3 rejects multipart parts under 5 MiB except for the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+REPORT_BUCKET = os.environ.get("REPORT_BUCKET")
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")
+UPLOAD_PART_SIZE = max(int(os.environ.get("UPLOAD_PART_SIZE", 8 * 1024 * 1024)), MIN_PART_SIZE)
+UPLOAD_CONCURRENCY = int(os.environ.get("UPLOAD_CONCURRENCY", 4))
+
+
+def delivery_enabled():
+    return bool(REPORT_BUCKET)
+
+
+def delivery_client():
+    """
+    S3 client for report delivery. Uses the service's own credential chain,
+    never the customer's keys; S3_ENDPOINT_URL points it at MinIO or moto.
+    """
+    return boto3.client("s3", endpoint_url=S3_ENDPOINT_URL)
+
+
+def report_key(client_name, report_date, filename):
+    return f"clients/{client_name}/{report_date}/{filename}"
+
+
+class MultipartUploadWriter:
+    """
+    Write-only file object that uploads to S3 as data arrives.
+
+    Full parts are handed to a thread pool while the caller keeps writing, so
+    close() only has to send the tail and complete the upload. Objects smaller
+    than one part go up with a single put_object.
+    """
+
+    def __init__(self, s3, bucket, key, content_type, part_size=UPLOAD_PART_SIZE,
+                 max_workers=UPLOAD_CONCURRENCY):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.part_size = part_size
+        self.bytes_written = 0
+        self.closed = False
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._futures = []
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("write to closed upload")
+        self._buffer.extend(data)
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._submit(part)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def _submit(self, body):
+        with self._lock:
+            if self._upload_id is None:
+                response = self.s3.create_multipart_upload(
+                    Bucket=self.bucket, Key=self.key, ContentType=self.content_type
+                )
+                self._upload_id = response["UploadId"]
+            part_number = len(self._futures) + 1
+            self._futures.append(self._executor.submit(self._upload_part, part_number, body))
+
+    def _upload_part(self, part_number, body):
+        response = self.s3.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=body
+        )
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if self._upload_id is None:
+                self.s3.put_object(
+                    Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer),
+                    ContentType=self.content_type
+                )
+                return
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+            parts = [future.result() for future in self._futures]
+            self.s3.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+                MultipartUpload={"Parts": parts}
+            )
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self._buffer = bytearray()
+            self._executor.shutdown(wait=False)
+
+    def abort(self):
+        self.closed = True
+        for future in self._futures:
+            future.cancel()
+        self._executor.shutdown(wait=True)
+        if self._upload_id is not None:
+            try:
+                self.s3.abort_multipart_upload(
+                    Bucket=self.bucket, Key=self.key, UploadId=self._upload_id
+                )
+            except Exception as e:
+                print(f"Error aborting upload of s3://{self.bucket}/{self.key}: {str(e)}")
+
+    @property
+    def location(self):
+        return f"s3://{self.bucket}/{self.key}"
+
+
+def upload_bytes(s3, client_name, report_date, filename, content, content_type):
+    writer = MultipartUploadWriter(s3, REPORT_BUCKET, report_key(client_name, report_date, filename), content_type)
+    try:
+        writer.write(content)
+    except Exception:
+        writer.abort()
+        raise
+    writer.close()
+    return writer.location
+
+
+def upload_body(s3, key, body, content_type):
+    """Upload a finished ReportBody part by part, without copying it into memory first."""
+    writer = MultipartUploadWriter(s3, REPORT_BUCKET, key, content_type)
+    try:
+        for offset in range(0, body.size, writer.part_size):
+            writer.write(body.read_at(offset, writer.part_size))
+    except Exception:
+        writer.abort()
+        raise
+    writer.close()
+    return writer.location
+
+
+# Deliveries run here, after the report is built and outside the response
+# path, so a slow or failing bucket never holds up or fails a download
+_deliveries = ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY, thread_name_prefix="delivery")
+
+
+def deliver_in_background(description, upload, *args):
+    """Run upload(*args) on the delivery pool; errors are logged, not raised."""
+    def run():
+        try:
+            return upload(*args)
+        except Exception as e:
+            print(f"Error delivering {description}: {str(e)}")
+    return _deliveries.submit(run)
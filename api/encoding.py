@@ -0,0 +1,147 @@
+"""
+Fast JSON encoding and negotiated response compression.
+
+orjson, brotli and zstandard are optional: without orjson the stdlib
+encoder is used, and codecs whose module is missing are never offered.
+"""
+import json
+import zlib
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Bodies smaller than this are not worth a compression header
+MIN_COMPRESS_BYTES = 1024
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+def dumps(payload):
+    """Serialize to UTF-8 JSON bytes; datetimes become ISO 8601 strings."""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False, default=_default).encode()
+
+
+def _default(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class _GzipCompressor:
+    def __init__(self, level=6):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+class _BrotliCompressor:
+    def __init__(self, quality=5):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+class _ZstdCompressor:
+    def __init__(self, level=3):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+def available_encodings():
+    """Supported codecs, most preferred first."""
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def compressor(encoding):
+    return {"zstd": _ZstdCompressor, "br": _BrotliCompressor, "gzip": _GzipCompressor}[encoding]()
+
+
+def negotiate(accept_encoding):
+    """Pick a content coding from an Accept-Encoding header, or None for identity."""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in available_encodings():
+        quality = weights.get(encoding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compressible(media_type):
+    return any(media_type.startswith(prefix) for prefix in COMPRESSIBLE_TYPES)
+
+
+def compress(body, encoding):
+    codec = compressor(encoding)
+    return codec.compress(body) + codec.flush()
+
+
+def iter_compressed(chunks, encoding):
+    codec = compressor(encoding)
+    for chunk in chunks:
+        compressed = codec.compress(chunk)
+        if compressed:
+            yield compressed
+    yield codec.flush()
+
+
+def json_response(request, payload, status_code=200, headers=None):
+    """
+    Encode payload straight to bytes, skipping FastAPI's jsonable_encoder and
+    response-model validation, and compress it for the client when worthwhile.
+    """
+    body = dumps(payload)
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept-Encoding"
+    encoding = negotiate(request.headers.get("accept-encoding")) if len(body) >= MIN_COMPRESS_BYTES else None
+    if encoding:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(body, status_code=status_code, media_type="application/json", headers=headers)
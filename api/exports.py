@@ -0,0 +1,178 @@
+import csv
+import io
+
+from encoding import dumps
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Output formats that are built straight from the fetched series, without
+# going near matplotlib or reportlab.
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "json": ("application/json", "json"),
+}
+
+SUMMARY_COLUMNS = [
+    "account", "instance_id", "instance_name", "region", "os", "metric", "unit",
+    "datapoints", "min", "max", "avg", "p95", "start", "end"
+]
+
+
+class ExportUnavailable(Exception):
+    pass
+
+
+def summarize_datapoints(datapoints):
+    """
+    Reduce a CloudWatch datapoint list to count/min/max/avg/p95 plus its time span.
+
+    Series assembled from stored daily aggregates carry a summary of the
+    full-resolution data, which is used in place of the downsampled points.
+    Returns None when there is nothing to summarize.
+    """
+    if not datapoints:
+        return None
+    timestamps = [point['Timestamp'] for point in datapoints]
+    aggregate = getattr(datapoints, "summary", None)
+    if aggregate is not None and aggregate.count:
+        count, minimum, maximum = aggregate.count, aggregate.minimum, aggregate.maximum
+        avg = aggregate.total / aggregate.count
+        p95 = aggregate.sketch.quantile(0.95)
+    else:
+        values = sorted(point['Average'] for point in datapoints)
+        count, minimum, maximum = len(values), values[0], values[-1]
+        avg = sum(values) / len(values)
+        p95 = values[min(len(values) - 1, int(0.95 * len(values)))]
+    return {
+        "unit": datapoints[0].get('Unit', 'Percent'),
+        "datapoints": count,
+        "min": minimum,
+        "max": maximum,
+        "avg": avg,
+        "p95": p95,
+        "start": min(timestamps).isoformat(),
+        "end": max(timestamps).isoformat(),
+    }
+
+
+def _summary_rows(request, report_data):
+    for instance, metrics in report_data:
+        for metric, datapoints in metrics.items():
+            summary = summarize_datapoints(datapoints)
+            if summary is None:
+                continue
+            yield {
+                "account": request.credentials.accountName,
+                "instance_id": instance.id,
+                "instance_name": instance.name,
+                "region": instance.region,
+                "os": instance.os,
+                "metric": metric,
+                **summary,
+            }
+
+
+def _series_rows(report_data):
+    for instance, metrics in report_data:
+        for metric, datapoints in metrics.items():
+            for point in sorted(datapoints, key=lambda x: x['Timestamp']):
+                yield {
+                    "instance_id": instance.id,
+                    "instance_name": instance.name,
+                    "metric": metric,
+                    "timestamp": point['Timestamp'],
+                    "value": point['Average'],
+                    "unit": point.get('Unit', 'Percent'),
+                }
+
+
+def export_summary_csv(request, report_data):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=SUMMARY_COLUMNS)
+    writer.writeheader()
+    for row in _summary_rows(request, report_data):
+        writer.writerow(row)
+    return buffer.getvalue().encode()
+
+
+def export_series_ndjson(request, report_data):
+    lines = []
+    for row in _series_rows(report_data):
+        row["timestamp"] = row["timestamp"].isoformat()
+        lines.append(dumps(row))
+    return b"\n".join(lines) + b"\n" if lines else b""
+
+
+def export_series_parquet(request, report_data):
+    if pa is None:
+        raise ExportUnavailable("Parquet export requires pyarrow to be installed")
+    rows = list(_series_rows(report_data))
+    columns = ["instance_id", "instance_name", "metric", "timestamp", "value", "unit"]
+    table = pa.Table.from_pydict({column: [row[column] for row in rows] for column in columns})
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression="zstd")
+    return buffer.getvalue()
+
+
+def export_fleet_json(request, report_data, start_time, end_time):
+    hosts = []
+    fleet = {}
+    for instance, metrics in report_data:
+        host_metrics = {}
+        for metric, datapoints in metrics.items():
+            summary = summarize_datapoints(datapoints)
+            if summary is None:
+                continue
+            host_metrics[metric] = summary
+            totals = fleet.setdefault(metric, {"hosts": 0, "sum": 0.0, "min": None, "max": None})
+            totals["hosts"] += 1
+            totals["sum"] += summary["avg"]
+            totals["min"] = summary["min"] if totals["min"] is None else min(totals["min"], summary["min"])
+            totals["max"] = summary["max"] if totals["max"] is None else max(totals["max"], summary["max"])
+        hosts.append({
+            "id": instance.id,
+            "name": instance.name,
+            "type": instance.type,
+            "state": instance.state,
+            "region": instance.region,
+            "os": instance.os,
+            "metrics": host_metrics,
+        })
+
+    fleet_summary = {
+        metric: {
+            "hosts": totals["hosts"],
+            "avg": totals["sum"] / totals["hosts"],
+            "min": totals["min"],
+            "max": totals["max"],
+        }
+        for metric, totals in fleet.items()
+    }
+    document = {
+        "account": request.credentials.accountName,
+        "accountId": request.credentials.accountId,
+        "provider": request.provider,
+        "frequency": request.frequency,
+        "start": start_time.isoformat(),
+        "end": end_time.isoformat(),
+        "fleet": fleet_summary,
+        "hosts": hosts,
+    }
+    return dumps(document)
+
+
+def build_export(request, report_data, start_time, end_time):
+    if request.format == "csv":
+        return export_summary_csv(request, report_data)
+    if request.format == "ndjson":
+        return export_series_ndjson(request, report_data)
+    if request.format == "parquet":
+        return export_series_parquet(request, report_data)
+    return export_fleet_json(request, report_data, start_time, end_time)
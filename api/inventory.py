@@ -0,0 +1,378 @@
+"""
+Persisted per-account inventory snapshots, refreshed one (region, resource
+type) at a time.
+
+AWS offers no cheap "has anything changed" call for EC2 or RDS, so each
+(region, kind) slice is re-scanned only once it is older than that kind's
+TTL. A content digest per slice then decides whether the snapshot changed
+at all; the snapshot's ETag is derived from those digests, so clients
+holding an unchanged inventory get a 304. Slices that came back empty are
+remembered as such and only rechecked after a longer TTL, or when a refresh
+is forced.
+"""
+import base64
+import bisect
+import contextvars
+import hashlib
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+def _digest(items):
+    return hashlib.sha256(json.dumps(items, sort_keys=True).encode()).hexdigest()
+
+
+EMPTY_DIGEST = _digest([])
+
+
+class InventoryStore:
+    """SQLite-backed snapshot per account: region list, slice digests and resources."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as db:
+            db.executescript(
+                "CREATE TABLE IF NOT EXISTS regions ("
+                " account TEXT PRIMARY KEY, regions TEXT, scanned_at REAL);"
+                "CREATE TABLE IF NOT EXISTS slices ("
+                " account TEXT, region TEXT, kind TEXT, digest TEXT, scanned_at REAL,"
+                " PRIMARY KEY (account, region, kind));"
+                "CREATE TABLE IF NOT EXISTS resources ("
+                " account TEXT, region TEXT, kind TEXT, position INTEGER, payload TEXT,"
+                " PRIMARY KEY (account, region, kind, position));"
+            )
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def regions(self, account):
+        """(region list, scanned_at) or None when the account was never scanned."""
+        with self._connect() as db:
+            row = db.execute("SELECT regions, scanned_at FROM regions WHERE account = ?", (account,)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def save_regions(self, account, regions):
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO regions VALUES (?, ?, ?)", (account, json.dumps(regions), time.time()))
+            # Slices of regions that are no longer enabled drop out of the snapshot
+            placeholders = ",".join("?" * len(regions)) or "''"
+            for table in ("slices", "resources"):
+                db.execute(f"DELETE FROM {table} WHERE account = ? AND region NOT IN ({placeholders})",
+                           [account, *regions])
+
+    def slices(self, account):
+        """{(region, kind): (scanned_at, empty)}"""
+        with self._connect() as db:
+            rows = db.execute("SELECT region, kind, digest, scanned_at FROM slices WHERE account = ?",
+                              (account,)).fetchall()
+        return {(region, kind): (scanned_at, digest == EMPTY_DIGEST) for region, kind, digest, scanned_at in rows}
+
+    def save_slice(self, account, region, kind, items):
+        """Store one scanned slice; returns whether its contents changed."""
+        digest = _digest(items)
+        with self._connect() as db:
+            row = db.execute("SELECT digest FROM slices WHERE account = ? AND region = ? AND kind = ?",
+                             (account, region, kind)).fetchone()
+            db.execute("INSERT OR REPLACE INTO slices VALUES (?, ?, ?, ?, ?)",
+                       (account, region, kind, digest, time.time()))
+            if row is not None and row[0] == digest:
+                return False
+            db.execute("DELETE FROM resources WHERE account = ? AND region = ? AND kind = ?",
+                       (account, region, kind))
+            db.executemany("INSERT INTO resources VALUES (?, ?, ?, ?, ?)",
+                           [(account, region, kind, position, json.dumps(item))
+                            for position, item in enumerate(items)])
+        return True
+
+    def touch_slice(self, account, region, kind):
+        """Record a failed scan so it is retried after the TTL, keeping what was there."""
+        with self._connect() as db:
+            updated = db.execute("UPDATE slices SET scanned_at = ? WHERE account = ? AND region = ? AND kind = ?",
+                                 (time.time(), account, region, kind)).rowcount
+            if not updated:
+                # No digest: nothing is known about the slice yet, which is not the same as empty
+                db.execute("INSERT INTO slices VALUES (?, ?, ?, NULL, ?)",
+                           (account, region, kind, time.time()))
+
+    def resources(self, account, regions):
+        """{kind: [item, ...]} in region order, then discovery order."""
+        order = {region: index for index, region in enumerate(regions)}
+        with self._connect() as db:
+            rows = db.execute("SELECT region, kind, position, payload FROM resources WHERE account = ?",
+                              (account,)).fetchall()
+        result = {}
+        for region, kind, _, payload in sorted(rows, key=lambda row: (order.get(row[0], len(order)), row[2])):
+            result.setdefault(kind, []).append(json.loads(payload))
+        return result
+
+    def etag(self, account):
+        with self._connect() as db:
+            rows = db.execute("SELECT region, kind, digest FROM slices WHERE account = ? ORDER BY region, kind",
+                              (account,)).fetchall()
+        return hashlib.sha256(json.dumps(rows).encode()).hexdigest()[:32]
+
+
+class Inventory:
+    """
+    Serves snapshots from the store, re-scanning only the slices that are
+    due. scanners maps kind -> scan(credentials, region), returning a list
+    of resources or None when the scan failed.
+    """
+
+    def __init__(self, store, list_regions, scanners, ttls, regions_ttl, empty_ttl=None, concurrency=1,
+                 cached_indexes=32):
+        self.store = store
+        self.list_regions = list_regions
+        self.scanners = scanners
+        self.ttls = ttls
+        self.regions_ttl = regions_ttl
+        self.empty_ttl = empty_ttl
+        self.concurrency = concurrency
+        self.cached_indexes = cached_indexes
+        self._indexes = OrderedDict()
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _account_lock(self, account):
+        with self._lock:
+            return self._locks.setdefault(account, threading.Lock())
+
+    def _due(self, scanned, kind, now, force):
+        if scanned is None:
+            return True
+        if force:
+            return True
+        scanned_at, empty = scanned
+        # Regions known to be empty are left alone until empty_ttl
+        if empty and self.empty_ttl is not None:
+            return now - scanned_at > self.empty_ttl
+        return now - scanned_at > self.ttls[kind]
+
+    def _scan(self, account, credentials, region, kind):
+        items = self.scanners[kind](credentials, region)
+        if items is None:
+            self.store.touch_slice(account, region, kind)
+        else:
+            self.store.save_slice(account, region, kind, items)
+
+    def snapshot(self, account, credentials, refresh=False):
+        """Return ({kind: resources}, etag), scanning whatever is due first."""
+        regions, etag = self.refresh(account, credentials, refresh)
+        return self.store.resources(account, regions), etag
+
+    def refresh(self, account, credentials, force=False):
+        """Re-scan the slices that are due (all of them when forced); returns (regions, etag)."""
+        with self._account_lock(account):
+            now = time.time()
+            known = self.store.regions(account)
+            if force or known is None or now - known[1] > self.regions_ttl:
+                regions = self.list_regions(credentials)
+                self.store.save_regions(account, regions)
+            else:
+                regions = known[0]
+
+            scanned = self.store.slices(account)
+            due = [(region, kind) for region in regions for kind in self.scanners
+                   if self._due(scanned.get((region, kind)), kind, now, force)]
+            with ThreadPoolExecutor(max_workers=max(1, self.concurrency)) as pool:
+                futures = [pool.submit(contextvars.copy_context().run, self._scan, account, credentials, region, kind)
+                           for region, kind in due]
+                for future in futures:
+                    future.result()
+            return regions, self.store.etag(account)
+
+    def index(self, account, credentials, kind):
+        """(InventoryIndex, etag) for one resource kind, rebuilt only when the snapshot changes."""
+        regions, etag = self.refresh(account, credentials)
+        key = (account, kind)
+        with self._lock:
+            cached = self._indexes.get(key)
+            if cached is not None and cached[0] == etag:
+                self._indexes.move_to_end(key)
+                return cached[1], etag
+        index = InventoryIndex(self.store.resources(account, regions).get(kind, []))
+        with self._lock:
+            self._indexes[key] = (etag, index)
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > self.cached_indexes:
+                self._indexes.popitem(last=False)
+        return index, etag
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class InventoryIndex:
+    """
+    Posting sets per filterable field and tag, a trigram index over names
+    and ids, and lazily built sort orders over one kind of resource. A
+    selective query is answered from its matches alone and a broad one by
+    walking the sort order, so a page costs roughly the same at any fleet
+    size. Searches shorter than three characters have no trigram to look
+    up and scan every name and id instead.
+    """
+
+    FIELDS = ("region", "state", "type", "engine", "os")
+    SORT_FIELDS = ("name", "id", "region", "state", "type", "engine", "os")
+    # Matches below this share of the fleet are sorted directly rather than found in the sort order
+    SPARSE_SHARE = 0.25
+
+    def __init__(self, items):
+        self.items = items
+        self.postings = {field: {} for field in self.FIELDS}
+        self.tags = {}
+        self.search = []
+        self.trigrams = {}
+        for position, item in enumerate(items):
+            for field in self.FIELDS:
+                if field in item:
+                    self.postings[field].setdefault(str(item[field]).lower(), set()).add(position)
+            # Tags match case-insensitively, like the fields
+            for key, value in (item.get("tags") or {}).items():
+                values = self.tags.setdefault(str(key).lower(), {})
+                values.setdefault(str(value).lower(), set()).add(position)
+            text = f"{item.get('name', '')}\n{item.get('id', '')}".lower()
+            self.search.append(text)
+            for gram in _trigrams(text):
+                self.trigrams.setdefault(gram, set()).add(position)
+        self._orders = {}
+        self._orders_lock = threading.Lock()
+
+    def _sort_key(self, item, field):
+        return (str(item.get(field) or "").lower(), item.get("region", ""), item.get("id", ""))
+
+    def _order(self, field):
+        """(positions, keys), both ascending by field."""
+        with self._orders_lock:
+            order = self._orders.get(field)
+            if order is None:
+                positions = sorted(range(len(self.items)), key=lambda p: self._sort_key(self.items[p], field))
+                order = self._orders[field] = (positions, [self._sort_key(self.items[p], field) for p in positions])
+            return order
+
+    def _candidates(self, filters, tags, text):
+        """Positions matching every filter, or None when nothing is filtered."""
+        candidates = None
+        for field, values in filters.items():
+            if not values:
+                continue
+            postings = self.postings.get(field, {})
+            matched = set().union(*(postings.get(str(value).lower(), set()) for value in values))
+            candidates = matched if candidates is None else candidates & matched
+        for tag in tags:
+            key, _, value = tag.lower().partition("=")
+            values = self.tags.get(key, {})
+            matched = values.get(value, set()) if "=" in tag else set().union(*values.values())
+            candidates = matched if candidates is None else candidates & matched
+        if text:
+            text = text.lower()
+            pool = self._text_pool(text)
+            if pool is None:
+                pool = range(len(self.items)) if candidates is None else candidates
+            elif candidates is not None:
+                pool = pool & candidates
+            candidates = {position for position in pool if text in self.search[position]}
+        return candidates
+
+    def _text_pool(self, text):
+        """Positions holding every trigram of text, or None when text is too short to have one."""
+        grams = _trigrams(text)
+        if not grams:
+            return None
+        postings = sorted((self.trigrams.get(gram, set()) for gram in grams), key=len)
+        return set.intersection(*postings)
+
+    def _sparse_page(self, candidates, field, descending, limit, after):
+        """The page straight from the matches, without walking the whole sort order."""
+        keyed = ((self._sort_key(self.items[position], field), position) for position in candidates)
+        if after is not None:
+            after = tuple(after)
+            keyed = (entry for entry in keyed if (entry[0] < after if descending else entry[0] > after))
+        pick = heapq.nlargest if descending else heapq.nsmallest
+        return [position for _, position in pick(limit, keyed)]
+
+    def query(self, filters=None, tags=(), text="", sort="name", limit=50, after=None):
+        """
+        Return (items, total, last_key). filters maps field -> accepted values,
+        tags are "Key" or "Key=Value", sort is a field optionally prefixed
+        with "-", after is the last_key of the previous page.
+        """
+        descending = sort.startswith("-")
+        field = sort.lstrip("-")
+        if field not in self.SORT_FIELDS:
+            raise ValueError(f"Cannot sort by {field}")
+        candidates = self._candidates(filters or {}, tags, text)
+        total = len(self.items) if candidates is None else len(candidates)
+        if candidates is not None and total < len(self.items) * self.SPARSE_SHARE:
+            page = self._sparse_page(candidates, field, descending, limit, after)
+            last_key = list(self._sort_key(self.items[page[-1]], field)) if len(page) == limit else None
+            return [self.items[position] for position in page], total, last_key
+        positions, keys = self._order(field)
+
+        if after is None:
+            start = 0
+        elif descending:
+            start = len(keys) - bisect.bisect_left(keys, tuple(after))
+        else:
+            start = bisect.bisect_right(keys, tuple(after))
+
+        page = []
+        count = len(positions)
+        for offset in range(start, count):
+            position = positions[count - 1 - offset] if descending else positions[offset]
+            if candidates is not None and position not in candidates:
+                continue
+            page.append(position)
+            if len(page) == limit:
+                break
+        last_key = None
+        if len(page) == limit:
+            last_key = list(self._sort_key(self.items[page[-1]], field))
+        return [self.items[position] for position in page], total, last_key
+
+
+def encode_cursor(query_digest, last_key):
+    payload = json.dumps({"q": query_digest, "k": last_key}).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor, query_digest):
+    """The last_key a cursor resumes after; it must come from the same query."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        last_key = payload["k"]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    if payload.get("q") != query_digest:
+        raise InvalidCursor("Cursor belongs to a different query")
+    return last_key
+
+
+def query_digest(document):
+    return _digest(document)[:16]
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/").strip('"') == etag for tag in candidates)
@@ -1,22 +1,56 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from typing import List, Optional
 from pydantic import BaseModel
 import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
 from datetime import datetime, timedelta
+import asyncio
+import contextvars
+import hashlib
+import re
+import time
+import io
+from concurrent.futures import ThreadPoolExecutor
 import os
 import tempfile
 import pytz
 import matplotlib
 matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak
-from reportlab.pdfgen import canvas
+from chart_cache import ChartCache, chart_key, series_digest
+from charts import TEMPLATE_STYLE, host_chart, host_figure_size, metric_chart
+from exports import EXPORT_FORMATS, ExportUnavailable, build_export, summarize_datapoints
+from streaming import ReportBody, ReportJanitor, spooled_buffer, stream_report
+from encoding import json_response
+from delivery import (REPORT_BUCKET, deliver_in_background, delivery_client, delivery_enabled, report_key,
+                      upload_body, upload_bytes)
+from telemetry import (CHART_RENDER_SECONDS, DISCOVERY_SECONDS, METRIC_FETCH_SECONDS, PDF_BUILD_SECONDS,
+                       REGISTRY, REPORT_PAGES, REPORT_REQUESTS, REPORT_SECONDS, REPORT_SIZE_BYTES, ROLLUP_DAYS,
+                       METRIC_WINDOWS, UPLOAD_SECONDS, instrument_session, observe, report_log, timed)
+from tracing import span, tracing_enabled
+from cassette import anchored, attach_cassette
+from ratelimit import call_with_retries, limiter_for
+from coalesce import BuiltReport, ReportCoalescer, request_fingerprint
+from scheduler import IST, PregenerationScheduler, ReportStore, load_requests
+from rollups import AggregateStore, assemble_series, split_by_day
+from archive import MetricArchive
+from catalog import MetricCatalog
+from credentials import CredentialValidator, InvalidCredentials, credential_digest
+from assume_role import AssumedRoleCache
+from progress import ReportJobs, emit as emit_progress, sse_message
+import cancellation
+from cancellation import BuildCancelled, Cancellation, DeadlineExceeded
+from workers import INTERACTIVE, PRIORITIES, SCHEDULED, FairShareScheduler
+from preview import SummarySeries, build_preview_pdf, fetch_summaries, fleet_summary
+from inventory import (Inventory, InventoryIndex, InventoryStore, InvalidCursor, decode_cursor, encode_cursor,
+                       etag_matches, query_digest)
 
 class Instance(BaseModel):
     id: str
@@ -27,18 +61,45 @@ class Instance(BaseModel):
     region: str = ""
     os: str = "linux"
 
-class Credentials(BaseModel):
+class AwsCredentials(BaseModel):
     accessKeyId: str
     secretAccessKey: str
     region: Optional[str] = None
     accountId: Optional[str] = None
+    # Role to assume with the keys above, e.g. a member account's reporting role
+    roleArn: Optional[str] = None
+    externalId: Optional[str] = None
+    sessionPolicy: Optional[str] = None
+
+class Credentials(AwsCredentials):
     accountName: str
 
+class RdsInstance(BaseModel):
+    id: str
+    name: str = ""
+    engine: str = ""
+    state: str = ""
+    region: str = ""
+
 class ReportRequest(BaseModel):
     provider: str
     credentials: Credentials
     selected_instances: List[Instance]
+    # Only summarized by previews; full reports cover EC2 hosts
+    selected_rds_instances: List[RdsInstance] = []
     frequency: str
+    format: str = "pdf"
+    deliver_exports: List[str] = []
+    # IST calendar day (YYYY-MM-DD) the report window ends on; rolling window when unset
+    report_date: Optional[str] = None
+    # Seconds the build may take, capped at REPORT_DEADLINE_SECONDS
+    deadline_seconds: Optional[float] = None
+    # On deadline, return what was gathered, clearly marked, rather than an error
+    allow_partial: bool = True
+    # "interactive" or "scheduled"; batch callers should say scheduled
+    priority: str = INTERACTIVE
+    # "metric" for one chart per metric, "host" for one small-multiples chart per host
+    chart_layout: Optional[str] = None
 
 app = FastAPI()
 
@@ -49,58 +110,199 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["*"],
-    expose_headers=["Content-Disposition"]
+    expose_headers=["Content-Disposition", "Content-Length", "Content-Range", "Accept-Ranges", "X-Report-Location", "X-Report-Source", "X-Report-Partial", "X-Report-Job", "ETag"]
 )
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    if not tracing_enabled():
+        return await call_next(request)
+    with span(f"{request.method} {request.url.path}", **{"http.method": request.method,
+                                                         "http.target": request.url.path}) as current:
+        response = await call_next(request)
+        current.set_attribute("http.status_code", response.status_code)
+        return response
+
 # Ensure temp directory exists
 if not os.path.exists("temp_reports"):
     os.makedirs("temp_reports")
 
-def generate_metric_graph(metric_data, metric_name, instance_name, temp_dir):
-    if not metric_data or not metric_data.get('Datapoints'):
-        return None
+# Reports are spooled in memory up to this size, then to an unlinked file
+REPORT_SPOOL_MAX_MEMORY = int(os.environ.get("REPORT_SPOOL_MAX_MEMORY", 16 * 1024 * 1024))
 
-    os.makedirs(temp_dir, exist_ok=True)
-    time_series = metric_data['Datapoints']
-    time_series.sort(key=lambda x: x['Timestamp'])
+report_janitor = ReportJanitor(
+    "temp_reports",
+    max_bytes=int(os.environ.get("TEMP_REPORTS_MAX_BYTES", 1024 * 1024 * 1024)),
+    max_age=int(os.environ.get("TEMP_REPORTS_MAX_AGE", 3600))
+)
+
+@app.on_event("startup")
+async def start_report_janitor():
+    asyncio.create_task(report_janitor.run())
+
+CHART_DPI = 150
+CHART_LAYOUTS = ("metric", "host")
+CHART_LAYOUT = os.environ.get("CHART_LAYOUT", "metric")
+
+# Metric families in report order; the catalog expands disk into one series per disk
+REPORT_METRICS = ["cpu", "memory", "disk"]
+
+# CloudWatch fetch parallelism; the adaptive limiter keeps it under the account's TPS
+METRIC_FETCH_CONCURRENCY = int(os.environ.get("METRIC_FETCH_CONCURRENCY", 16))
+CLOUDWATCH_INITIAL_TPS = float(os.environ.get("CLOUDWATCH_INITIAL_TPS", 20))
+CLOUDWATCH_MAX_TPS = float(os.environ.get("CLOUDWATCH_MAX_TPS", 400))
+REPORT_DEADLINE_SECONDS = float(os.environ.get("REPORT_DEADLINE_SECONDS", 900))
+# Time a build that ran out of time still gets to lay out its partial report
+REPORT_PARTIAL_GRACE_SECONDS = float(os.environ.get("REPORT_PARTIAL_GRACE_SECONDS", 60))
+# How often a waiting request checks whether its client is still there
+DISCONNECT_POLL_SECONDS = 0.5
+LIST_METRICS_TPS = float(os.environ.get("LIST_METRICS_TPS", 10))
+GET_METRIC_DATA_TPS = float(os.environ.get("GET_METRIC_DATA_TPS", 10))
+PREVIEW_DEADLINE_SECONDS = float(os.environ.get("PREVIEW_DEADLINE_SECONDS", 30))
+
+metric_catalog = MetricCatalog(ttl=float(os.environ.get("METRIC_CATALOG_TTL", 6 * 3600)))
+
+# Report builds share this many workers; each AWS account gets at most a few,
+# and scheduled builds always leave some for interactive requests
+report_workers = FairShareScheduler(
+    workers=int(os.environ.get("REPORT_WORKERS", 4)),
+    per_account=int(os.environ.get("REPORT_ACCOUNT_CONCURRENCY", 2)),
+    interactive_reserved=int(os.environ.get("REPORT_INTERACTIVE_RESERVED", 1))
+)
+
+def report_slot(request, priority=None):
+    # accountId was verified before the request was queued
+    return report_workers.slot(request.credentials.accountId, priority or request.priority)
+
+report_coalescer = ReportCoalescer(
+    ttl=float(os.environ.get("REPORT_RESULT_TTL", 120)),
+    max_entries=int(os.environ.get("REPORT_RESULT_CACHE_SIZE", 16))
+)
+
+# Reports built ahead of time by the scheduler, kept for a week by default
+PREGENERATED_DIR = os.environ.get("PREGENERATED_DIR", "pregenerated")
+pregenerated_reports = ReportStore(PREGENERATED_DIR)
+pregenerated_janitor = ReportJanitor(
+    PREGENERATED_DIR,
+    max_bytes=int(os.environ.get("PREGENERATED_MAX_BYTES", 4 * 1024 * 1024 * 1024)),
+    max_age=int(os.environ.get("PREGENERATED_RETENTION_DAYS", 7)) * 86400,
+    interval=3600
+)
+
+# Per-day aggregates that weekly and monthly reports are assembled from
+ROLLUP_FREQUENCIES = ("weekly", "monthly")
+daily_aggregates = AggregateStore(
+    os.environ.get("ROLLUP_DB", "rollups/daily_aggregates.sqlite3"),
+    retention_days=int(os.environ.get("ROLLUP_RETENTION_DAYS", 45)),
+    settle_seconds=int(os.environ.get("ROLLUP_SETTLE_SECONDS", 600))
+)
+
+# Full-resolution copy of everything fetched, read back for windows it covers
+metric_archive = MetricArchive(
+    os.environ.get("METRIC_ARCHIVE_DIR", "metric_archive"),
+    settle_seconds=int(os.environ.get("ROLLUP_SETTLE_SECONDS", 600)),
+    # 0 keeps archived datapoints forever
+    retention_days=int(os.environ.get("METRIC_ARCHIVE_RETENTION_DAYS", 400))
+)
+
+ASSUME_ROLE_SESSION_NAME = os.environ.get("ASSUME_ROLE_SESSION_NAME", "nubinix-reports")
+assumed_roles = AssumedRoleCache(
+    os.environ.get("ASSUME_ROLE_CACHE_DIR", "sts_cache"),
+    duration=int(os.environ.get("ASSUME_ROLE_DURATION", 3600)),
+    refresh_ahead=int(os.environ.get("ASSUME_ROLE_REFRESH_AHEAD", 600))
+)
+
+chart_cache = ChartCache(
+    os.environ.get("CHART_CACHE_DIR", "chart_cache"),
+    int(os.environ.get("CHART_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+)
+
+def chart_series(datapoints, metric_name):
+    """Sorted timestamps and values of one series, with its unit and stats line."""
+    time_series = sorted(datapoints, key=lambda x: x['Timestamp'])
     timestamps = [point['Timestamp'] for point in time_series]
     values = [point['Average'] for point in time_series]
+    unit = time_series[0]['Unit'] if time_series else 'Percent'
+    # Rolled-up series carry exact totals; the plotted points are downsampled
+    summary = summarize_datapoints(datapoints)
+    stats_text = f"Min: {summary['min']:.2f}% | Max: {summary['max']:.2f}% | Avg: {summary['avg']:.2f}%"
+    return timestamps, values, unit, stats_text
 
-    plt.figure(figsize=(10, 4))
-    plt.plot(timestamps, values, color='#FF0066', linewidth=2.5, 
-             marker='o', markersize=3, markerfacecolor='#FF0066', 
-             label='Average', alpha=0.9)
+def chart_filename(temp_dir, instance_name, label):
+    # Disk metrics carry mount points and drive letters, e.g. "disk /var"
+    safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{instance_name}_{label.lower()}")
+    return f"{temp_dir}/{safe_name}.png"
 
-    unit = time_series[0]['Unit'] if time_series else 'Percent'
-    plt.xlabel('Time', fontweight='bold')
-    plt.ylabel(f"{metric_name} ({unit})", fontweight='bold')
+def generate_metric_graph(metric_data, metric_name, instance_name, temp_dir):
+    if not metric_data or not metric_data.get('Datapoints'):
+        return None
+
+    os.makedirs(temp_dir, exist_ok=True)
+    timestamps, values, unit, stats_text = chart_series(metric_data['Datapoints'], metric_name)
 
     start_time = min(timestamps)
     end_time = max(timestamps)
     start_str = start_time.strftime('%Y-%m-%d %H:%M')
     end_str = end_time.strftime('%Y-%m-%d %H:%M')
-    plt.title(f'{instance_name}: {metric_name}\n{start_str} to {end_str}', fontweight='bold')
+    title = f'{instance_name}: {metric_name}\n{start_str} to {end_str}'
+    filename = chart_filename(temp_dir, instance_name, metric_name)
 
-    plt.gcf().autofmt_xdate()
-    plt.xlim(start_time, end_time)
-    plt.grid(True, linestyle='--', alpha=0.7)
+    render_started = time.perf_counter()
+    cache_key = chart_key(series_digest(timestamps, values, unit), metric_name, f"{title}\n{stats_text}",
+                          start_time, end_time, CHART_DPI, style_version=TEMPLATE_STYLE)
+    if chart_cache.get(cache_key, filename):
+        observe(CHART_RENDER_SECONDS, time.perf_counter() - render_started, "chart_render", cached="true")
+        return filename
 
-    if values:
-        min_val = min(values)
-        max_val = max(values)
-        avg_val = sum(values) / len(values)
-        stats_text = f"Min: {min_val:.2f}% | Max: {max_val:.2f}% | Avg: {avg_val:.2f}%"
-        plt.figtext(0.5, 0.01, stats_text, ha='center', fontsize=10, fontweight='bold')
-
-    plt.tight_layout()
-    filename = f"{temp_dir}/{instance_name}_{metric_name.lower()}.png"
-    plt.savefig(filename, dpi=150, bbox_inches='tight')
-    plt.close()
+    metric_chart().render(filename, timestamps, values, f"{metric_name} ({unit})", title, stats_text,
+                          start_time, end_time, CHART_DPI)
 
+    chart_cache.put(cache_key, filename)
+    observe(CHART_RENDER_SECONDS, time.perf_counter() - render_started, "chart_render", cached="false")
     return filename
 
-def get_time_range(frequency):
-    now = datetime.now(pytz.UTC)
+def generate_host_graph(metrics, instance_name, temp_dir):
+    """
+    All of a host's non-empty series as one small-multiples image.
+    Returns (filename, panel count), or (None, 0) when there is nothing to plot.
+    """
+    series = {metric: datapoints for metric, datapoints in metrics.items() if datapoints}
+    if not series:
+        return None, 0
+
+    os.makedirs(temp_dir, exist_ok=True)
+    panels = []
+    digests = []
+    start_time = end_time = None
+    for metric, datapoints in series.items():
+        timestamps, values, unit, stats_text = chart_series(datapoints, metric)
+        panels.append((timestamps, values, unit, f"{metric.upper()}   {stats_text}"))
+        digests.append(f"{metric}={series_digest(timestamps, values, unit)}")
+        start_time = min(start_time or timestamps[0], timestamps[0])
+        end_time = max(end_time or timestamps[-1], timestamps[-1])
+    title = (f"{instance_name}\n{start_time.strftime('%Y-%m-%d %H:%M')} to "
+             f"{end_time.strftime('%Y-%m-%d %H:%M')}")
+    filename = chart_filename(temp_dir, instance_name, "utilization")
+
+    render_started = time.perf_counter()
+    cache_key = chart_key(hashlib.sha256(";".join(digests).encode()).hexdigest(), "host",
+                          "\n".join([title] + [panel[3] for panel in panels]),
+                          start_time, end_time, CHART_DPI, style_version=f"{TEMPLATE_STYLE}-host")
+    if chart_cache.get(cache_key, filename):
+        observe(CHART_RENDER_SECONDS, time.perf_counter() - render_started, "chart_render", cached="true")
+        return filename, len(panels)
+
+    host_chart(len(panels)).render(filename, title, panels, start_time, end_time, CHART_DPI)
+    chart_cache.put(cache_key, filename)
+    observe(CHART_RENDER_SECONDS, time.perf_counter() - render_started, "chart_render", cached="false")
+    return filename, len(panels)
+
+def get_time_range(frequency, report_date=None):
+    if report_date:
+        day = datetime.strptime(report_date, "%Y-%m-%d") + timedelta(days=1)
+        now = IST.localize(day).astimezone(pytz.UTC)
+    else:
+        now = datetime.now(pytz.UTC)
     if frequency == "daily":
         start_time = now - timedelta(days=1)
     elif frequency == "weekly":
@@ -109,122 +311,938 @@ def get_time_range(frequency):
         start_time = now - timedelta(days=30)
     return start_time, now
 
-@app.post("/generate-report")
-async def generate_report(request: ReportRequest):
+def _key_session(credentials, region_name):
+    session = boto3.Session(
+        aws_access_key_id=credentials.accessKeyId,
+        aws_secret_access_key=credentials.secretAccessKey,
+        region_name=region_name
+    )
+    return attach_cassette(instrument_session(session))
+
+def assume_role(credentials, role_arn, session_policy, external_id, duration):
+    sts = _key_session(credentials, credentials.region or 'us-east-1').client('sts')
+    params = {"RoleArn": role_arn, "RoleSessionName": ASSUME_ROLE_SESSION_NAME, "DurationSeconds": duration}
+    if session_policy:
+        params["Policy"] = session_policy
+    if external_id:
+        params["ExternalId"] = external_id
+    return sts.assume_role(**params)["Credentials"]
+
+def aws_session(credentials, region_name):
+    if not credentials.roleArn:
+        return _key_session(credentials, region_name)
+    # One AssumeRole per role and policy per hour, shared by every thread and worker
+    assumed = assumed_roles.credentials(
+        credential_digest(credentials),
+        credentials.roleArn,
+        lambda *args: assume_role(credentials, *args),
+        credentials.sessionPolicy,
+        credentials.externalId
+    )
+    session = boto3.Session(
+        aws_access_key_id=assumed["AccessKeyId"],
+        aws_secret_access_key=assumed["SecretAccessKey"],
+        aws_session_token=assumed["SessionToken"],
+        region_name=region_name
+    )
+    return attach_cassette(instrument_session(session))
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(REGISTRY.expose(), media_type="text/plain; version=0.0.4")
+
+@app.get("/chart-cache/stats")
+async def get_chart_cache_stats():
+    return chart_cache.stats()
+
+@app.get("/workers/stats")
+async def get_worker_stats():
+    return report_workers.stats()
+
+def probe_identity(credentials):
+    session = aws_session(credentials, credentials.region or 'us-east-1')
+    sts = session.client('sts', config=Config(connect_timeout=5, read_timeout=5,
+                                              retries={'total_max_attempts': 2, 'mode': 'standard'}))
+    return sts.get_caller_identity()
+
+credential_validator = CredentialValidator(
+    probe_identity,
+    ttl=float(os.environ.get("CREDENTIAL_CACHE_TTL", 300)),
+    negative_ttl=float(os.environ.get("CREDENTIAL_NEGATIVE_CACHE_TTL", 30))
+)
+
+def resolve_account_id(credentials):
+    """
+    Set accountId to the account the keys belong to, from the (cached) caller
+    identity. Whatever the client sent is overwritten: inventory, archives and
+    rollups are keyed by it. Raises InvalidCredentials for keys STS rejects.
+    """
+    credentials.accountId = credential_validator.validate(credentials)["accountId"]
+    return credentials
+
+@app.post("/validate-credentials")
+async def validate_credentials(credentials: AwsCredentials):
+    try:
+        identity = await asyncio.to_thread(credential_validator.validate, credentials)
+    except InvalidCredentials as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except (ClientError, BotoCoreError) as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    return {"status": "success", "message": "Credentials validated successfully", **identity}
+
+DISCOVERED_STATES = ["pending", "running", "shutting-down", "stopping", "stopped"]
+
+def _tags(tags):
+    return {tag['Key']: tag['Value'] for tag in tags or []}
+
+def scan_ec2(credentials, region):
+    ec2_instances = []
+    ec2 = aws_session(credentials, region).client('ec2')
     try:
-        start_time, end_time = get_time_range(request.frequency)
-        temp_dir = tempfile.mkdtemp(dir="temp_reports") #Use temp_reports directory
-        pdf_filename = f"{request.credentials.accountName}-{datetime.now().strftime('%Y-%m-%d')}.pdf"
-        pdf_path = os.path.join(temp_dir, pdf_filename)
-
-        session = boto3.Session(
-            aws_access_key_id=request.credentials.accessKeyId,
-            aws_secret_access_key=request.credentials.secretAccessKey,
-            region_name=request.credentials.region or 'us-east-1'
+        # Terminated instances are filtered out by EC2 rather than fetched and dropped
+        pages = ec2.get_paginator('describe_instances').paginate(
+            Filters=[{"Name": "instance-state-name", "Values": DISCOVERED_STATES}]
         )
-        cloudwatch = session.client('cloudwatch')
+        for page in pages:
+            for reservation in page['Reservations']:
+                for instance in reservation['Instances']:
+                    tags = _tags(instance.get('Tags'))
+                    ec2_instances.append({
+                        "id": instance['InstanceId'],
+                        "name": tags.get('Name', instance['InstanceId']),
+                        "type": instance['InstanceType'],
+                        "state": instance['State']['Name'],
+                        "region": region,
+                        "os": "windows" if instance.get('Platform') == 'windows' else "linux",
+                        "tags": tags,
+                        "selected": False
+                    })
+    except Exception as e:
+        print(f"Error in region {region}: {str(e)}")
+        return None
+    return ec2_instances
 
-        doc = SimpleDocTemplate(pdf_path, pagesize=letter)
-        styles = getSampleStyleSheet()
-        elements = []
+def scan_rds(credentials, region):
+    rds_instances = []
+    try:
+        rds_client = aws_session(credentials, region).client('rds')
+        instances = (instance for page in rds_client.get_paginator('describe_db_instances').paginate()
+                     for instance in page['DBInstances'])
+        for instance in instances:
+            rds_instances.append({
+                "id": instance['DBInstanceIdentifier'],
+                "name": instance.get('DBName', ''),
+                "type": instance['DBInstanceClass'],
+                "engine": instance['Engine'],
+                "size": str(instance.get('AllocatedStorage', 0)) + ' GB',
+                "state": instance['DBInstanceStatus'],
+                "region": region,
+                "tags": _tags(instance.get('TagList')),
+                "selected": False
+            })
+    except Exception as e:
+        if 'OptInRequired' not in str(e) and 'AuthFailure' not in str(e):
+            print(f"Error fetching RDS instances in region {region}: {str(e)}")
+        return None
+    return rds_instances
+
+INVENTORY_SCANNERS = {"ec2": scan_ec2, "rds": scan_rds}
+
+def scan_slice(kind):
+    def scan(credentials, region):
+        with span("scan_region", account=credentials.accountId, region=region, kind=kind) as current, \
+                timed(DISCOVERY_SECONDS, stage="discovery", region=region):
+            items = INVENTORY_SCANNERS[kind](credentials, region)
+            current.set_attribute(f"{kind}.count", len(items or []))
+        return items
+    return scan
+
+def list_regions(credentials):
+    """Regions the account can use; opt-in regions it has not enabled are skipped up front."""
+    session = aws_session(credentials, 'us-east-1')
+    regions = session.client('ec2').describe_regions(AllRegions=True)['Regions']
+    return [region['RegionName'] for region in regions if region.get('OptInStatus') != 'not-opted-in']
+
+inventory = Inventory(
+    InventoryStore(os.environ.get("INVENTORY_DB", "inventory/inventory.sqlite3")),
+    list_regions=list_regions,
+    scanners={kind: scan_slice(kind) for kind in INVENTORY_SCANNERS},
+    ttls={
+        "ec2": float(os.environ.get("INVENTORY_EC2_TTL", 300)),
+        "rds": float(os.environ.get("INVENTORY_RDS_TTL", 1800)),
+    },
+    regions_ttl=float(os.environ.get("INVENTORY_REGIONS_TTL", 86400)),
+    # Slices that were empty last time are only rechecked this often, or when a refresh is forced
+    empty_ttl=float(os.environ.get("INVENTORY_EMPTY_TTL", 6 * 3600)),
+    concurrency=int(os.environ.get("DISCOVERY_CONCURRENCY", 8))
+)
+
+def discover_instances(credentials, refresh=False):
+    resolve_account_id(credentials)
+    resources, etag = inventory.snapshot(account_key(credentials), credentials, refresh)
+    body = {
+        "ec2Instances": resources.get("ec2", []),
+        "rdsInstances": resources.get("rds", [])
+    }
+    return body, etag
+
+@app.post("/instances")
+async def get_instances(credentials: AwsCredentials, request: Request, refresh: bool = False):
+    try:
+        body, etag = await asyncio.to_thread(discover_instances, credentials, refresh)
+    except InvalidCredentials as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # The body depends on the credentials, so only the caller may reuse it
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    print(f"Serving {len(body['ec2Instances'])} EC2 and {len(body['rdsInstances'])} RDS instances")
+    return json_response(request, body, headers=headers)
+
+class InventoryQuery(BaseModel):
+    credentials: AwsCredentials
+    kind: str = "ec2"  # ec2 | rds
+    region: List[str] = []
+    state: List[str] = []
+    type: List[str] = []
+    engine: List[str] = []
+    os: List[str] = []
+    # "Key" (tag present) or "Key=Value"; every tag must match
+    tag: List[str] = []
+    q: str = ""  # substring of name or id
+    sort: str = "name"  # field, "-" prefix for descending
+    limit: int = 50
+    cursor: Optional[str] = None
+
+INVENTORY_PAGE_MAX = 500
+
+def query_inventory(query):
+    if query.kind not in INVENTORY_SCANNERS:
+        raise HTTPException(status_code=400, detail=f"Unknown kind: {query.kind}")
+    limit = max(1, min(query.limit, INVENTORY_PAGE_MAX))
+    filters = {field: getattr(query, field) for field in InventoryIndex.FIELDS}
+    digest = query_digest([query.kind, filters, sorted(query.tag), query.q, query.sort, limit])
+    try:
+        after = decode_cursor(query.cursor, digest) if query.cursor else None
+        resolve_account_id(query.credentials)
+        index, etag = inventory.index(account_key(query.credentials), query.credentials, query.kind)
+        items, total, last_key = index.query(filters, query.tag, query.q, query.sort, limit, after)
+    except (InvalidCursor, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "items": items,
+        "total": total,
+        "nextCursor": encode_cursor(digest, last_key) if last_key else None,
+        "inventoryEtag": etag
+    }
+
+@app.post("/instances/query")
+async def post_inventory_query(query: InventoryQuery, request: Request):
+    try:
+        return json_response(request, await asyncio.to_thread(query_inventory, query))
+    except HTTPException:
+        raise
+    except InvalidCredentials as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Title'],
-            fontSize=24,
-            spaceAfter=30
+def account_key(credentials):
+    """Verified account id that the inventory, metric archive and rollups are keyed by."""
+    return resolve_account_id(credentials).accountId
+
+def fetch_metric(cloudwatch, limiter, deadline, instance, spec, start_time, end_time):
+    with span("cloudwatch.get_metric_statistics", host=instance.id, region=instance.region, metric=spec.key), \
+            timed(METRIC_FETCH_SECONDS, stage="metric_fetch", metric=spec.family):
+        response = call_with_retries(
+            lambda: cloudwatch.get_metric_statistics(
+                Namespace=spec.namespace,
+                MetricName=spec.name,
+                Dimensions=spec.dimension_list(),
+                StartTime=start_time,
+                EndTime=end_time,
+                Period=300,
+                Statistics=["Average"]
+            ),
+            limiter,
+            deadline
         )
-        elements.append(Paragraph(f"{request.credentials.accountName}", title_style))
-        elements.append(Paragraph(f"Account {request.frequency.capitalize()} Report", title_style))
-
-        # Add report information table
-        data = [
-            ["Account", request.credentials.accountName],
-            ["Report", "Resource Utilization"],
-            ["Cloud Provider", request.provider.upper()],
-            ["Account ID", request.credentials.accountId or "N/A"],
-            ["Date", datetime.now().strftime("%Y-%m-%d")]
+    datapoints = response['Datapoints']
+    if spec.invert:
+        datapoints = [{**point, 'Average': 100.0 - point['Average'], 'Unit': 'Percent'} for point in datapoints]
+    return datapoints
+
+def fetch_pieces(frequency, start_time, end_time):
+    """
+    Split a report window into the (start, end, day) pieces fetched per host
+    and metric. Weekly and monthly windows go day by day so whole days can be
+    served from, and saved to, the daily aggregates; a rolling daily window
+    stays a single call.
+    """
+    pieces = list(split_by_day(start_time, end_time))
+    if frequency.lower() not in ROLLUP_FREQUENCIES and len(pieces) > 1:
+        return [(start_time, end_time, None)]
+    return pieces
+
+def fetch_metric_piece(cloudwatch, limiter, deadline, account, instance, spec, start_time, end_time):
+    """
+    One host/metric window, from the local archive when it holds the whole
+    window and from CloudWatch otherwise. Returns (datapoints, from_cloudwatch).
+    """
+    cancellation.check()
+    archived = metric_archive.read(account, instance.id, spec.key, start_time, end_time)
+    if archived is not None:
+        METRIC_WINDOWS.inc(source="archive")
+        return archived, False
+    datapoints = fetch_metric(cloudwatch, limiter, deadline, instance, spec, start_time, end_time)
+    METRIC_WINDOWS.inc(source="cloudwatch")
+    return datapoints, True
+
+def archive_fetched(account, to_archive):
+    for metric, batch in to_archive.items():
+        try:
+            with span("archive.append", metric=metric, windows=len(batch)):
+                metric_archive.append(account, metric, batch)
+        except Exception as e:
+            print(f"Error archiving {metric} metrics: {str(e)}")
+
+def cloudwatch_for_region(credentials, account, region, deadline):
+    """CloudWatch client, GetMetricStatistics limiter and metric catalog for one region."""
+    session = aws_session(credentials, region)
+    # Retries are handled by call_with_retries so the limiter sees every throttle
+    cloudwatch = session.client('cloudwatch', config=Config(retries={'total_max_attempts': 1, 'mode': 'standard'}))
+    limiter = limiter_for(account, region, "GetMetricStatistics", CLOUDWATCH_INITIAL_TPS, CLOUDWATCH_MAX_TPS)
+    try:
+        with span("metric_catalog", region=region):
+            index = metric_catalog.index(
+                account, region, cloudwatch,
+                limiter_for(account, region, "ListMetrics", LIST_METRICS_TPS, LIST_METRICS_TPS),
+                deadline
+            )
+    except BuildCancelled:
+        raise
+    except Exception as e:
+        print(f"Error listing metrics in {region}: {str(e)}")
+        index = {}
+    return cloudwatch, limiter, index
+
+def report_deadline(request):
+    seconds = REPORT_DEADLINE_SECONDS
+    if request.deadline_seconds:
+        seconds = min(request.deadline_seconds, seconds)
+    return time.monotonic() + seconds
+
+def degrade_to_partial(request, note):
+    """
+    Called once a build has run out of time. When the request accepts a
+    partial report, record what is missing and allow
+    REPORT_PARTIAL_GRACE_SECONDS to lay out what there is; otherwise the
+    caller re-raises.
+    """
+    current = cancellation.current()
+    if not request.allow_partial or current is None or current.cancelled:
+        return False
+    if not current.partial:
+        current.extend(REPORT_PARTIAL_GRACE_SECONDS)
+    current.mark_partial(note)
+    return True
+
+def fetch_report_data(request, start_time, end_time, deadline=None):
+    account = account_key(request.credentials)
+    default_region = request.credentials.region or 'us-east-1'
+    current = cancellation.current()
+    if deadline is None:
+        deadline = current.deadline if current is not None and current.deadline else report_deadline(request)
+
+    pieces = fetch_pieces(request.frequency, start_time, end_time)
+    use_rollups = request.frequency.lower() in ROLLUP_FREQUENCIES
+    whole_days = [day for _, _, day in pieces if day is not None]
+
+    regions = {}
+    for instance in request.selected_instances:
+        region = instance.region or default_region
+        if region not in regions:
+            try:
+                regions[region] = cloudwatch_for_region(request.credentials, account, region, deadline)
+            except DeadlineExceeded:
+                if not request.allow_partial:
+                    raise
+                regions[region] = None
+    emit_progress("hosts", hosts=len(request.selected_instances), regions=len(regions))
+
+    report_data = [(instance, {}) for instance in request.selected_instances]
+    to_archive = {}
+    unreached = sum(1 for instance in request.selected_instances
+                    if regions[instance.region or default_region] is None)
+    missing = 0
+    with anchored(end_time), ThreadPoolExecutor(max_workers=METRIC_FETCH_CONCURRENCY) as pool:
+        pending = []
+        for instance, metrics in report_data:
+            if regions[instance.region or default_region] is None:
+                continue
+            cloudwatch, limiter, index = regions[instance.region or default_region]
+            # Only the series ListMetrics says exist, with the disks the agent actually reports
+            for spec in metric_catalog.specs_for(index, instance.id, REPORT_METRICS):
+                cached = daily_aggregates.get_many(account, instance.id, spec.key, whole_days) if use_rollups else {}
+                futures = [
+                    (piece, pool.submit(
+                        contextvars.copy_context().run, fetch_metric_piece,
+                        cloudwatch, limiter, deadline, account, instance, spec, piece[0], piece[1]
+                    ))
+                    for piece in pieces if piece[2] not in cached
+                ]
+                pending.append((instance, metrics, spec.key, cached, futures))
+        emit_progress("metrics", done=0, total=len(pending))
+        try:
+            for done, (instance, metrics, metric, cached, futures) in enumerate(pending, 1):
+                try:
+                    results = [(piece, future.result()) for piece, future in futures]
+                except DeadlineExceeded:
+                    if not request.allow_partial:
+                        raise
+                    missing += 1
+                    emit_progress("metrics", done=done, total=len(pending), host=instance.id, metric=metric,
+                                  failed=True)
+                    continue
+                except BuildCancelled:
+                    raise
+                except Exception as e:
+                    print(f"Error getting {metric} metrics for {instance.id}: {str(e)}")
+                    emit_progress("metrics", done=done, total=len(pending), host=instance.id, metric=metric,
+                                  failed=True)
+                    continue
+                emit_progress("metrics", done=done, total=len(pending), host=instance.id, metric=metric)
+                to_archive.setdefault(metric, []).extend(
+                    (instance.id, piece[0], piece[1], datapoints)
+                    for piece, (datapoints, from_cloudwatch) in results if from_cloudwatch
+                )
+                fetched = [(piece, datapoints) for piece, (datapoints, _) in results]
+                metrics[metric], fresh = assemble_series(cached, fetched)
+                for day, aggregate in fresh.items():
+                    daily_aggregates.put(account, instance.id, metric, day, aggregate)
+                ROLLUP_DAYS.inc(len(cached), source="stored")
+                ROLLUP_DAYS.inc(len(fresh), source="fetched")
+        except BuildCancelled:
+            # Queued fetches are dropped; running ones stop at their next check
+            for *_, futures in pending:
+                for _, future in futures:
+                    future.cancel()
+            raise
+    archive_fetched(account, to_archive)
+    if unreached:
+        degrade_to_partial(request, f"{unreached} of {len(report_data)} hosts were not reached before the deadline")
+    if missing:
+        degrade_to_partial(request, f"{missing} of {len(pending)} metric series could not be fetched before the deadline")
+    return report_data
+
+def build_preview(request):
+    """Summary of the report window from batched GetMetricData calls, one batch per region."""
+    start_time, end_time = get_time_range(request.frequency, request.report_date)
+    account = account_key(request.credentials)
+    default_region = request.credentials.region or 'us-east-1'
+    deadline = cancellation.current().deadline
+
+    instances = [{**instance.dict(include={"id", "name", "type", "state", "region", "os"}), "metrics": {}}
+                 for instance in request.selected_instances]
+    databases = [{**database.dict(), "metrics": {}} for database in request.selected_rds_instances]
+    by_region = {}
+    for instance in instances:
+        by_region.setdefault(instance["region"] or default_region, ([], []))[0].append(instance)
+    for database in databases:
+        by_region.setdefault(database["region"] or default_region, ([], []))[1].append(database)
+
+    for region, (region_instances, region_databases) in by_region.items():
+        cloudwatch, _, index = cloudwatch_for_region(request.credentials, account, region, deadline)
+        series = [
+            SummarySeries(("ec2", instance["id"], spec.key), spec.family, spec.namespace, spec.name,
+                          spec.dimensions, spec.invert)
+            for instance in region_instances
+            for spec in metric_catalog.specs_for(index, instance["id"], REPORT_METRICS)
+        ]
+        series += [
+            SummarySeries(("rds", database["id"], "cpu"), "cpu", "AWS/RDS", "CPUUtilization",
+                          (("DBInstanceIdentifier", database["id"]),))
+            for database in region_databases
         ]
+        limiter = limiter_for(account, region, "GetMetricData", GET_METRIC_DATA_TPS, GET_METRIC_DATA_TPS)
+        with span("cloudwatch.get_metric_data", region=region, series=len(series)), anchored(end_time):
+            summaries = fetch_summaries(cloudwatch, limiter, deadline, series, start_time, end_time)
+        resources = {("ec2", item["id"]): item for item in region_instances}
+        resources.update({("rds", item["id"]): item for item in region_databases})
+        for (kind, resource_id, key), stats in summaries.items():
+            resources[(kind, resource_id)]["metrics"][key] = stats
+
+    return {
+        "preview": True,
+        "provider": request.provider,
+        "frequency": request.frequency,
+        "date": request.report_date or datetime.now().strftime("%Y-%m-%d"),
+        "window": {"start": start_time.isoformat(), "end": end_time.isoformat()},
+        "account": {"name": request.credentials.accountName, "id": request.credentials.accountId},
+        "fleet": {"ec2": fleet_summary(instances), "rds": fleet_summary(databases)},
+        "instances": instances,
+        "rdsInstances": databases,
+    }
+
+def build_pdf_report(request, report_data, output, temp_dir):
+    doc = SimpleDocTemplate(output, pagesize=letter)
+    styles = getSampleStyleSheet()
+    elements = []
 
-        table = Table(data, colWidths=[1.5*inch, 3*inch])
-        table.setStyle(TableStyle([
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Title'],
+        fontSize=24,
+        spaceAfter=30
+    )
+    elements.append(Paragraph(f"{request.credentials.accountName}", title_style))
+    elements.append(Paragraph(f"Account {request.frequency.capitalize()} Report", title_style))
+
+    # Add report information table
+    data = [
+        ["Account", request.credentials.accountName],
+        ["Report", "Resource Utilization"],
+        ["Cloud Provider", request.provider.upper()],
+        ["Account ID", request.credentials.accountId or "N/A"],
+        ["Date", request.report_date or datetime.now().strftime("%Y-%m-%d")]
+    ]
+
+    table = Table(data, colWidths=[1.5*inch, 3*inch])
+    table.setStyle(TableStyle([
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('BACKGROUND', (0, 0), (0, -1), colors.grey),
+        ('TEXTCOLOR', (0, 0), (0, -1), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ]))
+    elements.append(table)
+    elements.append(Spacer(1, 20))
+
+    layout = request.chart_layout or CHART_LAYOUT
+
+    def host_charts(metrics):
+        # (label, series) per image: one per metric, or one for the whole host
+        series = {metric: datapoints for metric, datapoints in metrics.items() if datapoints}
+        if layout == "host":
+            return [("resource", series)] if series else []
+        return [(metric, {metric: datapoints}) for metric, datapoints in series.items()]
+
+    charts_total = sum(len(host_charts(metrics)) for _, metrics in report_data)
+    charts_done = 0
+    charts_skipped = 0
+    emit_progress("charts", done=0, total=charts_total)
+
+    # Process each instance
+    for instance, metrics in report_data:
+        elements.append(PageBreak())
+        elements.append(Paragraph(f"Host: {instance.name}", styles['Heading1']))
+
+        # Instance info table
+        instance_data = [
+            ["Instance ID", instance.id],
+            ["Type", instance.type],
+            ["Operating System", instance.os],
+            ["State", instance.state]
+        ]
+
+        instance_table = Table(instance_data, colWidths=[1.5*inch, 4*inch])
+        instance_table.setStyle(TableStyle([
             ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-            ('BACKGROUND', (0, 0), (0, -1), colors.grey),
-            ('TEXTCOLOR', (0, 0), (0, -1), colors.whitesmoke),
+            ('BACKGROUND', (0, 0), (0, -1), colors.white),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
             ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('PADDING', (0, 0), (-1, -1), 6)
         ]))
-        elements.append(table)
+        elements.append(instance_table)
         elements.append(Spacer(1, 20))
 
-        # Process each instance
-        for instance in request.selected_instances:
-            elements.append(PageBreak())
-            elements.append(Paragraph(f"Host: {instance.name}", styles['Heading1']))
-
-            # Instance info table
-            instance_data = [
-                ["Instance ID", instance.id],
-                ["Type", instance.type],
-                ["Operating System", instance.os],
-                ["State", instance.state]
-            ]
-
-            instance_table = Table(instance_data, colWidths=[1.5*inch, 4*inch])
-            instance_table.setStyle(TableStyle([
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-                ('BACKGROUND', (0, 0), (0, -1), colors.white),
-                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('PADDING', (0, 0), (-1, -1), 6)
-            ]))
-            elements.append(instance_table)
-            elements.append(Spacer(1, 20))
-
-            # Get metrics and generate graphs
-            metrics = ["cpu", "memory", "disk"]
-            for metric in metrics:
-                try:
-                    response = cloudwatch.get_metric_statistics(
-                        Namespace="AWS/EC2",
-                        MetricName=f"{metric}Utilization",
-                        Dimensions=[{"Name": "InstanceId", "Value": instance.id}],
-                        StartTime=start_time,
-                        EndTime=end_time,
-                        Period=300,
-                        Statistics=["Average"]
-                    )
-
-                    if response['Datapoints']:
-                        graph_path = generate_metric_graph(response, metric, instance.name, temp_dir)
-                        if graph_path:
-                            elements.append(Paragraph(f"{metric.upper()} UTILIZATION", styles['Heading2']))
-                            img = Image(graph_path, width=6*inch, height=2*inch)
-                            elements.append(img)
-                            elements.append(Spacer(1, 20))
-                except Exception as e:
-                    print(f"Error getting metrics for {instance.id}: {str(e)}")
-
-        doc.build(elements)
-
-        headers = {
-            "Content-Disposition": f"attachment; filename={pdf_filename}",
-            "Access-Control-Expose-Headers": "Content-Disposition",
-            "Access-Control-Allow-Origin": "*"
-        }
-        
-        return FileResponse(
-            path=pdf_path,
-            media_type='application/pdf',
-            filename=pdf_filename,
-            headers=headers
-        )
+        # Generate graphs from the fetched metrics
+        for metric, series in host_charts(metrics):
+            try:
+                cancellation.check()
+            except DeadlineExceeded:
+                if not request.allow_partial:
+                    raise
+                charts_skipped += 1
+                continue
+            try:
+                if layout == "host":
+                    with span("generate_host_graph", host=instance.id, metrics=len(series)):
+                        graph_path, rows = generate_host_graph(series, instance.name, temp_dir)
+                    width, height = host_figure_size(rows)
+                    # Fit the page frame below the host table
+                    scale = min(6.5 / width, 6.5 / height)
+                    size = (width * scale * inch, height * scale * inch)
+                else:
+                    with span("generate_metric_graph", host=instance.id, metric=metric):
+                        graph_path = generate_metric_graph({'Datapoints': series[metric]}, metric, instance.name,
+                                                           temp_dir)
+                    size = (6*inch, 2*inch)
+                if graph_path:
+                    elements.append(Paragraph(f"{metric.upper()} UTILIZATION", styles['Heading2']))
+                    img = Image(graph_path, width=size[0], height=size[1])
+                    elements.append(img)
+                    elements.append(Spacer(1, 20))
+            except Exception as e:
+                print(f"Error rendering {metric} graph for {instance.id}: {str(e)}")
+            charts_done += 1
+            emit_progress("charts", done=charts_done, total=charts_total, host=instance.id, metric=metric)
+
+    if charts_skipped:
+        degrade_to_partial(request, f"{charts_skipped} of {charts_total} charts were not rendered before the deadline")
+    current = cancellation.current()
+    partial = current.partial if current is not None else []
+    if partial:
+        notice = ParagraphStyle('PartialNotice', parent=styles['Normal'], textColor=colors.red, spaceAfter=12)
+        elements[2:2] = [Paragraph("<b>PARTIAL REPORT</b>: " + "; ".join(partial) + ".", notice)]
+
+    def page_laid_out(canvas, doc):
+        # Raising here is the only way to stop reportlab between pages
+        cancellation.check()
+        if partial:
+            canvas.saveState()
+            canvas.setFillColor(colors.red)
+            canvas.setFont('Helvetica-Bold', 9)
+            canvas.drawString(0.5*inch, letter[1] - 0.4*inch, "PARTIAL REPORT - data incomplete")
+            canvas.restoreState()
+        emit_progress("pages", page=doc.page)
+
+    with span("build_pdf", account=request.credentials.accountId, hosts=len(report_data)), \
+            timed(PDF_BUILD_SECONDS, stage="pdf_build"):
+        doc.build(elements, onFirstPage=page_laid_out, onLaterPages=page_laid_out)
+    return doc.page
+
+def deliver_export(s3, request, fmt, report_data, start_time, end_time, report_date):
+    media_type, extension = EXPORT_FORMATS[fmt]
+    client_name = request.credentials.accountName
+    content = build_export(request.copy(update={"format": fmt}), report_data, start_time, end_time)
+    with timed(UPLOAD_SECONDS, stage="upload", format=fmt):
+        return upload_bytes(s3, client_name, report_date, f"{client_name}-{report_date}.{extension}",
+                            content, media_type)
+
+def deliver_body(s3, key, body, media_type, fmt):
+    """Upload a built report; holds a reference to body until the upload is done."""
+    try:
+        with timed(UPLOAD_SECONDS, stage="upload", format=fmt):
+            return upload_body(s3, key, body, media_type)
+    finally:
+        body.release()
+
+def deliver_report(request, body, media_type, filename, report_date):
+    """
+    Queue the report for the client's bucket and return where it will land.
+    The upload runs in the background, so the object shows up at that
+    location shortly after the response, and a failed upload is only logged.
+    """
+    s3 = delivery_client()
+    key = report_key(request.credentials.accountName, report_date, filename)
+    deliver_in_background(key, deliver_body, s3, key, body.retain(), media_type, request.format)
+    return f"s3://{REPORT_BUCKET}/{key}"
+
+def mark_partial(headers, log_fields):
+    current = cancellation.current()
+    if current is None or not current.partial:
+        return False
+    headers["X-Report-Partial"] = "; ".join(current.partial)
+    log_fields["partial"] = True
+    return True
 
+def build_report(request, log_fields):
+    start_time, end_time = get_time_range(request.frequency, request.report_date)
+    with span("fetch_report_data", account=request.credentials.accountId, hosts=len(request.selected_instances)):
+        report_data = fetch_report_data(request, start_time, end_time)
+    report_date = request.report_date or datetime.now().strftime('%Y-%m-%d')
+    client_name = request.credentials.accountName
+    headers = {
+        "Access-Control-Expose-Headers": "Content-Disposition, Content-Length, Content-Range, X-Report-Location, X-Report-Source, X-Report-Partial",
+        "Access-Control-Allow-Origin": "*"
+    }
+
+    if request.format in EXPORT_FORMATS:
+        media_type, extension = EXPORT_FORMATS[request.format]
+        export_filename = f"{client_name}-{report_date}.{extension}"
+        content = build_export(request, report_data, start_time, end_time)
+        body = ReportBody(io.BytesIO(content))
+        if delivery_enabled():
+            headers["X-Report-Location"] = deliver_report(request, body, media_type, export_filename, report_date)
+        REPORT_SIZE_BYTES.observe(len(content), format=request.format)
+        log_fields["bytes"] = len(content)
+        emit_progress("written", bytes=len(content))
+        headers["Content-Disposition"] = f"attachment; filename={export_filename}"
+        return BuiltReport(body, media_type, headers, partial=mark_partial(headers, log_fields))
+
+    pdf_filename = f"{client_name}-{report_date}.pdf"
+    buffer = spooled_buffer(REPORT_SPOOL_MAX_MEMORY, "temp_reports")
+    try:
+        # Chart PNGs only live until the PDF has embedded them
+        with tempfile.TemporaryDirectory(dir="temp_reports", ignore_cleanup_errors=True) as temp_dir:
+            pages = build_pdf_report(request, report_data, buffer, temp_dir)
+    except Exception:
+        buffer.close()
+        raise
+
+    body = ReportBody(buffer)
+    if delivery_enabled():
+        headers["X-Report-Location"] = deliver_report(request, body, 'application/pdf', pdf_filename, report_date)
+        s3 = delivery_client()
+        for fmt in request.deliver_exports:
+            deliver_in_background(f"{fmt} export for {client_name}", deliver_export,
+                                  s3, request, fmt, report_data, start_time, end_time, report_date)
+    REPORT_SIZE_BYTES.observe(body.size, format="pdf")
+    REPORT_PAGES.observe(pages)
+    log_fields.update({"bytes": body.size, "pages": pages})
+    emit_progress("written", bytes=body.size, pages=pages)
+    headers["Content-Disposition"] = f"attachment; filename={pdf_filename}"
+    return BuiltReport(body, 'application/pdf', headers, partial=mark_partial(headers, log_fields))
+
+def build_report_logged(request):
+    if cancellation.current() is None:
+        # Scheduled builds run outside the coalescer but still get a deadline
+        with cancellation.scope(Cancellation(report_deadline(request))):
+            return build_report_logged(request)
+    report_started = time.perf_counter()
+    with report_log(account=request.credentials.accountName, accountId=request.credentials.accountId,
+                    frequency=request.frequency, format=request.format,
+                    hosts=len(request.selected_instances)) as log_fields, \
+            span("generate_report", account=request.credentials.accountId,
+                 frequency=request.frequency, format=request.format):
+        built = build_report(request, log_fields)
+    REPORT_SECONDS.observe(time.perf_counter() - report_started, format=request.format)
+    return built
+
+def find_pregenerated(request):
+    """
+    Serve a daily request from the scheduler's output. Only requests naming
+    the report date match: an undated request is a rolling 24 hours ending
+    now, which no pregenerated calendar-day report covers.
+    """
+    if request.frequency != "daily" or not request.report_date:
+        return None
+    return pregenerated_reports.load(request_fingerprint(request))
+
+@app.on_event("startup")
+async def start_pregeneration():
+    config_path = os.environ.get("PREGENERATE_CONFIG")
+    if not config_path:
+        return
+    requests = load_requests(config_path, ReportRequest)
+    scheduler = PregenerationScheduler(
+        requests,
+        pregenerated_reports,
+        build_report_logged,
+        start_offset=timedelta(minutes=float(os.environ.get("PREGENERATE_START_MINUTES", 15))),
+        window=timedelta(minutes=float(os.environ.get("PREGENERATE_WINDOW_MINUTES", 120))),
+        admit=lambda request: report_slot(request, SCHEDULED)
+    )
+
+    async def run():
+        # Live requests always carry a verified accountId, so fingerprints must too
+        for request in list(requests):
+            try:
+                await asyncio.to_thread(resolve_account_id, request.credentials)
+            except Exception as e:
+                print(f"Not pre-generating for {request.credentials.accountName}: {str(e)}")
+                requests.remove(request)
+        await scheduler.run()
+
+    asyncio.create_task(run())
+    asyncio.create_task(pregenerated_janitor.run())
+
+def report_response(built, source, http_request):
+    headers = {**built.headers, "X-Report-Source": source}
+    return stream_report(built.body, built.media_type, headers, http_request.headers.get("range"),
+                         http_request.headers.get("accept-encoding"))
+
+async def check_report_request(request):
+    if request.format != "pdf" and request.format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported report format: {request.format}")
+    unknown_exports = [fmt for fmt in request.deliver_exports if fmt not in EXPORT_FORMATS]
+    if unknown_exports:
+        raise HTTPException(status_code=400, detail=f"Unsupported export formats: {', '.join(unknown_exports)}")
+    if request.priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of: {', '.join(PRIORITIES)}")
+    if request.chart_layout is not None and request.chart_layout not in CHART_LAYOUTS:
+        raise HTTPException(status_code=400, detail=f"chart_layout must be one of: {', '.join(CHART_LAYOUTS)}")
+    if request.report_date:
+        try:
+            datetime.strptime(request.report_date, "%Y-%m-%d")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="report_date must be YYYY-MM-DD")
+    # Before fingerprinting, so requests with and without accountId share builds
+    try:
+        await asyncio.to_thread(resolve_account_id, request.credentials)
+    except InvalidCredentials as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except ClientError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+async def produce_report(request):
+    """Return (BuiltReport, source) from the pregenerated store, the coalescer's cache or a new build."""
+    pregenerated = find_pregenerated(request)
+    if pregenerated is not None:
+        return pregenerated, "pregenerated"
+    # Identical concurrent requests share one build; repeats within
+    # REPORT_RESULT_TTL seconds are served from the finished result
+    return await report_coalescer.run(request_fingerprint(request), lambda: build_report_logged(request),
+                                      deadline=report_deadline(request), admit=lambda: report_slot(request))
+
+async def until_disconnected(http_request):
+    while not await http_request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+async def unless_disconnected(http_request, work):
+    """
+    Await work, cancelling it if the client goes away first. Returns None in
+    that case; the coalescer then cancels the build unless others wait on it.
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(until_disconnected(http_request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+    if not task.done():
+        task.cancel()
+        return None
+    return task.result()
+
+@app.post("/generate-report")
+async def generate_report(request: ReportRequest, http_request: Request):
+    await check_report_request(request)
+    try:
+        produced = await unless_disconnected(http_request, produce_report(request))
+        if produced is None:
+            REPORT_REQUESTS.inc(source="disconnected")
+            # Nobody is listening; 499 only shows up in access logs
+            return Response(status_code=499)
+        built, source = produced
+        REPORT_REQUESTS.inc(source=source)
+        return report_response(built, source, http_request)
+
+    except ExportUnavailable as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=f"Report deadline exceeded: {str(e)}")
     except Exception as e:
         import traceback
         error_trace = traceback.format_exc()
         print(f"Error generating report: {str(e)}\n{error_trace}")
-        raise HTTPException(status_code=500, detail=f"Report generation failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Report generation failed: {str(e)}")
+
+# Background builds: create a job, follow its progress events, then download
+report_jobs = ReportJobs(
+    ttl=float(os.environ.get("REPORT_JOB_TTL", 900)),
+    max_jobs=int(os.environ.get("REPORT_JOB_MAX", 256))
+)
+
+def job_links(job, follower=None):
+    # Only the caller that started following a job can withdraw from it
+    cancel = f"/reports/{job.id}/cancel" + (f"?follower={follower}" if follower else "")
+    return {"events": f"/reports/{job.id}/events", "download": f"/reports/{job.id}/download", "cancel": cancel}
+
+def find_job(job_id):
+    job = report_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired report job")
+    return job
+
+def start_report_job(request):
+    async def build():
+        built, source = await produce_report(request)
+        REPORT_REQUESTS.inc(source=source)
+        return built, source
+
+    job, follower, _ = report_jobs.create(request_fingerprint(request), build)
+    return {**job.status(), **job_links(job, follower)}
+
+@app.post("/reports", status_code=202)
+async def create_report_job(request: ReportRequest):
+    await check_report_request(request)
+    return start_report_job(request)
+
+@app.post("/reports/preview")
+async def preview_report(request: ReportRequest, http_request: Request, summary_format: str = "json",
+                         start_full: bool = False):
+    """
+    First-page summary in seconds, as JSON or a one-page PDF. With
+    start_full, the full report is queued as a job from the same request.
+    """
+    if summary_format not in ("json", "pdf"):
+        raise HTTPException(status_code=400, detail="summary_format must be json or pdf")
+    await check_report_request(request)
+    job = start_report_job(request) if start_full else None
+    preview_cancellation = Cancellation(time.monotonic() + PREVIEW_DEADLINE_SECONDS)
+
+    def build():
+        with cancellation.scope(preview_cancellation):
+            summary = build_preview(request)
+        if summary_format == "json":
+            return summary, None
+        output = io.BytesIO()
+        build_preview_pdf(summary, output)
+        return summary, output.getvalue()
+
+    try:
+        built = await unless_disconnected(http_request, asyncio.to_thread(build))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=f"Preview deadline exceeded: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Preview failed: {str(e)}")
+    if built is None:
+        preview_cancellation.cancel("client disconnected")
+        return Response(status_code=499)
+    REPORT_REQUESTS.inc(source="preview")
+    summary, pdf = built
+    if pdf is None:
+        return json_response(http_request, {**summary, "job": job})
+    headers = {"Content-Disposition": f"attachment; filename={request.credentials.accountName}-preview.pdf"}
+    if job is not None:
+        headers["X-Report-Job"] = job["jobId"]
+    return Response(pdf, media_type="application/pdf", headers=headers)
+
+@app.post("/reports/{job_id}/cancel")
+async def cancel_report_job(job_id: str, follower: str = ""):
+    """
+    Stop following a job. The build itself is cancelled only once every
+    caller that created or joined the job has withdrawn.
+    """
+    job = find_job(job_id)
+    report_jobs.cancel(job, follower)
+    return {**job.status(), **job_links(job)}
+
+@app.get("/reports/{job_id}")
+async def report_job_status(job_id: str):
+    job = find_job(job_id)
+    return {**job.status(), **job_links(job)}
+
+@app.get("/reports/{job_id}/events")
+async def report_job_events(job_id: str, http_request: Request, after: int = 0):
+    job = find_job(job_id)
+    # EventSource resends the last id it saw when it reconnects
+    last_event_id = http_request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        after = int(last_event_id)
+
+    async def events():
+        async for record in job.stream(after):
+            yield b": keepalive\n\n" if record is None else sse_message(record)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/reports/{job_id}/download")
+async def download_report_job(job_id: str, http_request: Request):
+    job = find_job(job_id)
+    if job.state == "failed":
+        raise HTTPException(status_code=500, detail=f"Report generation failed: {job.error}")
+    if job.result is None:
+        raise HTTPException(status_code=409, detail=f"Report is {job.state}")
+    built = job.result
+    built.body.retain()
+    return report_response(built, job.source, http_request)
@@ -0,0 +1,200 @@
+"""
+Summary-first report previews.
+
+A preview asks CloudWatch for one average and one peak per series over the
+whole report window, batching every host in a region into GetMetricData
+calls of up to 500 queries, and lays the result out as the account and
+instance summary tables of the full report, without per-host charts.
+"""
+import math
+from dataclasses import dataclass
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from ratelimit import call_with_retries
+
+# GetMetricData accepts at most this many queries per call
+MAX_QUERIES = 500
+
+# Families shown in the preview tables, in column order
+PREVIEW_FAMILIES = ("cpu", "memory", "disk")
+
+
+@dataclass(frozen=True)
+class SummarySeries:
+    ref: tuple  # (kind, resource id, report key)
+    family: str
+    namespace: str
+    name: str
+    dimensions: tuple  # ((Name, Value), ...)
+    invert: bool = False
+
+
+def summary_period(start_time, end_time):
+    """One period covering the whole window, in whole hours as CloudWatch requires for older data."""
+    seconds = (end_time - start_time).total_seconds()
+    return max(3600, math.ceil(seconds / 3600) * 3600)
+
+
+def _queries(series, period):
+    queries = []
+    for index, item in enumerate(series):
+        metric = {
+            "Namespace": item.namespace,
+            "MetricName": item.name,
+            "Dimensions": [{"Name": name, "Value": value} for name, value in item.dimensions],
+        }
+        # The peak of an inverted (free space) series is its minimum
+        peak = "Minimum" if item.invert else "Maximum"
+        for suffix, stat in (("a", "Average"), ("p", peak)):
+            queries.append({
+                "Id": f"s{index}{suffix}",
+                "MetricStat": {"Metric": metric, "Period": period, "Stat": stat},
+                "ReturnData": True,
+            })
+    return queries
+
+
+def fetch_summaries(cloudwatch, limiter, deadline, series, start_time, end_time):
+    """{ref: {"family", "average", "maximum"}} for every series with data."""
+    period = summary_period(start_time, end_time)
+    queries = _queries(series, period)
+    values = {}
+    for offset in range(0, len(queries), MAX_QUERIES):
+        kwargs = {
+            "MetricDataQueries": queries[offset:offset + MAX_QUERIES],
+            "StartTime": start_time,
+            "EndTime": end_time,
+        }
+        while True:
+            page = call_with_retries(lambda: cloudwatch.get_metric_data(**kwargs), limiter, deadline)
+            for result in page.get("MetricDataResults", []):
+                values.setdefault(result["Id"], []).extend(result.get("Values", []))
+            token = page.get("NextToken")
+            if not token:
+                break
+            kwargs["NextToken"] = token
+
+    summaries = {}
+    for index, item in enumerate(series):
+        averages = values.get(f"s{index}a")
+        peaks = values.get(f"s{index}p")
+        if not averages:
+            continue
+        # A window that straddles a period boundary comes back as two values
+        average = sum(averages) / len(averages)
+        peak = (min(peaks) if item.invert else max(peaks)) if peaks else average
+        if item.invert:
+            average, peak = 100.0 - average, 100.0 - peak
+        summaries[item.ref] = {"family": item.family, "average": average, "maximum": peak}
+    return summaries
+
+
+def fleet_summary(resources):
+    """Per-family mean of host averages and the highest peak, over resources' "metrics"."""
+    fleet = {}
+    for resource in resources:
+        families = {}
+        for stats in resource["metrics"].values():
+            families.setdefault(stats["family"], []).append(stats)
+        for family, series in families.items():
+            entry = fleet.setdefault(family, {"averages": [], "maximum": None})
+            # Hosts with several disks count once, at their average across them
+            entry["averages"].append(sum(s["average"] for s in series) / len(series))
+            peak = max(s["maximum"] for s in series)
+            entry["maximum"] = peak if entry["maximum"] is None else max(entry["maximum"], peak)
+    return {
+        family: {"average": sum(entry["averages"]) / len(entry["averages"]),
+                 "maximum": entry["maximum"], "hosts": len(entry["averages"])}
+        for family, entry in fleet.items()
+    }
+
+
+def _percent(value):
+    return "N/A" if value is None else f"{value:.1f}%"
+
+
+def _family_stats(resource, family):
+    series = [s for s in resource["metrics"].values() if s["family"] == family]
+    if not series:
+        return None, None
+    return (sum(s["average"] for s in series) / len(series)), max(s["maximum"] for s in series)
+
+
+def _grid(rows, widths, header_color=colors.lightblue):
+    table = Table(rows, colWidths=widths, repeatRows=1)
+    table.setStyle(TableStyle([
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('BACKGROUND', (0, 0), (-1, 0), header_color),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ]))
+    return table
+
+
+def build_preview_pdf(summary, output):
+    """Lay out a preview summary (as returned by the preview endpoint) into output."""
+    doc = SimpleDocTemplate(output, pagesize=letter, leftMargin=0.5*inch, rightMargin=0.5*inch)
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle('PreviewTitle', parent=styles['Title'], fontSize=22, spaceAfter=20)
+    account = summary["account"]
+    elements = [
+        Paragraph(account["name"], title_style),
+        Paragraph(f"Account {summary['frequency'].capitalize()} Report - Preview", title_style),
+    ]
+
+    info = Table([
+        ["Account", account["name"]],
+        ["Report", "Resource Utilization (summary)"],
+        ["Cloud Provider", summary["provider"].upper()],
+        ["Account ID", account["id"] or "N/A"],
+        ["Date", summary["date"]],
+    ], colWidths=[1.5*inch, 3*inch])
+    info.setStyle(TableStyle([
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('BACKGROUND', (0, 0), (0, -1), colors.grey),
+        ('TEXTCOLOR', (0, 0), (0, -1), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ]))
+    elements += [info, Spacer(1, 16)]
+
+    fleet_rows = [["Fleet", "Metric", "Average", "Peak", "Hosts"]]
+    for kind, label in (("ec2", "EC2"), ("rds", "RDS")):
+        for family in PREVIEW_FAMILIES:
+            stats = summary["fleet"][kind].get(family)
+            if stats:
+                fleet_rows.append([label, family.upper(), _percent(stats["average"]),
+                                   _percent(stats["maximum"]), str(stats["hosts"])])
+    elements += [Paragraph("Fleet Averages", styles['Heading2']),
+                 _grid(fleet_rows, [0.8*inch, 1*inch, 1*inch, 1*inch, 0.8*inch]), Spacer(1, 16)]
+
+    if summary["instances"]:
+        rows = [["Instance ID", "Name", "Type", "State"] + [f"{f.upper()} avg / peak" for f in PREVIEW_FAMILIES]]
+        for instance in summary["instances"]:
+            row = [instance["id"], instance["name"][:24], instance["type"], instance["state"]]
+            for family in PREVIEW_FAMILIES:
+                average, peak = _family_stats(instance, family)
+                row.append(f"{_percent(average)} / {_percent(peak)}")
+            rows.append(row)
+        elements += [Paragraph("Instances", styles['Heading2']),
+                     _grid(rows, [1.3*inch, 1.5*inch, 0.8*inch, 0.7*inch] + [1.1*inch] * len(PREVIEW_FAMILIES)),
+                     Spacer(1, 16)]
+
+    if summary["rdsInstances"]:
+        rows = [["DB Instance", "Name", "Engine", "State", "CPU avg / peak"]]
+        for instance in summary["rdsInstances"]:
+            average, peak = _family_stats(instance, "cpu")
+            rows.append([instance["id"], instance["name"][:24], instance["engine"], instance["state"],
+                         f"{_percent(average)} / {_percent(peak)}"])
+        elements += [Paragraph("Databases", styles['Heading2']),
+                     _grid(rows, [1.6*inch, 1.5*inch, 1*inch, 0.9*inch, 1.3*inch])]
+
+    elements += [Spacer(1, 16), Paragraph(
+        "This is a summary preview. Per-host charts and time series are in the full report.", styles['Italic'])]
+    doc.build(elements)
@@ -0,0 +1,196 @@
+"""
+Report build jobs and the progress events they emit.
+
+A job wraps one report build. The pipeline reports what it has done with
+emit(), which finds the current job through a context variable, so worker
+threads started with a copied context report to the right job without
+passing it around. Subscribers read the event list from any offset, which
+lets a reconnecting EventSource resume from its Last-Event-ID.
+"""
+import asyncio
+import contextvars
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
+from encoding import dumps
+
+_current_job = contextvars.ContextVar("report_job", default=None)
+
+# Seconds between SSE comments that keep idle proxies from closing the stream
+HEARTBEAT_SECONDS = 15
+
+
+def emit(event, **fields):
+    """Record a progress event on the current job; a no-op outside of one."""
+    job = _current_job.get()
+    if job is not None:
+        job.emit(event, **fields)
+
+
+@contextmanager
+def reporting_to(job):
+    token = _current_job.set(job)
+    try:
+        yield job
+    finally:
+        _current_job.reset(token)
+
+
+def sse_message(record):
+    return b"id: %d\ndata: %s\n\n" % (record["id"], dumps(record))
+
+
+class ReportJob:
+    def __init__(self, job_id, fingerprint, loop):
+        self.id = job_id
+        self.fingerprint = fingerprint
+        self.state = "queued"
+        self.source = None
+        self.result = None  # coalesce.BuiltReport once done
+        self.error = None
+        self.finished_at = None
+        self.task = None
+        # One token per caller following the job; the build stops when the last one cancels
+        self.followers = set()
+        self.events = []
+        self._lock = threading.Lock()
+        self._loop = loop
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self):
+        return self.finished_at is not None
+
+    def emit(self, event, **fields):
+        """Append an event; safe to call from any thread."""
+        with self._lock:
+            record = {"id": len(self.events) + 1, "event": event, "time": round(time.time(), 3), **fields}
+            self.events.append(record)
+        self._loop.call_soon_threadsafe(self._changed.set)
+
+    def status(self):
+        return {
+            "jobId": self.id,
+            "state": self.state,
+            "source": self.source,
+            "error": self.error,
+            "bytes": self.result.body.size if self.result is not None else None,
+            "partial": self.result.partial if self.result is not None else False,
+        }
+
+    async def stream(self, after=0):
+        """
+        Yield events with an id above after until the job finishes, and None
+        whenever HEARTBEAT_SECONDS pass without one.
+        """
+        index = after
+        while True:
+            if index < len(self.events):
+                yield self.events[index]
+                index += 1
+                continue
+            if self.finished:
+                return
+            self._changed.clear()
+            if index < len(self.events) or self.finished:
+                continue
+            try:
+                await asyncio.wait_for(self._changed.wait(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield None
+
+
+class ReportJobs:
+    """
+    Registry of report jobs by id.
+
+    Creating a job for a fingerprint that already has one running returns
+    that job, so a retried request follows the original build. Every create
+    hands out a follower token, and cancelling only withdraws that follower:
+    the build is cancelled once no follower is left. Finished jobs keep their
+    report for ttl seconds, then release it.
+    """
+
+    def __init__(self, ttl, max_jobs):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._jobs = {}
+
+    def _evict(self, now):
+        finished = sorted((job.finished_at, job_id) for job_id, job in self._jobs.items() if job.finished)
+        over = len(self._jobs) - self.max_jobs
+        for finished_at, job_id in finished:
+            if finished_at + self.ttl > now and over <= 0:
+                break
+            self._discard(self._jobs.pop(job_id))
+            over -= 1
+
+    @staticmethod
+    def _discard(job):
+        if job.result is not None:
+            job.result.body.release()
+            job.result = None
+
+    def get(self, job_id):
+        self._evict(time.monotonic())
+        return self._jobs.get(job_id)
+
+    def create(self, fingerprint, build):
+        """
+        Start build() (a coroutine function returning (BuiltReport, source))
+        as a job, or follow the unfinished job already building fingerprint.
+        Returns (job, follower token, created).
+        """
+        self._evict(time.monotonic())
+        follower = secrets.token_urlsafe(8)
+        for job in self._jobs.values():
+            if job.fingerprint == fingerprint and not job.finished:
+                job.followers.add(follower)
+                return job, follower, False
+        job = ReportJob(secrets.token_urlsafe(16), fingerprint, asyncio.get_running_loop())
+        job.followers.add(follower)
+        self._jobs[job.id] = job
+        job.emit("state", state=job.state)
+        job.task = asyncio.ensure_future(self._run(job, build))
+        job.task.add_done_callback(lambda task: self._settle(job, task))
+        return job, follower, True
+
+    def _settle(self, job, task):
+        # A task cancelled before its first step never runs _run at all
+        if not job.finished:
+            job.state = "cancelled"
+            job.emit("cancelled")
+            job.finished_at = time.monotonic()
+        task.cancelled() or task.exception()
+
+    def cancel(self, job, follower):
+        """Withdraw one follower; returns whether that cancelled the build."""
+        job.followers.discard(follower)
+        if job.followers or job.finished:
+            return False
+        job.task.cancel()
+        return True
+
+    async def _run(self, job, build):
+        job.state = "running"
+        job.emit("state", state=job.state)
+        # Set inside the task so the build's threads inherit it
+        with reporting_to(job):
+            try:
+                built, source = await build()
+            except asyncio.CancelledError:
+                job.state = "cancelled"
+                job.emit("cancelled")
+            except Exception as e:
+                job.state, job.error = "failed", str(e)
+                job.emit("failed", error=job.error)
+            else:
+                job.state, job.source, job.result = "done", source, built
+                job.emit("done", source=source, bytes=built.body.size, partial=built.partial,
+                         notes=built.headers.get("X-Report-Partial"))
+            finally:
+                job.finished_at = time.monotonic()
+                if job.id not in self._jobs:
+                    self._discard(job)
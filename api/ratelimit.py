@@ -0,0 +1,111 @@
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+import cancellation
+from cancellation import DeadlineExceeded
+from telemetry import (RATE_LIMITER_RATE, THROTTLE_RETRIES, THROTTLING_CODES)
+
+# Server-side failures worth another attempt besides throttling
+TRANSIENT_CODES = {"ServiceUnavailable", "InternalFailure", "InternalError", "InternalServiceError"}
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket whose refill rate follows AIMD: every success adds roughly
+    `increase` requests/second per second of traffic, every throttle
+    multiplies the rate by `decrease` and empties the bucket.
+    """
+
+    def __init__(self, name, rate, max_rate, min_rate=1.0, increase=1.0, decrease=0.5):
+        self.name = name
+        self.rate = float(rate)
+        self.max_rate = float(max_rate)
+        self.min_rate = float(min_rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.tokens = 1.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        RATE_LIMITER_RATE.set(self.rate, limiter=name)
+
+    def _refill(self, now):
+        capacity = max(self.rate, 1.0)
+        self.tokens = min(capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, deadline=None):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = (1.0 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                raise DeadlineExceeded(f"{self.name}: no capacity before deadline")
+            cancellation.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+            rate = self.rate
+        RATE_LIMITER_RATE.set(rate, limiter=self.name)
+
+    def on_throttle(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.tokens = 0.0
+            rate = self.rate
+        RATE_LIMITER_RATE.set(rate, limiter=self.name)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(account, region, api, rate, max_rate):
+    """Shared limiter per (account, region, API) for the whole process."""
+    key = (account, region, api)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = AdaptiveRateLimiter(f"{account}/{region}/{api}", rate, max_rate)
+    return limiter
+
+
+def call_with_retries(call, limiter, deadline=None, max_attempts=8, base_delay=0.2, max_delay=20.0):
+    """
+    Run call() under limiter, retrying throttled and transient failures with
+    full-jitter exponential backoff until max_attempts or the deadline
+    (a time.monotonic() value) is reached.
+    """
+    attempt = 0
+    while True:
+        cancellation.check()
+        if deadline is not None and time.monotonic() >= deadline:
+            raise DeadlineExceeded(f"{limiter.name}: deadline passed")
+        limiter.acquire(deadline)
+        try:
+            result = call()
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            throttled = code in THROTTLING_CODES
+            if not throttled and code not in TRANSIENT_CODES:
+                raise
+            attempt += 1
+            if throttled:
+                limiter.on_throttle()
+                THROTTLE_RETRIES.inc(limiter=limiter.name)
+            if attempt >= max_attempts:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise DeadlineExceeded(f"{limiter.name}: retries ran past the deadline") from e
+            cancellation.sleep(delay)
+            continue
+        limiter.on_success()
+        return result
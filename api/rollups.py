@@ -0,0 +1,284 @@
+"""
+Per-host, per-metric daily aggregates so weekly and monthly reports can be
+assembled from days that have already been fetched.
+
+A day here is an IST calendar day, the same unit the dated daily reports and
+the pre-generation scheduler use. Only days that are complete (and a little
+older, so late CloudWatch datapoints have landed) are persisted.
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import pytz
+
+from scheduler import IST
+
+# Width of the stored chart series; 48 points per day keeps a 30-day chart readable
+DOWNSAMPLE_SECONDS = 1800
+
+
+class QuantileSketch:
+    """
+    Mergeable log-bucketed sketch: every estimate is within relative_accuracy
+    of a true quantile. Values at or below zero share a single bucket.
+    """
+
+    def __init__(self, relative_accuracy=0.01, buckets=None, zero=0):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = dict(buckets or {})
+        self.zero = zero
+
+    @property
+    def count(self):
+        return self.zero + sum(self.buckets.values())
+
+    def add(self, value, count=1):
+        if value <= 0:
+            self.zero += count
+            return
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def merge(self, other):
+        self.zero += other.zero
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        return self
+
+    def quantile(self, q):
+        total = self.count
+        if total == 0:
+            return None
+        rank = q * (total - 1)
+        seen = self.zero
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_dict(self):
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "zero": self.zero,
+            "buckets": {str(key): count for key, count in self.buckets.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        buckets = {int(key): count for key, count in data["buckets"].items()}
+        return cls(data["relative_accuracy"], buckets, data["zero"])
+
+
+@dataclass
+class DailyAggregate:
+    count: int = 0
+    total: float = 0.0
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+    unit: str = "Percent"
+    sketch: QuantileSketch = field(default_factory=QuantileSketch)
+    # [(epoch seconds, average)], one point per DOWNSAMPLE_SECONDS bucket
+    series: list = field(default_factory=list)
+
+    @classmethod
+    def from_datapoints(cls, datapoints):
+        aggregate = cls()
+        buckets = {}
+        for point in datapoints:
+            value = point['Average']
+            aggregate.count += 1
+            aggregate.total += value
+            aggregate.minimum = value if aggregate.minimum is None else min(aggregate.minimum, value)
+            aggregate.maximum = value if aggregate.maximum is None else max(aggregate.maximum, value)
+            aggregate.sketch.add(value)
+            aggregate.unit = point.get('Unit', aggregate.unit)
+            bucket = int(point['Timestamp'].timestamp()) // DOWNSAMPLE_SECONDS * DOWNSAMPLE_SECONDS
+            values = buckets.setdefault(bucket, [])
+            values.append(value)
+        aggregate.series = [(bucket, sum(values) / len(values)) for bucket, values in sorted(buckets.items())]
+        return aggregate
+
+    @classmethod
+    def merged(cls, aggregates):
+        result = cls()
+        for aggregate in aggregates:
+            if aggregate.count == 0:
+                continue
+            result.count += aggregate.count
+            result.total += aggregate.total
+            result.minimum = aggregate.minimum if result.minimum is None else min(result.minimum, aggregate.minimum)
+            result.maximum = aggregate.maximum if result.maximum is None else max(result.maximum, aggregate.maximum)
+            result.unit = aggregate.unit
+            result.sketch.merge(aggregate.sketch)
+            result.series.extend(aggregate.series)
+        result.series.sort()
+        return result
+
+    def datapoints(self):
+        return [
+            {"Timestamp": datetime.fromtimestamp(bucket, pytz.UTC), "Average": value, "Unit": self.unit}
+            for bucket, value in self.series
+        ]
+
+    def to_json(self):
+        return json.dumps({
+            "count": self.count,
+            "total": self.total,
+            "minimum": self.minimum,
+            "maximum": self.maximum,
+            "unit": self.unit,
+            "sketch": self.sketch.to_dict(),
+            "series": self.series,
+        })
+
+    @classmethod
+    def from_json(cls, payload):
+        data = json.loads(payload)
+        return cls(
+            count=data["count"],
+            total=data["total"],
+            minimum=data["minimum"],
+            maximum=data["maximum"],
+            unit=data["unit"],
+            sketch=QuantileSketch.from_dict(data["sketch"]),
+            series=[tuple(point) for point in data["series"]],
+        )
+
+
+class MetricSeries(list):
+    """
+    Datapoints for one host and metric. When part of the window came from
+    stored aggregates, summary holds the exact totals for the whole window,
+    since the downsampled points alone would flatten min and max.
+    """
+
+    def __init__(self, datapoints=(), summary=None):
+        super().__init__(datapoints)
+        self.summary = summary
+
+
+def ist_day_bounds(day):
+    start = IST.localize(datetime.combine(day, datetime.min.time())).astimezone(pytz.UTC)
+    end = IST.localize(datetime.combine(day + timedelta(days=1), datetime.min.time())).astimezone(pytz.UTC)
+    return start, end
+
+
+def split_by_day(start_time, end_time):
+    """
+    Cut [start_time, end_time) at IST midnights. Yields (start, end, day)
+    where day is the IST date when the piece covers that whole day, else None.
+    """
+    cursor = start_time
+    while cursor < end_time:
+        day = cursor.astimezone(IST).date()
+        day_start, day_end = ist_day_bounds(day)
+        piece_end = min(day_end, end_time)
+        whole = cursor == day_start and piece_end == day_end
+        yield cursor, piece_end, day if whole else None
+        cursor = piece_end
+
+
+class AggregateStore:
+    """
+    SQLite table of DailyAggregate rows keyed by (account, host, metric, day).
+    Connections are per call, so the store is safe to share across the fetch
+    worker threads.
+    """
+
+    def __init__(self, path, retention_days=45, settle_seconds=600):
+        self.path = path
+        self.retention_days = retention_days
+        self.settle = timedelta(seconds=settle_seconds)
+        self._pruned = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS daily_aggregates ("
+                " account TEXT, host TEXT, metric TEXT, day TEXT, payload TEXT,"
+                " PRIMARY KEY (account, host, metric, day))"
+            )
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def get_many(self, account, host, metric, days):
+        days = [day.isoformat() for day in days]
+        if not days:
+            return {}
+        placeholders = ",".join("?" * len(days))
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT day, payload FROM daily_aggregates"
+                f" WHERE account = ? AND host = ? AND metric = ? AND day IN ({placeholders})",
+                [account, host, metric, *days]
+            ).fetchall()
+        return {date.fromisoformat(day): DailyAggregate.from_json(payload) for day, payload in rows}
+
+    def settled(self, day, now=None):
+        """Whether CloudWatch should have everything for day by now."""
+        now = now or datetime.now(pytz.UTC)
+        return ist_day_bounds(day)[1] + self.settle <= now
+
+    def put(self, account, host, metric, day, aggregate):
+        if not self.settled(day):
+            return False
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO daily_aggregates VALUES (?, ?, ?, ?, ?)",
+                (account, host, metric, day.isoformat(), aggregate.to_json())
+            )
+        self._prune()
+        return True
+
+    def _prune(self):
+        with self._lock:
+            if time.monotonic() - self._pruned < 3600:
+                return
+            self._pruned = time.monotonic()
+        cutoff = datetime.now(IST).date() - timedelta(days=self.retention_days)
+        with self._connect() as db:
+            db.execute("DELETE FROM daily_aggregates WHERE day < ?", (cutoff.isoformat(),))
+
+
+def assemble_series(cached, fetched):
+    """
+    Merge stored days with freshly fetched pieces into one MetricSeries.
+
+    cached maps day -> DailyAggregate; fetched is a list of
+    ((start, end, day), datapoints). Returns the series and the aggregates
+    of whole days that were fetched, for the caller to persist.
+    """
+    datapoints = []
+    parts = []
+    for day in sorted(cached):
+        datapoints.extend(cached[day].datapoints())
+        parts.append(cached[day])
+    fresh = {}
+    for (_, _, day), points in fetched:
+        datapoints.extend(points)
+        aggregate = DailyAggregate.from_datapoints(points)
+        parts.append(aggregate)
+        if day is not None:
+            fresh[day] = aggregate
+    summary = DailyAggregate.merged(parts) if cached else None
+    return MetricSeries(datapoints, summary), fresh
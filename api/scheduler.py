@@ -0,0 +1,141 @@
+"""
+Pre-generates each configured account's previous-day report shortly after
+IST midnight so that morning requests are served from disk.
+
+PREGENERATE_CONFIG points at a JSON list of report requests, in the same
+shape as the /generate-report body, e.g.
+
+    [{"provider": "aws",
+      "credentials": {"accessKeyId": "...", "secretAccessKey": "...", "accountName": "Acme"},
+      "selected_instances": [{"id": "i-0123", "name": "web-1", "type": "t3.large", "state": "running"}],
+      "frequency": "daily"}]
+"""
+import asyncio
+import json
+import os
+import random
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+
+import pytz
+
+from coalesce import BuiltReport, request_fingerprint
+from streaming import ReportBody
+
+IST = pytz.timezone('Asia/Kolkata')
+
+
+def ist_today():
+    return datetime.now(IST).date()
+
+
+class ReportStore:
+    """Finished reports on disk, one file plus a metadata sidecar per fingerprint."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, fingerprint):
+        base = os.path.join(self.directory, fingerprint)
+        return f"{base}.report", f"{base}.json"
+
+    def save(self, fingerprint, built):
+        report_path, meta_path = self._paths(fingerprint)
+        tmp_path = f"{report_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            offset = 0
+            while offset < built.body.size:
+                chunk = built.body.read_at(offset, 1024 * 1024)
+                f.write(chunk)
+                offset += len(chunk)
+        os.replace(tmp_path, report_path)
+        with open(f"{meta_path}.tmp", "w") as f:
+            json.dump({"media_type": built.media_type, "headers": built.headers}, f)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def load(self, fingerprint):
+        report_path, meta_path = self._paths(fingerprint)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            report = open(report_path, "rb")
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return BuiltReport(ReportBody(report), meta["media_type"], meta["headers"])
+
+    def exists(self, fingerprint):
+        return all(os.path.exists(path) for path in self._paths(fingerprint))
+
+
+class PregenerationScheduler:
+    """
+    Every IST day, builds the previous day's report for each configured
+    request. Each request gets a stable slot inside the window (derived from
+    its fingerprint, plus a little jitter) so CloudWatch sees a spread of
+    builds rather than a spike at midnight.
+    """
+
+    def __init__(self, requests, store, build, start_offset, window, admit=None):
+        self.requests = requests
+        self.store = store
+        self.build = build
+        # admit(request) holds a report worker slot, see workers.FairShareScheduler
+        self.admit = admit or (lambda request: nullcontext())
+        self.start_offset = start_offset
+        self.window = window
+
+    def dated(self, request, report_date):
+        return request.copy(update={"report_date": report_date.isoformat()})
+
+    def _slot(self, fingerprint):
+        spread = int(self.window.total_seconds())
+        if spread <= 0:
+            return timedelta(0)
+        return timedelta(seconds=int(fingerprint[:8], 16) % spread + random.uniform(0, 5))
+
+    async def _pregenerate(self, request, run_at):
+        delay = (run_at - datetime.now(IST)).total_seconds()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        fingerprint = request_fingerprint(request)
+        if self.store.exists(fingerprint):
+            return
+        try:
+            async with self.admit(request):
+                built = await asyncio.to_thread(self.build, request)
+        except Exception as e:
+            print(f"Error pre-generating report for {request.credentials.accountName}: {str(e)}")
+            return
+        try:
+            if built.partial:
+                # Live requests will build it in full rather than get a cut-short copy
+                print(f"Not keeping partial {request.report_date} report for {request.credentials.accountName}")
+                return
+            await asyncio.to_thread(self.store.save, fingerprint, built)
+            print(f"Pre-generated {request.report_date} report for {request.credentials.accountName}")
+        finally:
+            built.body.release()
+
+    async def run_day(self, day):
+        """Build (or catch up on) the reports for the IST day before `day`."""
+        midnight = IST.localize(datetime.combine(day, datetime.min.time()))
+        report_date = day - timedelta(days=1)
+        tasks = []
+        for request in self.requests:
+            dated = self.dated(request, report_date)
+            run_at = midnight + self.start_offset + self._slot(request_fingerprint(dated))
+            tasks.append(self._pregenerate(dated, run_at))
+        await asyncio.gather(*tasks)
+
+    async def run(self):
+        while True:
+            today = ist_today()
+            await self.run_day(today)
+            next_midnight = IST.localize(datetime.combine(today + timedelta(days=1), datetime.min.time()))
+            await asyncio.sleep(max((next_midnight - datetime.now(IST)).total_seconds(), 0))
+
+
+def load_requests(path, model):
+    with open(path) as f:
+        return [model(**entry) for entry in json.load(f)]
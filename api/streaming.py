@@ -0,0 +1,225 @@
+import asyncio
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+from encoding import MIN_COMPRESS_BYTES, compressible, iter_compressed, negotiate
+
+CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def spooled_buffer(max_memory, directory):
+    """
+    Buffer that stays in memory up to max_memory bytes and rolls over to an
+    anonymous file in directory above that, so nothing is left behind on disk.
+    """
+    os.makedirs(directory, exist_ok=True)
+    return tempfile.SpooledTemporaryFile(max_size=max_memory, mode="w+b", dir=directory)
+
+
+def _buffer_size(buffer):
+    buffer.seek(0, os.SEEK_END)
+    return buffer.tell()
+
+
+class ReportBody:
+    """
+    A finished report that several responses can stream at once.
+
+    Reads are positional and serialized, so concurrent readers never disturb
+    each other's offsets. The body starts with one reference; the underlying
+    buffer is closed when the last reference is released.
+    """
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        self.size = _buffer_size(buffer)
+        self._refs = 1
+        self._lock = threading.Lock()
+
+    def retain(self):
+        with self._lock:
+            if self._refs == 0:
+                raise ValueError("report body already released")
+            self._refs += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self._refs -= 1
+            if self._refs == 0:
+                self._buffer.close()
+
+    def read_at(self, offset, length):
+        with self._lock:
+            self._buffer.seek(offset)
+            return self._buffer.read(length)
+
+    def read(self):
+        return self.read_at(0, self.size)
+
+
+def _parse_range(range_header, size):
+    """
+    Parse a single-range 'bytes=' header into an inclusive (start, end) pair.
+
+    Returns None when the header is absent or malformed (serve everything) and
+    raises ValueError when the range cannot be satisfied.
+    """
+    if not range_header:
+        return None
+    match = _RANGE_RE.match(range_header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        start = max(size - length, 0)
+        end = size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+def _iter_body(body, start, length):
+    offset = start
+    remaining = length
+    while remaining > 0:
+        chunk = body.read_at(offset, min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        offset += len(chunk)
+        remaining -= len(chunk)
+        yield chunk
+
+
+def stream_report(body, media_type, headers, range_header=None, accept_encoding=None):
+    """
+    Stream a finished ReportBody with Content-Length and single-range support.
+
+    Text formats are compressed for clients that accept it, unless a range
+    was asked for: ranges always address the identity bytes.
+    Takes ownership of one reference to body and releases it once the
+    response has been sent (or rejected); call body.retain() first to keep it.
+    """
+    size = body.size
+    headers = {**headers, "Accept-Ranges": "bytes"}
+    if compressible(media_type):
+        headers["Vary"] = "Accept-Encoding"
+        encoding = negotiate(accept_encoding) if size >= MIN_COMPRESS_BYTES else None
+        if encoding and not range_header:
+            headers["Content-Encoding"] = encoding
+            return StreamingResponse(
+                iter_compressed(_iter_body(body, 0, size), encoding),
+                media_type=media_type,
+                headers=headers,
+                background=BackgroundTask(body.release)
+            )
+    try:
+        byte_range = _parse_range(range_header, size)
+    except ValueError:
+        body.release()
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+
+    status_code = 200
+    start, end = 0, size - 1
+    if byte_range is not None:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    length = end - start + 1 if size else 0
+    headers["Content-Length"] = str(length)
+
+    return StreamingResponse(
+        _iter_body(body, start, length),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers,
+        background=BackgroundTask(body.release)
+    )
+
+
+class ReportJanitor:
+    """
+    Periodically prunes a working directory: entries older than max_age are
+    removed, then the oldest remaining entries until the tree fits max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes, max_age, interval=60):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.interval = interval
+        self.removed = 0
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.isdir(path):
+                    size = 0
+                    mtime = os.path.getmtime(path)
+                    for root, _, files in os.walk(path):
+                        for file in files:
+                            file_path = os.path.join(root, file)
+                            size += os.path.getsize(file_path)
+                            mtime = max(mtime, os.path.getmtime(file_path))
+                else:
+                    size = os.path.getsize(path)
+                    mtime = os.path.getmtime(path)
+            except FileNotFoundError:
+                continue
+            entries.append((mtime, path, size))
+        return sorted(entries)
+
+    def _remove(self, path):
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.removed += 1
+
+    def sweep(self):
+        if not os.path.isdir(self.directory):
+            return
+        now = time.time()
+        entries = self._entries()
+        kept = []
+        for mtime, path, size in entries:
+            if now - mtime > self.max_age:
+                self._remove(path)
+            else:
+                kept.append((mtime, path, size))
+
+        total = sum(size for _, _, size in kept)
+        for _, path, size in kept:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                print(f"Error cleaning {self.directory}: {str(e)}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,246 @@
+import bisect
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (16e3, 64e3, 256e3, 1e6, 4e6, 16e6, 64e6, 256e6)
+PAGE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500)
+
+THROTTLING_CODES = {
+    "Throttling", "ThrottlingException", "ThrottledException", "RequestThrottled",
+    "RequestThrottledException", "TooManyRequestsException", "RequestLimitExceeded",
+    "SlowDown", "ProvisionedThroughputExceededException",
+}
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    ]
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def expose(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+DISCOVERY_SECONDS = REGISTRY.register(Histogram(
+    "report_discovery_seconds", "Time to scan one region for EC2 and RDS instances", ["region"]))
+METRIC_FETCH_SECONDS = REGISTRY.register(Histogram(
+    "report_metric_fetch_seconds", "Time per CloudWatch metric fetch", ["metric"]))
+CHART_RENDER_SECONDS = REGISTRY.register(Histogram(
+    "report_chart_render_seconds", "Time to produce one chart image", ["cached"]))
+PDF_BUILD_SECONDS = REGISTRY.register(Histogram(
+    "report_pdf_build_seconds", "Time spent in reportlab layout and write"))
+UPLOAD_SECONDS = REGISTRY.register(Histogram(
+    "report_upload_seconds", "Time from starting delivery to the upload completing", ["format"]))
+REPORT_SECONDS = REGISTRY.register(Histogram(
+    "report_build_seconds", "End-to-end report generation time", ["format"]))
+REPORT_REQUESTS = REGISTRY.register(Counter(
+    "report_requests_total", "Report requests by how they were served", ["source"]))
+REPORT_SIZE_BYTES = REGISTRY.register(Histogram(
+    "report_size_bytes", "Size of generated reports", ["format"], buckets=SIZE_BUCKETS))
+REPORT_PAGES = REGISTRY.register(Histogram(
+    "report_pages", "Page count of generated PDF reports", buckets=PAGE_BUCKETS))
+AWS_API_CALLS = REGISTRY.register(Counter(
+    "aws_api_calls_total", "AWS API requests sent, including retries", ["service", "operation"]))
+AWS_THROTTLES = REGISTRY.register(Counter(
+    "aws_throttling_errors_total", "AWS API responses rejected for throttling", ["service", "operation"]))
+THROTTLE_RETRIES = REGISTRY.register(Counter(
+    "rate_limiter_throttle_retries_total", "Throttled calls retried by the adaptive limiter", ["limiter"]))
+ROLLUP_DAYS = REGISTRY.register(Counter(
+    "rollup_days_total", "Host-metric days in reports, by whether they came from stored aggregates", ["source"]))
+METRIC_WINDOWS = REGISTRY.register(Counter(
+    "metric_windows_total", "Host-metric windows read for reports, by where they came from", ["source"]))
+RATE_LIMITER_RATE = REGISTRY.register(Gauge(
+    "rate_limiter_rate", "Current adaptive request rate per second", ["limiter"]))
+REPORT_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "report_queue_depth", "Report builds waiting for a worker", ["priority"]))
+REPORT_QUEUE_SECONDS = REGISTRY.register(Histogram(
+    "report_queue_seconds", "Time a report build waited for a worker", ["priority"]))
+
+# Per-report stage totals, for the structured summary log line
+_report_stages = contextvars.ContextVar("report_stages", default=None)
+
+
+def observe(histogram, elapsed, stage=None, **labels):
+    """Record a timing in histogram and in the current report's stage totals."""
+    histogram.observe(elapsed, **labels)
+    stages = _report_stages.get()
+    if stages is not None:
+        name = stage or histogram.name
+        stages[name] = stages.get(name, 0.0) + elapsed
+
+
+@contextmanager
+def timed(histogram, stage=None, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(histogram, time.perf_counter() - started, stage, **labels)
+
+
+@contextmanager
+def collect_stages():
+    """Accumulate per-stage seconds recorded by timed()/observe() into a dict."""
+    stages = {}
+    token = _report_stages.set(stages)
+    try:
+        yield stages
+    finally:
+        _report_stages.reset(token)
+
+
+@contextmanager
+def report_log(**fields):
+    """
+    Collect stage timings for one report and print them as a single JSON line
+    when it finishes, for log-based dashboards where /metrics is not scraped.
+    """
+    started = time.perf_counter()
+    status = "ok"
+    with collect_stages() as stages:
+        try:
+            yield fields
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            fields.update({
+                "event": "report",
+                "status": status,
+                "seconds": round(time.perf_counter() - started, 4),
+                "stages": {name: round(value, 4) for name, value in stages.items()},
+            })
+            print(json.dumps(fields, default=str))
+
+
+def _operation(event_name):
+    # e.g. "response-received.cloudwatch.GetMetricStatistics"
+    parts = event_name.split(".")
+    return (parts[1], parts[2]) if len(parts) >= 3 else ("unknown", event_name)
+
+
+def _count_response(event_name=None, parsed_response=None, **kwargs):
+    service, operation = _operation(event_name)
+    AWS_API_CALLS.inc(service=service, operation=operation)
+    code = (parsed_response or {}).get("Error", {}).get("Code")
+    if code in THROTTLING_CODES:
+        AWS_THROTTLES.inc(service=service, operation=operation)
+
+
+def instrument_session(session):
+    """
+    Count every AWS request attempt and throttling response made through
+    session. botocore emits response-received once per HTTP attempt, so
+    retried requests are counted individually.
+    """
+    session.events.register("response-received", _count_response, unique_id="telemetry-count-response")
+    return session
@@ -0,0 +1,44 @@
+import asyncio
+import unittest
+
+from workers import FairShareScheduler
+
+
+class CancelledWaiterTest(unittest.TestCase):
+
+    def test_release_skips_waiter_cancelled_before_withdrawing(self):
+        async def scenario():
+            scheduler = FairShareScheduler(workers=2, per_account=1, interactive_reserved=0)
+            holding = asyncio.Event()
+            release = asyncio.Event()
+
+            async def hold():
+                async with scheduler.slot("111"):
+                    holding.set()
+                    await release.wait()
+
+            async def wait():
+                async with scheduler.slot("111"):
+                    pass
+
+            holder = asyncio.create_task(hold())
+            await holding.wait()
+            waiter = asyncio.create_task(wait())
+            await asyncio.sleep(0)
+            # Free the slot and cancel the queued waiter before it can withdraw
+            release.set()
+            waiter.cancel()
+            await holder
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+
+            self.assertEqual(scheduler.running, 0)
+            async with scheduler.slot("111"):
+                self.assertEqual(scheduler.stats()["runningByAccount"], {"111": 1})
+            self.assertEqual(scheduler.stats()["queued"], {"interactive": {}, "scheduled": {}})
+
+        asyncio.run(asyncio.wait_for(scenario(), timeout=5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+# none (default) | console | file | otel
+TRACING_EXPORTER = os.environ.get("TRACING_EXPORTER", "none").lower()
+TRACING_FILE = os.environ.get("TRACING_FILE", "traces.jsonl")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_file_lock = threading.Lock()
+
+
+class _NoopSpan:
+    """Shared stand-in returned while tracing is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+    def add_event(self, name, **attributes):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """
+    Minimal span with OpenTelemetry-shaped output, exported as one JSON object
+    per finished span.
+    """
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.events = []
+        self.status = "OK"
+        self.parent = None
+        self.trace_id = None
+        self.span_id = secrets.token_hex(8)
+        self.start_time = None
+        self.end_time = None
+        self._token = None
+
+    def __enter__(self):
+        self.parent = _current_span.get()
+        self.trace_id = self.parent.trace_id if self.parent else secrets.token_hex(16)
+        self.start_time = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_time = time.time_ns()
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.status = "ERROR"
+            self.attributes["exception.type"] = exc_type.__name__
+            self.attributes["exception.message"] = str(exc)
+        _export(self)
+        return False
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def add_event(self, name, **attributes):
+        self.events.append({"name": name, "timestamp": time.time_ns(), "attributes": attributes})
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "context": {"trace_id": self.trace_id, "span_id": self.span_id},
+            "parent_id": self.parent.span_id if self.parent else None,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "duration_ms": (self.end_time - self.start_time) / 1e6,
+            "status": self.status,
+            "attributes": self.attributes,
+            "events": self.events,
+        }
+
+
+class _OtelSpan:
+    """Adapter that drives an OpenTelemetry span with the same interface."""
+
+    def __init__(self, name, attributes):
+        self._manager = otel_trace.get_tracer("nubinix.reports").start_as_current_span(
+            name, attributes=attributes
+        )
+        self._span = None
+
+    def __enter__(self):
+        self._span = self._manager.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._manager.__exit__(exc_type, exc, tb)
+
+    def set_attribute(self, key, value):
+        self._span.set_attribute(key, value)
+
+    def add_event(self, name, **attributes):
+        self._span.add_event(name, attributes=attributes)
+
+
+def _export(span):
+    line = json.dumps(span.to_dict(), default=str)
+    if TRACING_EXPORTER == "console":
+        print(line)
+    else:
+        with _file_lock:
+            with open(TRACING_FILE, "a") as f:
+                f.write(line + "\n")
+
+
+def tracing_enabled():
+    return TRACING_EXPORTER != "none"
+
+
+def span(name, **attributes):
+    """
+    Open a span as a context manager. Attributes with a None value are
+    dropped. With TRACING_EXPORTER unset this returns a shared no-op object,
+    so instrumented code pays for one comparison.
+    """
+    if TRACING_EXPORTER == "none":
+        return _NOOP_SPAN
+    attributes = {key: value for key, value in attributes.items() if value is not None}
+    if TRACING_EXPORTER == "otel" and otel_trace is not None:
+        return _OtelSpan(name, attributes)
+    return Span(name, attributes)
@@ -0,0 +1,121 @@
+"""
+Admission control for report builds.
+
+Builds wait here for one of a fixed number of worker slots. Interactive
+requests always go ahead of scheduled ones, and within a priority class
+accounts take turns, so one account's fifty queued reports cannot hold
+up another's single report. Each AWS account also has a cap on builds
+running at once, since they all draw on the same CloudWatch quota.
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from telemetry import REPORT_QUEUE_DEPTH, REPORT_QUEUE_SECONDS
+
+INTERACTIVE = "interactive"
+SCHEDULED = "scheduled"
+PRIORITIES = (INTERACTIVE, SCHEDULED)
+
+
+class FairShareScheduler:
+    """
+    workers slots in total, at most per_account of them for one account, and
+    interactive_reserved slots that scheduled builds may never take.
+    """
+
+    def __init__(self, workers, per_account, interactive_reserved=1):
+        self.workers = workers
+        self.per_account = per_account
+        self.interactive_reserved = min(interactive_reserved, workers - 1)
+        self.running = 0
+        self._running_by_account = {}
+        # priority -> account -> waiters; accounts rotate to the back once served
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+
+    def _capacity(self, priority):
+        if priority == INTERACTIVE:
+            return self.workers
+        return self.workers - self.interactive_reserved
+
+    def _dispatch(self):
+        for priority in PRIORITIES:
+            accounts = self._queues[priority]
+            progressed = True
+            while progressed and self.running < self._capacity(priority):
+                progressed = False
+                for account in list(accounts):
+                    if self._running_by_account.get(account, 0) >= self.per_account:
+                        continue
+                    waiters = accounts[account]
+                    # Callers cancelled in this loop iteration have not withdrawn yet
+                    while waiters and waiters[0].done():
+                        waiters.popleft()
+                    if not waiters:
+                        del accounts[account]
+                        progressed = True
+                        break
+                    future = waiters.popleft()
+                    if waiters:
+                        accounts.move_to_end(account)
+                    else:
+                        del accounts[account]
+                    self._start(account)
+                    future.set_result(None)
+                    progressed = True
+                    break
+            REPORT_QUEUE_DEPTH.set(sum(len(waiters) for waiters in accounts.values()), priority=priority)
+
+    def _start(self, account):
+        self.running += 1
+        self._running_by_account[account] = self._running_by_account.get(account, 0) + 1
+
+    def _release(self, account):
+        self.running -= 1
+        remaining = self._running_by_account[account] - 1
+        if remaining:
+            self._running_by_account[account] = remaining
+        else:
+            del self._running_by_account[account]
+        self._dispatch()
+
+    def _withdraw(self, priority, account, future):
+        waiters = self._queues[priority].get(account)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            if not waiters:
+                del self._queues[priority][account]
+        REPORT_QUEUE_DEPTH.set(sum(len(w) for w in self._queues[priority].values()), priority=priority)
+
+    @asynccontextmanager
+    async def slot(self, account, priority=INTERACTIVE):
+        """Hold a worker slot for the duration of the block."""
+        if priority not in self._queues:
+            raise ValueError(f"Unknown report priority: {priority}")
+        queued = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(account, deque()).append(future)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the caller gave up
+                self._release(account)
+            else:
+                self._withdraw(priority, account, future)
+            raise
+        REPORT_QUEUE_SECONDS.observe(time.monotonic() - queued, priority=priority)
+        try:
+            yield
+        finally:
+            self._release(account)
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "runningByAccount": dict(self._running_by_account),
+            "queued": {priority: {account: len(waiters) for account, waiters in accounts.items()}
+                       for priority, accounts in self._queues.items()},
+        }
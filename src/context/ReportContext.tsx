@@ -26,6 +26,9 @@ interface ReportContextType {
   selectedRdsInstances: RDSInstance[];
   toggleInstanceSelection: (id: string) => void;
   toggleRdsInstanceSelection: (id: string) => void;
+  // Record a row from a paged inventory query as selected or not
+  setInstanceSelected: (instance: Instance, selected: boolean) => void;
+  setRdsInstanceSelected: (instance: RDSInstance, selected: boolean) => void;
   selectAllInstances: (selected: boolean) => void;
   selectAllRdsInstances: (selected: boolean) => void;
   frequency: ReportFrequency;
@@ -63,6 +66,19 @@ export const ReportProvider: React.FC<{ children: React.ReactNode }> = ({ childr
     );
   };
 
+  const upsert = <T extends { id: string; selected: boolean }>(items: T[], item: T, selected: boolean) =>
+    items.some((existing) => existing.id === item.id)
+      ? items.map((existing) => (existing.id === item.id ? { ...existing, selected } : existing))
+      : [...items, { ...item, selected }];
+
+  const setInstanceSelected = (instance: Instance, selected: boolean) => {
+    setInstances((current) => upsert(current, instance, selected));
+  };
+
+  const setRdsInstanceSelected = (instance: RDSInstance, selected: boolean) => {
+    setRdsInstances((current) => upsert(current, instance, selected));
+  };
+
   const selectAllInstances = (selected: boolean) => {
     setInstances(instances.map((instance) => ({ ...instance, selected })));
   };
@@ -114,6 +130,8 @@ export const ReportProvider: React.FC<{ children: React.ReactNode }> = ({ childr
         selectedRdsInstances,
         toggleInstanceSelection,
         toggleRdsInstanceSelection,
+        setInstanceSelected,
+        setRdsInstanceSelected,
         selectAllInstances,
         selectAllRdsInstances,
         frequency,
@@ -68,7 +68,8 @@ const EnterCredentials = () => {
       // Store credentials
       const credentials = {
         accessKeyId,
-        secretAccessKey
+        secretAccessKey,
+        accountName
       };
       
       setCredentials(credentials);
@@ -92,25 +93,9 @@ const EnterCredentials = () => {
             throw new Error('Invalid credentials');
           }
 
-          // Fetch instances
-          const instancesResponse = await fetch('http://localhost:8000/instances', {
-            method: 'POST',
-            headers: {
-              'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-              accessKeyId,
-              secretAccessKey
-            }),
-          });
-
-          if (!instancesResponse.ok) {
-            throw new Error('Failed to fetch instances');
-          }
-
-          const data = await instancesResponse.json();
-          setInstances(data.ec2Instances || []);
-          setRdsInstances(data.rdsInstances || []);
+          // The instance step pages through the inventory itself; start with nothing selected
+          setInstances([]);
+          setRdsInstances([]);
 
           toast({
             title: "Connected successfully",
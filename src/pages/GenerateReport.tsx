@@ -3,12 +3,13 @@ import { useNavigate } from "react-router-dom";
 import { Card, CardContent, CardDescription, CardHeader, CardTitle, CardFooter } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
 import { Alert, AlertDescription } from "@/components/ui/alert";
+import { Progress } from "@/components/ui/progress";
 import { useToast } from "@/components/ui/use-toast";
-import { toast } from "@/components/ui/use-toast";
 import Layout from "@/components/Layout";
 import Stepper from "@/components/Stepper";
 import { useReport } from "@/context/ReportContext";
-import { pdfService } from "@/services/pdfService";
+import { pdfService, reportError } from "@/services/pdfService";
+import { FleetSummary, MetricSummary, ReportJob, ReportPreview, ReportProgressEvent } from "@/types";
 import { jsPDF } from "jspdf";
 import autoTable from 'jspdf-autotable';
 import { 
@@ -23,7 +24,7 @@ import {
   BarElement,
   ArcElement
 } from 'chart.js';
-import { Line, Bar, Pie } from 'react-chartjs-2';
+import { Pie } from 'react-chartjs-2';
 
 // Register ChartJS components
 ChartJS.register(
@@ -46,15 +47,115 @@ const getSteps = (reportType) => {
   }
 };
 
+type BuildProgress = { label: string; percent: number };
+
+// Share of the progress bar each build stage ends at
+const STAGE_END = { metrics: 60, charts: 90, pages: 99 };
+
+const describeProgress = (event: ReportProgressEvent, previous: BuildProgress): BuildProgress => {
+  const done = Number(event.done ?? 0);
+  const total = Number(event.total ?? 0);
+  const share = (start: number, end: number) => start + (total ? (end - start) * done / total : 0);
+  switch (event.event) {
+    case "state":
+      return { label: event.state === "queued" ? "Waiting for a free worker..." : "Starting the build...", percent: 0 };
+    case "hosts":
+      return { label: `Collecting metrics for ${event.hosts} instances in ${event.regions} regions...`, percent: 0 };
+    case "metrics":
+      return { label: `Fetched ${done} of ${total} metric series`, percent: share(0, STAGE_END.metrics) };
+    case "charts":
+      return { label: `Drew ${done} of ${total} charts`, percent: share(STAGE_END.metrics, STAGE_END.charts) };
+    case "pages":
+      return { label: `Laid out page ${event.page}`, percent: STAGE_END.charts };
+    case "written":
+      return { label: "Finishing up...", percent: STAGE_END.pages };
+    default:
+      return previous;
+  }
+};
+
+const FAMILIES = ["cpu", "memory", "disk"] as const;
+
+const percent = (value?: number) => (value === undefined ? "N/A" : `${value.toFixed(1)}%`);
+
+// Average and peak of a resource's series in one family; hosts with several disks show their mean
+const familyStats = (metrics: Record<string, MetricSummary>, family: string) => {
+  const series = Object.values(metrics).filter((metric) => metric.family === family);
+  if (!series.length) return "N/A";
+  const average = series.reduce((sum, metric) => sum + metric.average, 0) / series.length;
+  return `${percent(average)} / ${percent(Math.max(...series.map((metric) => metric.maximum)))}`;
+};
+
+const PreviewSummary = ({ preview }: { preview: ReportPreview }) => {
+  const fleetRows = (["ec2", "rds"] as const).flatMap((kind) =>
+    FAMILIES.filter((family) => preview.fleet[kind][family]).map((family) => {
+      const stats: FleetSummary = preview.fleet[kind][family];
+      return { kind, family, stats };
+    })
+  );
+  return (
+    <div className="space-y-4">
+      <h4 className="text-sm font-medium">Summary for {preview.date}</h4>
+      <table className="w-full text-sm border">
+        <thead className="bg-gray-50">
+          <tr>
+            <th className="p-2 text-left">Fleet</th>
+            <th className="p-2 text-left">Metric</th>
+            <th className="p-2 text-left">Average</th>
+            <th className="p-2 text-left">Peak</th>
+            <th className="p-2 text-left">Hosts</th>
+          </tr>
+        </thead>
+        <tbody>
+          {fleetRows.map(({ kind, family, stats }) => (
+            <tr key={`${kind}-${family}`} className="border-t">
+              <td className="p-2">{kind.toUpperCase()}</td>
+              <td className="p-2">{family.toUpperCase()}</td>
+              <td className="p-2">{percent(stats.average)}</td>
+              <td className="p-2">{percent(stats.maximum)}</td>
+              <td className="p-2">{stats.hosts}</td>
+            </tr>
+          ))}
+        </tbody>
+      </table>
+      {preview.instances.length > 0 && (
+        <table className="w-full text-sm border">
+          <thead className="bg-gray-50">
+            <tr>
+              <th className="p-2 text-left">Instance</th>
+              {FAMILIES.map((family) => (
+                <th key={family} className="p-2 text-left">{family.toUpperCase()} avg / peak</th>
+              ))}
+            </tr>
+          </thead>
+          <tbody>
+            {preview.instances.map((instance) => (
+              <tr key={instance.id} className="border-t">
+                <td className="p-2">{instance.name || instance.id}</td>
+                {FAMILIES.map((family) => (
+                  <td key={family} className="p-2">{familyStats(instance.metrics, family)}</td>
+                ))}
+              </tr>
+            ))}
+          </tbody>
+        </table>
+      )}
+    </div>
+  );
+};
+
 const GenerateReport = () => {
   const navigate = useNavigate();
   const { reportConfig, resetReport } = useReport();
-  const toast = useToast();
+  const { toast } = useToast();
   const [isGenerating, setIsGenerating] = useState(true);
   const [isComplete, setIsComplete] = useState(false);
   const [error, setError] = useState<string | null>(null);
-  const [frequency, setFrequency] = useState("daily");
-  const currentDate = new Date().toISOString().split('T')[0];
+  const [job, setJob] = useState<ReportJob | null>(null);
+  const [preview, setPreview] = useState<ReportPreview | null>(null);
+  const [progress, setProgress] = useState<BuildProgress>({ label: "Queuing your report...", percent: 0 });
+  const [partialNotes, setPartialNotes] = useState<string | null>(null);
+  const [isDownloading, setIsDownloading] = useState(false);
 
   const steps = getSteps(reportConfig?.reportType || "utilization");
 
@@ -64,15 +165,71 @@ const GenerateReport = () => {
       return;
     }
 
-    // Simulate report generation
-    const timer = setTimeout(() => {
-      setIsGenerating(false);
-      setIsComplete(true);
-    }, 3000);
+    if (reportConfig.reportType === "billing") {
+      // Billing reports are still drawn in the browser
+      const timer = setTimeout(() => {
+        setIsGenerating(false);
+        setIsComplete(true);
+      }, 3000);
+      return () => clearTimeout(timer);
+    }
+
+    // Leaving the page aborts, which withdraws this page from the build
+    const controller = new AbortController();
+    const onProgress = (event: ReportProgressEvent) => {
+      setProgress((previous) => describeProgress(event, previous));
+      if (event.event === "done" && event.partial) {
+        setPartialNotes(String(event.notes || "Some data could not be fetched in time."));
+      }
+    };
 
-    return () => clearTimeout(timer);
+    (async () => {
+      try {
+        // Summary tables first; the same call queues the full report
+        let started: ReportJob | null = null;
+        try {
+          const summary = await pdfService.previewReport(reportConfig, true, controller.signal);
+          setPreview(summary);
+          started = summary.job;
+        } catch (error) {
+          if (controller.signal.aborted) return;
+          console.error('Preview unavailable, building the full report only:', error);
+        }
+        started = started ?? await pdfService.startReport(reportConfig, controller.signal);
+        setJob(started);
+        await pdfService.waitForReport(started, onProgress, controller.signal);
+        setIsComplete(true);
+        toast({
+          title: "Report Ready",
+          description: "Your report has been generated and is ready to download",
+        });
+      } catch (error) {
+        if (controller.signal.aborted) return;
+        setError(reportError(error).message);
+      } finally {
+        if (!controller.signal.aborted) setIsGenerating(false);
+      }
+    })();
+
+    return () => controller.abort();
   }, [reportConfig, navigate]);
 
+  const downloadReport = async () => {
+    if (!reportConfig || !job) return;
+    setIsDownloading(true);
+    try {
+      await pdfService.downloadReport(reportConfig, job);
+    } catch (error) {
+      toast({
+        variant: "destructive",
+        title: "Error",
+        description: reportError(error).message,
+      });
+    } finally {
+      setIsDownloading(false);
+    }
+  };
+
   const handleStartOver = () => {
     resetReport();
     navigate("/");
@@ -490,6 +647,17 @@ const GenerateReport = () => {
                 <p className="mt-4 text-gray-600">
                   This may take a few moments. We're collecting data from {reportConfig?.provider.toUpperCase()}.
                 </p>
+                {reportConfig?.reportType !== "billing" && (
+                  <div className="mt-6 w-full max-w-md space-y-2">
+                    <Progress value={progress.percent} />
+                    <p className="text-sm text-gray-500 text-center">{progress.label}</p>
+                  </div>
+                )}
+                {preview && (
+                  <div className="mt-8 w-full">
+                    <PreviewSummary preview={preview} />
+                  </div>
+                )}
               </div>
             ) : isComplete ? (
               <div className="space-y-6">
@@ -505,6 +673,14 @@ const GenerateReport = () => {
                   </p>
                 </div>
 
+                {partialNotes && (
+                  <Alert>
+                    <AlertDescription>
+                      This report is incomplete: {partialNotes}
+                    </AlertDescription>
+                  </Alert>
+                )}
+
                 <div className="rounded-lg bg-blue-50 p-4">
                   <div className="flex">
                     <div className="flex-shrink-0">
@@ -522,65 +698,7 @@ const GenerateReport = () => {
                   </div>
                 </div>
 
-                {/* Sample charts that would be included in the report */}
-                {reportConfig?.reportType === "utilization" && (
-                  <div className="grid grid-cols-1 md:grid-cols-2 gap-4">
-                    <div className="p-4 border rounded-lg bg-white shadow-sm">
-                      <h4 className="text-sm font-medium mb-2">CPU Utilization</h4>
-                      <Line 
-                        options={{
-                          responsive: true,
-                          plugins: {
-                            legend: {
-                              display: false,
-                            },
-                          },
-                          scales: {
-                            y: {
-                              beginAtZero: true,
-                              max: 100,
-                            }
-                          }
-                        }} 
-                        data={{
-                          labels: ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'],
-                          datasets: [
-                            {
-                              label: 'CPU %',
-                              data: [65, 59, 80, 81, 56, 55, 40],
-                              borderColor: 'rgb(59, 130, 246)',
-                              backgroundColor: 'rgba(59, 130, 246, 0.5)',
-                            }
-                          ],
-                        }}
-                      />
-                    </div>
-
-                    <div className="p-4 border rounded-lg bg-white shadow-sm">
-                      <h4 className="text-sm font-medium mb-2">Memory Usage</h4>
-                      <Bar
-                        options={{
-                          responsive: true,
-                          plugins: {
-                            legend: {
-                              display: false,
-                            },
-                          },
-                        }}
-                        data={{
-                          labels: ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'],
-                          datasets: [
-                            {
-                              label: 'Memory GB',
-                              data: [12, 19, 15, 17, 14, 13, 11],
-                              backgroundColor: 'rgba(99, 102, 241, 0.5)',
-                            }
-                          ],
-                        }}
-                      />
-                    </div>
-                  </div>
-                )}
+                {preview && <PreviewSummary preview={preview} />}
 
                 {reportConfig?.reportType === "billing" && (
                   <div className="grid grid-cols-1 gap-4">
@@ -635,7 +753,8 @@ const GenerateReport = () => {
             </Button>
             {isComplete && (
               <Button 
-                onClick={generatePDF}
+                onClick={reportConfig?.reportType === "billing" ? generatePDF : downloadReport}
+                disabled={isDownloading}
                 className="bg-gradient-to-r from-nubinix-blue to-nubinix-purple hover:from-nubinix-purple hover:to-nubinix-pink"
               >
                 Download PDF
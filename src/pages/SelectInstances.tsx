@@ -1,5 +1,5 @@
 
-import { useState } from "react";
+import { useEffect, useState } from "react";
 import { useNavigate } from "react-router-dom";
 import { Card, CardContent, CardDescription, CardFooter, CardHeader, CardTitle } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
@@ -11,29 +11,75 @@ import Layout from "@/components/Layout";
 import Stepper from "@/components/Stepper";
 import { useReport } from "@/context/ReportContext";
 import { Badge } from "@/components/ui/badge";
+import { Input } from "@/components/ui/input";
+import { queryInstances } from "@/utils/awsUtils";
+import { CloudCredentials, Instance, InventoryPage, RDSInstance } from "@/types";
 
 const fadeInVariants = {
   hidden: { opacity: 0, y: 10 },
   visible: { opacity: 1, y: 0, transition: { duration: 0.5 } }
 };
 
+const PAGE_SIZE = 50;
+
+type InventoryRow = Instance | RDSInstance;
+
+// One tab's rows, fetched a page at a time from the server-side index and
+// narrowed by a search on name or id
+const usePagedInventory = <T extends InventoryRow>(credentials: CloudCredentials | null, kind: "ec2" | "rds") => {
+  const [search, setSearch] = useState("");
+  const [page, setPage] = useState<InventoryPage<T> | null>(null);
+  const [isLoading, setIsLoading] = useState(false);
+  const [error, setError] = useState<string | null>(null);
+
+  const load = async (cursor: string | null, append: boolean, isCurrent: () => boolean = () => true) => {
+    if (!credentials) return;
+    setIsLoading(true);
+    setError(null);
+    try {
+      const next = await queryInstances<T>(credentials, { kind, q: search, limit: PAGE_SIZE, cursor });
+      if (!isCurrent()) return;
+      setPage((previous) => (append && previous ? { ...next, items: [...previous.items, ...next.items] } : next));
+    } catch (err) {
+      if (isCurrent()) setError(err instanceof Error ? err.message : "Failed to load instances");
+    } finally {
+      if (isCurrent()) setIsLoading(false);
+    }
+  };
+
+  useEffect(() => {
+    // Wait for typing to pause, and ignore answers to searches that were replaced
+    let current = true;
+    const timer = setTimeout(() => load(null, false, () => current), 250);
+    return () => {
+      current = false;
+      clearTimeout(timer);
+    };
+  }, [credentials, kind, search]);
+
+  const loadMore = () => {
+    if (page?.nextCursor) load(page.nextCursor, true);
+  };
+
+  return { search, setSearch, page, isLoading, error, loadMore };
+};
+
 const SelectInstances = () => {
   const navigate = useNavigate();
   const { 
     provider, 
     reportType,
-    instances, 
-    rdsInstances, 
-    toggleInstanceSelection, 
-    toggleRdsInstanceSelection,
-    selectAllInstances,
-    selectAllRdsInstances,
+    credentials,
+    setInstanceSelected,
+    setRdsInstanceSelected,
     selectedInstances,
     selectedRdsInstances
   } = useReport();
-  
-  const [selectAllEC2, setSelectAllEC2] = useState(false);
-  const [selectAllRDS, setSelectAllRDS] = useState(false);
+
+  const ec2 = usePagedInventory<Instance>(credentials, "ec2");
+  const rds = usePagedInventory<RDSInstance>(credentials, "rds");
+  const selectedEc2Ids = new Set(selectedInstances.map((instance) => instance.id));
+  const selectedRdsIds = new Set(selectedRdsInstances.map((instance) => instance.id));
 
   const steps = ["Cloud Provider", "Report Type", "Credentials", "Instances", "Generate"];
 
@@ -58,18 +104,35 @@ const SelectInstances = () => {
     }
   };
 
+  // "Select all" covers the rows loaded so far
+  const allEc2Selected = !!ec2.page?.items.length && ec2.page.items.every((instance) => selectedEc2Ids.has(instance.id));
+  const allRdsSelected = !!rds.page?.items.length && rds.page.items.every((instance) => selectedRdsIds.has(instance.id));
+
   const handleSelectAllEC2 = () => {
-    const newValue = !selectAllEC2;
-    setSelectAllEC2(newValue);
-    selectAllInstances(newValue);
+    ec2.page?.items.forEach((instance) => setInstanceSelected(instance, !allEc2Selected));
   };
 
   const handleSelectAllRDS = () => {
-    const newValue = !selectAllRDS;
-    setSelectAllRDS(newValue);
-    selectAllRdsInstances(newValue);
+    rds.page?.items.forEach((instance) => setRdsInstanceSelected(instance, !allRdsSelected));
   };
 
+  const pageFooter = (inventory: ReturnType<typeof usePagedInventory>) => (
+    <div className="flex items-center justify-between p-3 text-sm text-gray-500">
+      <span>
+        {inventory.error
+          ? inventory.error
+          : inventory.page
+            ? `Showing ${inventory.page.items.length} of ${inventory.page.total}`
+            : "Loading..."}
+      </span>
+      {inventory.page?.nextCursor && (
+        <Button variant="outline" size="sm" onClick={inventory.loadMore} disabled={inventory.isLoading}>
+          {inventory.isLoading ? "Loading..." : "Load more"}
+        </Button>
+      )}
+    </div>
+  );
+
   const getStateBadgeColor = (state: string) => {
     switch (state) {
       case "running":
@@ -88,7 +151,7 @@ const SelectInstances = () => {
     }
   };
 
-  if (instances.length === 0 && rdsInstances.length === 0) {
+  if (!credentials) {
     navigate("/credentials");
     return null;
   }
@@ -122,13 +185,19 @@ const SelectInstances = () => {
                 </TabsList>
                 
                 <TabsContent value="ec2">
+                  <Input
+                    className="mb-3"
+                    placeholder="Search by name or ID"
+                    value={ec2.search}
+                    onChange={(event) => ec2.setSearch(event.target.value)}
+                  />
                   <div className="rounded-md border">
                     <Table>
                       <TableHeader>
                         <TableRow>
                           <TableHead className="w-12">
                             <Checkbox 
-                              checked={selectAllEC2} 
+                              checked={allEc2Selected} 
                               onCheckedChange={handleSelectAllEC2}
                               aria-label="Select all instances"
                             />
@@ -141,12 +210,12 @@ const SelectInstances = () => {
                         </TableRow>
                       </TableHeader>
                       <TableBody>
-                        {instances.map((instance) => (
+                        {(ec2.page?.items || []).map((instance) => (
                           <TableRow key={instance.id}>
                             <TableCell>
                               <Checkbox 
-                                checked={instance.selected} 
-                                onCheckedChange={() => toggleInstanceSelection(instance.id)}
+                                checked={selectedEc2Ids.has(instance.id)} 
+                                onCheckedChange={(checked) => setInstanceSelected(instance, checked === true)}
                                 aria-label={`Select instance ${instance.id}`}
                               />
                             </TableCell>
@@ -163,17 +232,24 @@ const SelectInstances = () => {
                         ))}
                       </TableBody>
                     </Table>
+                    {pageFooter(ec2)}
                   </div>
                 </TabsContent>
                 
                 <TabsContent value="rds">
+                  <Input
+                    className="mb-3"
+                    placeholder="Search by name or ID"
+                    value={rds.search}
+                    onChange={(event) => rds.setSearch(event.target.value)}
+                  />
                   <div className="rounded-md border">
                     <Table>
                       <TableHeader>
                         <TableRow>
                           <TableHead className="w-12">
                             <Checkbox 
-                              checked={selectAllRDS} 
+                              checked={allRdsSelected} 
                               onCheckedChange={handleSelectAllRDS} 
                               aria-label="Select all RDS instances"
                             />
@@ -186,12 +262,12 @@ const SelectInstances = () => {
                         </TableRow>
                       </TableHeader>
                       <TableBody>
-                        {rdsInstances.map((instance) => (
+                        {(rds.page?.items || []).map((instance) => (
                           <TableRow key={instance.id}>
                             <TableCell>
                               <Checkbox 
-                                checked={instance.selected} 
-                                onCheckedChange={() => toggleRdsInstanceSelection(instance.id)}
+                                checked={selectedRdsIds.has(instance.id)} 
+                                onCheckedChange={(checked) => setRdsInstanceSelected(instance, checked === true)}
                                 aria-label={`Select RDS instance ${instance.id}`}
                               />
                             </TableCell>
@@ -208,6 +284,7 @@ const SelectInstances = () => {
                         ))}
                       </TableBody>
                     </Table>
+                    {pageFooter(rds)}
                   </div>
                 </TabsContent>
               </Tabs>
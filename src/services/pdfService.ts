@@ -1,45 +1,123 @@
-
 import axios from 'axios';
-import { ReportConfig } from '../types';
+import { ReportConfig, ReportJob, ReportPreview, ReportProgressEvent } from '../types';
+
+const API_BASE = '/api';
+
+// Resolves once the job's event stream reports it done; EventSource
+// reconnects on its own and resumes from the last event it received
+const waitForReport = (job: ReportJob, onProgress?: (event: ReportProgressEvent) => void, signal?: AbortSignal) =>
+  new Promise<void>((resolve, reject) => {
+    const source = new EventSource(`${API_BASE}${job.events}`);
+    // Leaving the page or retrying stops the build on the server too
+    signal?.addEventListener('abort', () => {
+      source.close();
+      axios.post(`${API_BASE}${job.cancel}`).catch(() => undefined);
+      reject(new Error('Report generation cancelled'));
+    });
+    source.onmessage = (message) => {
+      const event: ReportProgressEvent = JSON.parse(message.data);
+      onProgress?.(event);
+      if (event.event === 'done') {
+        source.close();
+        resolve();
+      } else if (event.event === 'failed') {
+        source.close();
+        reject(new Error(String(event.error)));
+      } else if (event.event === 'cancelled') {
+        source.close();
+        reject(new Error('Report generation cancelled'));
+      }
+    };
+    source.onerror = () => {
+      // CLOSED means the server refused the stream (e.g. the job expired)
+      if (source.readyState === EventSource.CLOSED) {
+        reject(new Error('Lost connection to report progress'));
+      }
+    };
+  });
+
+// Error with the API's detail message, for display
+export const reportError = (error: unknown) => {
+  console.error('Error generating PDF:', error);
+  if (axios.isAxiosError(error)) {
+    const errorMessage = error.response?.data?.detail || error.message;
+    console.error('API Error:', errorMessage);
+    return new Error(`Failed to generate PDF: ${errorMessage}`);
+  }
+  if (error instanceof Error) {
+    return new Error(`Failed to generate PDF: ${error.message}`);
+  }
+  return new Error('Failed to generate PDF report: Network error');
+};
 
 export const pdfService = {
-  generateReport: async (reportConfig: ReportConfig) => {
-    try {
-      const response = await axios.post('http://0.0.0.0:5000/generate-report', {
-        provider: reportConfig.provider,
-        credentials: reportConfig.credentials,
-        selected_instances: reportConfig.instances,
-        frequency: reportConfig.frequency || 'daily'
-      }, {
-        responseType: 'blob',
-        headers: {
-          'Content-Type': 'application/json',
-          'Accept': 'application/pdf'
-        },
-        timeout: 30000,
-        withCredentials: false
-      });
-
-      const filename = `${reportConfig.credentials.accountName}-${new Date().toISOString().split('T')[0]}.pdf`;
-      const blob = new Blob([response.data], { type: 'application/pdf' });
-      const url = window.URL.createObjectURL(blob);
-      const link = document.createElement('a');
-      link.href = url;
-      link.download = filename;
-      document.body.appendChild(link);
-      link.click();
-      document.body.removeChild(link);
-      window.URL.revokeObjectURL(url);
+  // Account, instance and database summary tables in seconds; optionally
+  // queues the full report too, to be followed with generateReport's flow
+  previewReport: async (reportConfig: ReportConfig, startFull = false, signal?: AbortSignal) => {
+    const { data } = await axios.post<ReportPreview>(`${API_BASE}/reports/preview`, {
+      provider: reportConfig.provider,
+      credentials: reportConfig.credentials,
+      selected_instances: reportConfig.instances,
+      selected_rds_instances: reportConfig.rdsInstances,
+      frequency: reportConfig.frequency || 'daily'
+    }, {
+      params: { summary_format: 'json', start_full: startFull },
+      headers: { 'Content-Type': 'application/json' },
+      withCredentials: false,
+      signal
+    });
+    return data;
+  },
+
+  // Queue the full report; follow it with waitForReport, then downloadReport
+  startReport: async (reportConfig: ReportConfig, signal?: AbortSignal) => {
+    const { data: job } = await axios.post<ReportJob>(`${API_BASE}/reports`, {
+      provider: reportConfig.provider,
+      credentials: reportConfig.credentials,
+      selected_instances: reportConfig.instances,
+      frequency: reportConfig.frequency || 'daily'
+    }, {
+      headers: { 'Content-Type': 'application/json' },
+      withCredentials: false,
+      signal
+    });
+    return job;
+  },
+
+  waitForReport,
 
+  // No timeout: the report is already built and only has to be transferred
+  downloadReport: async (reportConfig: ReportConfig, job: ReportJob) => {
+    const response = await axios.get(`${API_BASE}${job.download}`, {
+      responseType: 'blob',
+      headers: { 'Accept': 'application/pdf' },
+      withCredentials: false
+    });
+
+    const filename = `${reportConfig.credentials.accountName}-${new Date().toISOString().split('T')[0]}.pdf`;
+    const blob = new Blob([response.data], { type: 'application/pdf' });
+    const url = window.URL.createObjectURL(blob);
+    const link = document.createElement('a');
+    link.href = url;
+    link.download = filename;
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+    window.URL.revokeObjectURL(url);
+  },
+
+  generateReport: async (
+    reportConfig: ReportConfig,
+    onProgress?: (event: ReportProgressEvent) => void,
+    signal?: AbortSignal
+  ) => {
+    try {
+      const job = await pdfService.startReport(reportConfig, signal);
+      await waitForReport(job, onProgress, signal);
+      await pdfService.downloadReport(reportConfig, job);
       return true;
     } catch (error) {
-      console.error('Error generating PDF:', error);
-      if (axios.isAxiosError(error)) {
-        const errorMessage = error.response?.data?.detail || error.message;
-        console.error('API Error:', errorMessage);
-        throw new Error(`Failed to generate PDF: ${errorMessage}`);
-      }
-      throw new Error('Failed to generate PDF report: Network error');
+      throw reportError(error);
     }
   }
 };
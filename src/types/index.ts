@@ -2,6 +2,8 @@
 export interface CloudCredentials {
   accessKeyId: string;
   secretAccessKey: string;
+  // Names the report and its file; required by the report endpoints
+  accountName?: string;
 }
 
 export interface Instance {
@@ -10,6 +12,7 @@ export interface Instance {
   type: string;
   region: string;
   state: "running" | "stopped" | "terminated" | "pending";
+  tags?: Record<string, string>;
   selected: boolean;
 }
 
@@ -19,9 +22,31 @@ export interface RDSInstance {
   engine: string;
   region: string;
   state: "available" | "stopped" | "creating" | "deleting";
+  tags?: Record<string, string>;
   selected: boolean;
 }
 
+export interface InventoryQuery {
+  kind?: "ec2" | "rds";
+  region?: string[];
+  state?: string[];
+  type?: string[];
+  engine?: string[];
+  os?: string[];
+  tag?: string[];
+  q?: string;
+  sort?: string;
+  limit?: number;
+  cursor?: string | null;
+}
+
+export interface InventoryPage<T> {
+  items: T[];
+  total: number;
+  nextCursor: string | null;
+  inventoryEtag: string;
+}
+
 export type CloudProvider = "aws" | "azure";
 export type ReportFrequency = "daily" | "weekly" | "monthly";
 export type ReportType = "utilization" | "billing";
@@ -40,3 +65,56 @@ export interface ReportConfig {
   frequency: ReportFrequency;
   billingPeriod: BillingPeriod | null;
 }
+
+export type ReportJobState = "queued" | "running" | "done" | "failed" | "cancelled";
+
+export interface ReportJob {
+  jobId: string;
+  state: ReportJobState;
+  source: string | null;
+  error: string | null;
+  bytes: number | null;
+  // Cut short by its deadline; the PDF says so on every page
+  partial: boolean;
+  events: string;
+  download: string;
+  cancel: string;
+}
+
+export interface MetricSummary {
+  family: "cpu" | "memory" | "disk";
+  average: number;
+  maximum: number;
+}
+
+export interface FleetSummary {
+  average: number;
+  maximum: number;
+  hosts: number;
+}
+
+type PreviewResource = { id: string; name: string; state: string; region: string; metrics: Record<string, MetricSummary> };
+
+// Summary-first report: averages and peaks over the window, no time series
+export interface ReportPreview {
+  preview: true;
+  provider: string;
+  frequency: ReportFrequency;
+  date: string;
+  window: { start: string; end: string };
+  account: { name: string; id: string | null };
+  fleet: { ec2: Record<string, FleetSummary>; rds: Record<string, FleetSummary> };
+  instances: (PreviewResource & { type: string; os: string })[];
+  rdsInstances: (PreviewResource & { engine: string })[];
+  // The full report, when it was started alongside the preview
+  job: ReportJob | null;
+}
+
+// One server-sent event from a report build: hosts, metrics, charts, pages,
+// written, state, done, failed or cancelled, with counters such as done/total
+export interface ReportProgressEvent {
+  id: number;
+  event: string;
+  time: number;
+  [field: string]: unknown;
+}
@@ -1,4 +1,9 @@
-import { CloudCredentials, CloudProvider, Instance, RDSInstance } from "@/types";
+import { CloudCredentials, CloudProvider, Instance, InventoryPage, InventoryQuery, RDSInstance } from "@/types";
+
+type InventoryResponse = { ec2Instances?: Instance[]; rdsInstances?: RDSInstance[] };
+
+// Last inventory per access key, revalidated with If-None-Match
+const inventoryCache = new Map<string, { etag: string; data: InventoryResponse }>();
 
 export const fetchRealInstances = async (
   provider: CloudProvider,
@@ -15,17 +20,29 @@ export const fetchRealInstances = async (
       throw new Error('Invalid credentials');
     }
 
+    const cacheKey = credentials.accessKeyId;
+    const cached = inventoryCache.get(cacheKey);
     const instancesResponse = await fetch('/api/instances', {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
+      headers: {
+        'Content-Type': 'application/json',
+        ...(cached ? { 'If-None-Match': cached.etag } : {})
+      },
       body: JSON.stringify(credentials)
     });
 
-    if (!instancesResponse.ok) {
+    let data: InventoryResponse;
+    if (instancesResponse.status === 304 && cached) {
+      data = cached.data;
+    } else if (instancesResponse.ok) {
+      data = await instancesResponse.json();
+      const etag = instancesResponse.headers.get('ETag');
+      if (etag) {
+        inventoryCache.set(cacheKey, { etag, data });
+      }
+    } else {
       throw new Error('Failed to fetch instances');
     }
-
-    const data = await instancesResponse.json();
     return {
       instances: data.ec2Instances || [],
       rdsInstances: data.rdsInstances || []
@@ -34,4 +51,21 @@ export const fetchRealInstances = async (
     console.error('Error fetching instances:', error);
     throw error;
   }
-};
\ No newline at end of file
+};
+
+// One page of the server-side inventory index; pass nextCursor back for the next page
+export const queryInstances = async <T extends Instance | RDSInstance>(
+  credentials: CloudCredentials,
+  query: InventoryQuery
+): Promise<InventoryPage<T>> => {
+  const response = await fetch('/api/instances/query', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ credentials, ...query })
+  });
+
+  if (!response.ok) {
+    throw new Error('Failed to query instances');
+  }
+  return response.json();
+};